@@ -1,12 +1,28 @@
+import json
 import uvicorn
 import asyncio
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
 from config import Config
 
 from rag_system_v2 import RAGSystem
-from models.chat import ChatRequest, ChatResponse
-from models.upload import UploadResponse
+from components.admission import Overloaded
+from providers.ingestion_queue import IngestionQueue
+from providers.upload_spool import UploadSpool
+from providers.index_watcher import IndexWatcher
+from models.chat import ChatRequest, ChatResponse, SessionInfo
+from models.upload import UploadResponse, IngestionJobStatus
+from models.admission import AdmissionStatus
+from models.caches import CacheStatus
+from models.batch import (
+    BatchChatRequest,
+    BatchChatResult,
+    BatchRetrieveRequest,
+    BatchRetrieveResult,
+    RetrievedChunk,
+)
 
 app_state = {}
 from contextlib import asynccontextmanager
@@ -24,17 +40,39 @@ async def lifespan(app: FastAPI):
         config = Config()
         # Store the initialized RAG system in the app_state
         app_state["rag_system"] = RAGSystem(config)
+        if config.API_WORKERS > 1:
+            # Uploads are spooled to disk and ingested by the one worker holding
+            # the writer lock; every worker follows the published index generation
+            app_state["ingestion_queue"] = UploadSpool(config)
+            app_state["index_watcher"] = IndexWatcher(config, app_state["rag_system"], app_state["ingestion_queue"])
+            app_state["index_watcher"].start()
+        else:
+            # Uploads are ingested in micro-batches by a background worker
+            app_state["ingestion_queue"] = IngestionQueue(config, app_state["rag_system"])
+            app_state["ingestion_queue"].start()
         print("RAG System initialized and ready.")
     except Exception as e:
         print(f"Failed to initialize RAGSystem: {e}")
         app_state["rag_system"] = None
+        app_state["ingestion_queue"] = None
+        app_state["index_watcher"] = None
     
     yield  # API is now running
     
-    # Can add shutdown logic (if any)
     print("===================================")
     print(" API Server shutting down...")
     print("===================================")
+    index_watcher = app_state.get("index_watcher")
+    if index_watcher is not None:
+        # Also drains this worker's ingestion queue if it is the writer
+        await index_watcher.stop()
+    elif app_state.get("ingestion_queue") is not None:
+        await app_state["ingestion_queue"].stop()
+    if app_state.get("rag_system") is not None:
+        # Persist any index changes still waiting in the write-behind queue
+        app_state["rag_system"].close()
+    if index_watcher is not None:
+        index_watcher.release()
     app_state["rag_system"] = None
 
 
@@ -50,12 +88,42 @@ def get_rag_system() -> RAGSystem:
         )
     return rag_system
 
+def get_ingestion_queue() -> IngestionQueue | UploadSpool:
+    """
+    Helper function to get the ingestion queue from app_state
+    (the upload spool in multi-worker mode; both accept and track uploads).
+    """
+    ingestion_queue = app_state.get("ingestion_queue")
+    if ingestion_queue is None:
+        raise HTTPException(
+            status_code=503, 
+            detail="Ingestion queue is not initialized. Check server logs."
+        )
+    return ingestion_queue
+
+async def admit():
+    """
+    Waits for a request slot (admission control). Saturation is answered
+    at once with 429 (queue full) or 503 (deadline), with Retry-After.
+    Release the returned slot when the response is complete.
+    """
+    try:
+        return await get_rag_system().admission.admit()
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
 # --- API Endpoints ---
 
-@app.post("/upload", response_model=UploadResponse)
+@app.post("/upload", response_model=UploadResponse, status_code=202)
 async def upload_document(file: UploadFile = File(...)):
     """
     Endpoint to upload a single text file for ingestion.
+    The file is queued and ingested in the background; poll
+    /upload/{job_id} for its status.
     """
     if file.content_type != "text/plain":
         raise HTTPException(
@@ -63,43 +131,99 @@ async def upload_document(file: UploadFile = File(...)):
             detail="Unsupported file type. Please upload a .txt file."
         )
     
+    ingestion_queue = get_ingestion_queue()
+
     try:
         # Read file content as bytes and decode
         content_bytes = await file.read()
         content = content_bytes.decode("utf-8")
-        
-        # Get the RAG system
-        rag_system = get_rag_system()
-        safe_filename = file.filename or "uploaded.txt"
-        
-        # Ingest the content
-        await rag_system.add_document_from_text(
-            text_content=content, 
-            source_name=safe_filename
-        )
-        
-        return UploadResponse(
-            message="File ingested successfully", 
-            filename=safe_filename
-        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing file: {e}")
+        raise HTTPException(status_code=400, detail=f"Error reading file: {e}")
+
+    safe_filename = file.filename or "uploaded.txt"
+
+    try:
+        # Queue the content; ingestion happens in the background worker
+        job = ingestion_queue.submit(text_content=content, source_name=safe_filename)
+    except asyncio.QueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many uploads pending. Please retry later."
+        )
+
+    return UploadResponse(
+        message="File queued for ingestion", 
+        filename=safe_filename,
+        job_id=job.job_id,
+        status=job.status,
+    )
+
+@app.get("/upload/{job_id}", response_model=IngestionJobStatus)
+async def get_upload_status(job_id: str):
+    """
+    Endpoint to check the status of a queued upload.
+    """
+    job = get_ingestion_queue().get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job id: {job_id}")
+    return IngestionJobStatus(**job.to_dict())
+
+def session_info(session) -> SessionInfo:
+    return SessionInfo(session_id=session.session_id, history=session.turns, summary=session.summary)
+
+def check_session(session_id):
+    """Rejects requests naming an unknown or expired session."""
+    if session_id is not None and get_rag_system().sessions.get(session_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {session_id}")
+
+@app.post("/sessions", response_model=SessionInfo, status_code=201)
+async def create_session():
+    """
+    Endpoint to start a server-side chat session.
+    Pass the returned session_id with /chat requests instead of the history.
+    """
+    return session_info(get_rag_system().create_session())
+
+@app.get("/sessions/{session_id}", response_model=SessionInfo)
+async def get_session(session_id: str):
+    """
+    Endpoint to inspect a session's history window and summary.
+    """
+    session = get_rag_system().sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {session_id}")
+    return session_info(session)
+
+@app.delete("/sessions/{session_id}", status_code=204)
+async def delete_session(session_id: str):
+    """
+    Endpoint to end a session.
+    """
+    if not get_rag_system().sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {session_id}")
 
 @app.post("/chat", response_model=ChatResponse)
 async def chat_with_rag(request: ChatRequest):
     """
     Endpoint to ask a question.
-    It takes a query and the previous chat history.
-    It returns the answer and the updated chat history.
+    It takes a query and either a session id or the previous chat history.
+    Without a session it returns the answer and the updated chat history;
+    with one, the history stays on the server and only the answer is returned.
     """
+    check_session(request.session_id)
+    slot = await admit()
     try:
         rag_system = get_rag_system()
         
         # Get the answer from the RAG system
         answer = await rag_system.answer_question(
             query_text=request.query, 
-            chat_history=request.history
+            chat_history=request.history,
+            session_id=request.session_id,
         )
+
+        if request.session_id is not None:
+            return ChatResponse(answer=answer, session_id=request.session_id)
         
         # Update the history
         updated_history = request.history + [(request.query, answer)]
@@ -108,10 +232,178 @@ async def chat_with_rag(request: ChatRequest):
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing chat: {e}")
+    finally:
+        slot.release()
+
+def to_chunks(docs) -> list:
+    """Converts retrieved Documents to their API representation."""
+    return [
+        RetrievedChunk(
+            source=doc.metadata.get("source", "Unknown"),
+            content=doc.page_content,
+            metadata=doc.metadata,
+        )
+        for doc in docs
+    ]
+
+def sse_event(event: str, data: dict) -> str:
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Endpoint to ask a question and receive the answer as Server-Sent Events:
+
+      event: sources  {"chunks": [RetrievedChunk, ...]}  sent before generation starts
+      event: token    {"text": "..."}                     one per generated piece
+      event: done     {"answer", "history", "session_id", "cached", "context_tokens",
+                       "context_tokens_saved", "time_to_first_token", "total_time"}
+      event: error    {"detail": "..."}                   instead of "done" on failure
+
+    Times are in seconds. As with /chat, "history" is only echoed for
+    requests without a session.
+    """
+    check_session(request.session_id)
+    rag_system = get_rag_system()
+    slot = await admit()
+
+    async def stream_events():
+        try:
+            async for event in rag_system.stream_answer(request.query, request.history, request.session_id):
+                if event["event"] == "sources":
+                    chunks = [chunk.model_dump() for chunk in to_chunks(event["documents"])]
+                    yield sse_event("sources", {"chunks": chunks})
+                elif event["event"] == "token":
+                    yield sse_event("token", {"text": event["text"]})
+                elif event["event"] == "done":
+                    yield sse_event("done", {
+                        "answer": event["answer"],
+                        "history": [] if request.session_id else request.history + [(request.query, event["answer"])],
+                        "session_id": request.session_id,
+                        "cached": event["cached"],
+                        "context_tokens": event["context_tokens"],
+                        "context_tokens_saved": event["context_tokens_saved"],
+                        "time_to_first_token": event["time_to_first_token"],
+                        "total_time": event["total_time"],
+                    })
+                else:
+                    yield sse_event("error", {"detail": event["message"]})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Error processing chat: {e}"})
+        finally:
+            slot.release()
+
+    return StreamingResponse(
+        stream_events(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also frees the slot if the client left before the stream started
+        background=BackgroundTask(slot.release),
+    )
+
+
+
+def check_batch_size(size: int):
+    """Rejects empty batches and batches above Config.BATCH_MAX_QUERIES."""
+    if size == 0:
+        raise HTTPException(status_code=400, detail="The batch is empty.")
+    if size > Config.BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large ({size}); the limit is {Config.BATCH_MAX_QUERIES}."
+        )
+
+@app.post("/retrieve/batch")
+async def retrieve_batch(request: BatchRetrieveRequest):
+    """
+    Endpoint to retrieve chunks for many queries at once.
+    Streams one NDJSON line (BatchRetrieveResult) per query, in request order.
+    """
+    check_batch_size(len(request.queries))
+    rag_system = get_rag_system()
+    slot = await admit()
+
+    async def stream_results():
+        try:
+            results = await rag_system.retrieve_batch(request.queries)
+        except Exception as e:
+            yield json.dumps({"error": f"Error processing batch: {e}"}) + "\n"
+            return
+        finally:
+            slot.release()
+
+        for index, (query, docs) in enumerate(zip(request.queries, results)):
+            result = BatchRetrieveResult(
+                index=index,
+                query=query,
+                chunks=to_chunks(docs),
+            )
+            yield result.model_dump_json() + "\n"
+
+    return StreamingResponse(
+        stream_results(), media_type="application/x-ndjson", background=BackgroundTask(slot.release)
+    )
+
+@app.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest):
+    """
+    Endpoint to ask many questions at once.
+    Streams one NDJSON line (BatchChatResult) per request as soon as its
+    answer is ready, so lines arrive in completion order; use "index".
+    """
+    check_batch_size(len(request.requests))
+    if any(item.session_id is not None for item in request.requests):
+        raise HTTPException(
+            status_code=422,
+            detail="Sessions are not supported in /chat/batch; pass each request's history instead."
+        )
+    rag_system = get_rag_system()
+    requests = [(item.query, item.history) for item in request.requests]
+    slot = await admit()
+
+    async def stream_results():
+        try:
+            async for result in rag_system.answer_batch(requests):
+                history = request.requests[result["index"]].history
+                if "answer" in result:
+                    history = history + [(result["query"], result["answer"])]
+                yield BatchChatResult(history=history, **result).model_dump_json() + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"Error processing batch: {e}"}) + "\n"
+        finally:
+            slot.release()
+
+    return StreamingResponse(
+        stream_results(), media_type="application/x-ndjson", background=BackgroundTask(slot.release)
+    )
+
+@app.get("/admission", response_model=AdmissionStatus)
+async def get_admission_status():
+    """
+    Endpoint to check the load of this worker: requests waiting for a
+    slot ("queue_depth"), and per limiter (requests, and the embedding,
+    retrieval and LLM stages) the slots in use, waiters and shed requests.
+    """
+    return AdmissionStatus(**get_rag_system().admission.stats())
+
+@app.get("/caches", response_model=CacheStatus)
+async def get_cache_status():
+    """
+    Endpoint to check the query embedding and retrieval caches of this
+    worker: entries, bytes, hits, misses, evictions and hit rate
+    (null for a disabled cache).
+    """
+    return CacheStatus(**get_rag_system().cache_stats())
 
 
 if __name__ == "__main__":
     # Note: You'll need 'config.py' to be correct for this to run
     # For development, run with: uvicorn api:app --reload
     print("Starting server... Run with 'uvicorn api:app --reload'")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if Config.API_WORKERS > 1:
+        # Worker processes import the app by name
+        uvicorn.run("api:app", host="0.0.0.0", port=8000, workers=Config.API_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -9,16 +9,26 @@ def print_help():
     print("\n--- RAG Pipeline (Class-Based) ---")
     print("Usage: python main.py [command] [options]")
     print("\nCommands:")
-    print("  --ingest              Run the document ingestion pipeline.")
+    print("  --ingest [--full]     Run the document ingestion pipeline.")
     print(
-        "                        (Loads docs from './data' and creates 'faiss_index')"
+        "                        (Loads new/changed docs from './data' into 'faiss_index';"
     )
+    print("                        --full rebuilds the index from scratch)")
+    print("\n  --index-report        Compare recall@k / latency of IVF and HNSW settings")
+    print("                        against exact search on the current index.")
+    print("\n  --embedding-report [BACKEND] [--threads N]")
+    print("                        Compare an embedding backend (torch-int8, onnx) with fp32:")
+    print("                        cosine agreement, neighbour overlap and throughput.")
     print('\n  --retrieve "text"     Retrieve relevant chunks from the vector store.')
     print('                        (e.g., python main.py --retrieve "What is RAG?")')
     print(
         '\n  --ask "text"          Ask a question to the full RAG pipeline (Retrieve + Generate).'
     )
     print('                        (e.g., python main.py --ask "What is RAG?")')
+    print("\n  --batch FILE [--retrieve-only] [--out OUT]")
+    print('                        Run a JSONL file of {"query": ..., "history": [...]} requests')
+    print("                        with batched retrieval; writes NDJSON results to OUT")
+    print("                        (default: FILE with a .results.jsonl suffix).")
     print("\nExample:")
     print("  1. Ingest documents: python main.py --ingest")
     print(
@@ -54,7 +64,17 @@ async def main_async():
 
     try:
         if command == "--ingest":
-            await rag_system.run_ingestion()
+            full_rebuild = "--full" in sys.argv[2:]
+            await rag_system.run_ingestion(full_rebuild=full_rebuild)
+
+        elif command == "--index-report":
+            await rag_system.run_index_report()
+
+        elif command == "--embedding-report":
+            args = sys.argv[2:]
+            backend = args[0] if args and not args[0].startswith("--") else None
+            num_threads = int(args[args.index("--threads") + 1]) if "--threads" in args[:-1] else None
+            await rag_system.run_embedding_report(backend, num_threads)
 
         elif command == "--retrieve":
             if len(sys.argv) > 2:
@@ -74,6 +94,18 @@ async def main_async():
                 print("Error: --ask command requires text.")
                 print('Example: python main.py --ask "What is RAG?"')
 
+        elif command == "--batch":
+            args = sys.argv[2:]
+            if args and not args[0].startswith("--"):
+                input_path = args[0]
+                output_path = args[args.index("--out") + 1] if "--out" in args[:-1] else (
+                    f"{input_path.rsplit('.', 1)[0]}.results.jsonl"
+                )
+                await rag_system.run_batch(input_path, output_path, retrieve_only="--retrieve-only" in args)
+            else:
+                print("Error: --batch command requires a JSONL file.")
+                print("Example: python main.py --batch questions.jsonl")
+
         else:
             print(f"Error: Unknown command '{command}'")
             print_help()
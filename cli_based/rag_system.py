@@ -1,14 +1,22 @@
 import time
+import json
 import asyncio
+import functools
+
+import numpy as np
 
 from config import Config
 
-from components.embedding_model import get_embedding_model
+from components.embedding_model import embedding_agreement_report, embedding_cache_key, get_embedding_model
+from components.embedding_cache import CachedEmbeddings
 
+from components.faiss_index_factory import get_index_vectors, recall_report
+from components.vector_store_io import fetch_documents
 from providers.ingestor import Ingestor
 from providers.llm_provider import LLMProvider
 from providers.retriever_provider import RetrieverProvider
 from providers.chain_provider import ChainProvider
+from providers.batch_runner import BatchRunner, retrieve_batch
 
 class RAGSystem:
     """
@@ -20,7 +28,21 @@ class RAGSystem:
         
         print("Initializing RAG System...")
         # 1. Load embeddings
-        self.embeddings = get_embedding_model(self.config.EMBEDDING_MODEL_NAME)
+        self.embeddings = get_embedding_model(
+            self.config.EMBEDDING_MODEL_NAME,
+            normalize=self.config.EMBEDDING_NORMALIZE,
+            backend=self.config.EMBEDDING_BACKEND,
+            num_threads=self.config.EMBEDDING_NUM_THREADS,
+            onnx_file=self.config.EMBEDDING_ONNX_FILE,
+        )
+        if self.config.EMBEDDING_CACHE_ENABLED:
+            self.embeddings = CachedEmbeddings(
+                self.embeddings,
+                # Normalized and raw vectors (or those of another backend) must not share cache entries
+                model_name=embedding_cache_key(self.config),
+                cache_path=self.config.EMBEDDING_CACHE_PATH,
+                max_entries=self.config.EMBEDDING_CACHE_MAX_ENTRIES,
+            )
         
         # 2. Initialize the Ingestor
         self.ingestor = Ingestor(self.config, self.embeddings)
@@ -36,13 +58,62 @@ class RAGSystem:
         self._rag_chain = None
         print("RAG System initialized.")
 
-    async def run_ingestion(self):
+    async def run_ingestion(self, full_rebuild: bool = False):
         """
         Runs the ingestion pipeline using the Ingestor component.
+        Only changed files are re-ingested unless `full_rebuild` is set.
         """
         loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, self.ingestor.run)
+        await loop.run_in_executor(None, self.ingestor.run, full_rebuild)
         print("Ingestion complete. Vector store should now be ready.")
+        if isinstance(self.embeddings, CachedEmbeddings):
+            print(self.embeddings.report())
+            self.embeddings.flush()
+
+    async def run_index_report(self):
+        """
+        Compares recall@k and latency of IVF / HNSW settings against exact
+        search over the vectors in the current index.
+        """
+        retriever_provider = RetrieverProvider(self.config, self.embeddings)
+        vector_store = retriever_provider.get_vector_store()
+        vectors = get_index_vectors(vector_store.index)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, recall_report, vectors, self.config)
+
+    async def run_embedding_report(self, backend: str = None, num_threads: int = None, sample_size: int = 500):
+        """
+        Compares an embedding backend (default: EMBEDDING_BACKEND) with the
+        fp32 torch model on chunks sampled from the current index: cosine
+        agreement, nearest-neighbour overlap and throughput, both at the
+        same thread count.
+        """
+        retriever_provider = RetrieverProvider(self.config, self.embeddings)
+        vector_store = retriever_provider.get_vector_store()
+        id_map = vector_store.index_to_docstore_id
+        rng = np.random.default_rng(0)
+        rows = rng.choice(len(id_map), min(sample_size, len(id_map)), replace=False)
+        texts = [doc.page_content for doc in fetch_documents(vector_store, [id_map[int(row)] for row in rows])]
+
+        backend = backend or self.config.EMBEDDING_BACKEND
+        num_threads = self.config.EMBEDDING_NUM_THREADS if num_threads is None else num_threads
+        if not num_threads:
+            import torch
+            # Pin the library default, so both models run with the same count
+            num_threads = torch.get_num_threads()
+        reference = get_embedding_model(self.config.EMBEDDING_MODEL_NAME, normalize=self.config.EMBEDDING_NORMALIZE)
+        candidate = get_embedding_model(
+            self.config.EMBEDDING_MODEL_NAME,
+            normalize=self.config.EMBEDDING_NORMALIZE,
+            backend=backend,
+            num_threads=num_threads,
+            onnx_file=self.config.EMBEDDING_ONNX_FILE,
+        )
+        print(f"\nBackend '{backend}' vs fp32 torch ({num_threads} threads each):")
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(
+            None, functools.partial(embedding_agreement_report, reference, candidate, texts, num_threads=num_threads)
+        )
 
     def _get_retriever(self):
         """Lazy-loads the retriever on first access."""
@@ -109,4 +180,39 @@ class RAGSystem:
             print(f"Query completed in {end_time - start_time:.2f}s")
             
         except Exception as e:
-            print(f"\n[RAGSystem] An error occurred during the RAG pipeline: {e}")
\ No newline at end of file
+            print(f"\n[RAGSystem] An error occurred during the RAG pipeline: {e}")
+
+    async def run_batch(self, input_path: str, output_path: str, retrieve_only: bool = False):
+        """
+        Runs every request in a JSONL file through batched retrieval (and,
+        unless `retrieve_only`, answer generation), writing one NDJSON result
+        per request to `output_path` as it completes.
+
+        Each input line is an object with a "query" and optionally a
+        "history" ([[human, ai], ...]) and an "id" (or "request_id") that is
+        copied to its result; the line number is used otherwise.
+        """
+        with open(input_path, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        print(f"\n--- Batch of {len(records)} requests from {input_path} ---")
+        start_time = time.perf_counter()
+
+        ids = [record.get("id", record.get("request_id", line_number)) for line_number, record in enumerate(records, 1)]
+        queries = [record["query"] for record in records]
+
+        with open(output_path, "w", encoding="utf-8") as out:
+            if retrieve_only:
+                results = await retrieve_batch(self._get_retriever(), queries)
+                for request_id, query, docs in zip(ids, queries, results):
+                    chunks = [{"source": doc.metadata.get("source", "Unknown"), "content": doc.page_content} for doc in docs]
+                    out.write(json.dumps({"id": request_id, "query": query, "chunks": chunks}, ensure_ascii=False) + "\n")
+            else:
+                runner = BatchRunner(self.config, self._get_retriever(), self.llm_provider.get_llm(), self.chain_provider)
+                requests = [(record["query"], [tuple(turn) for turn in record.get("history", [])]) for record in records]
+                async for result in runner.chat(requests):
+                    result = {"id": ids[result.pop("index")], **result}
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    out.flush()
+
+        end_time = time.perf_counter()
+        print(f"Batch completed in {end_time - start_time:.2f}s; results written to {output_path}")
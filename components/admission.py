@@ -0,0 +1,206 @@
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from config import Config
+
+
+class Overloaded(Exception):
+    """
+    A limiter is saturated. `status_code` is 429 when its wait queue is
+    full and 503 when a request could not be admitted before its deadline;
+    `retry_after` is the estimated time (seconds) until it has room again.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Slot:
+    """
+    A held place in a ConcurrencyLimiter. `release()` may be called more
+    than once (e.g. from a stream's cleanup and from a background task).
+    """
+
+    def __init__(self, limiter: "ConcurrencyLimiter"):
+        self._limiter = limiter
+        self._acquired_at = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._limiter._release(time.monotonic() - self._acquired_at)
+
+
+class ConcurrencyLimiter:
+    """
+    Lets at most `limit` holders in at once (0 = no limit); the others wait
+    in FIFO order.
+
+    With `max_waiting`, a caller finding that many already waiting is
+    rejected at once (429). With `timeout`, a caller is rejected (503) if
+    it is not let in within that many seconds, or straight away if the
+    expected wait (moving average of the hold time x its position in the
+    queue / limit) already exceeds it. Not thread-safe: use it from the
+    event loop.
+    """
+
+    def __init__(self, name: str, limit: int, max_waiting: Optional[int] = None, timeout: Optional[float] = None):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+
+        self.active = 0
+        self._waiters: deque = deque()
+        # Moving average of how long a slot is held, in seconds
+        self._hold_seconds = 0.0
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has likely drained (at least 1)."""
+        if not self.limit or self._hold_seconds <= 0:
+            return 1
+        return max(1, math.ceil(self._hold_seconds * (self.waiting + 1) / self.limit))
+
+    def _overloaded(self, reason: str, status_code: int) -> Overloaded:
+        return Overloaded(
+            f"Server busy ({self.name}: {reason}). Please retry later.", status_code, self.retry_after()
+        )
+
+    async def acquire(self) -> Slot:
+        """
+        Waits for a slot. Raises Overloaded if the request is shed.
+        """
+        if not self.limit or (self.active < self.limit and not self._waiters):
+            self.active += 1
+            self.admitted += 1
+            return Slot(self)
+
+        if self.max_waiting is not None and len(self._waiters) >= self.max_waiting:
+            self.rejected += 1
+            raise self._overloaded(f"{len(self._waiters)} requests waiting", 429)
+
+        if self.timeout is not None and self._hold_seconds > 0:
+            expected_wait = self._hold_seconds * (len(self._waiters) + 1) / self.limit
+            if expected_wait > self.timeout:
+                self.timed_out += 1
+                raise self._overloaded(f"expected wait {expected_wait:.1f}s", 503)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended; pass it on
+                self._release(None)
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.timed_out += 1
+            raise self._overloaded(f"no slot within {self.timeout:.1f}s", 503)
+
+        # The releasing holder handed its slot over; `active` is unchanged
+        self.admitted += 1
+        return Slot(self)
+
+    def _release(self, held_seconds: Optional[float]):
+        if held_seconds is not None:
+            self._hold_seconds = held_seconds if self._hold_seconds == 0 else 0.9 * self._hold_seconds + 0.1 * held_seconds
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active = max(0, self.active - 1)
+
+    @asynccontextmanager
+    async def slot(self):
+        held = await self.acquire()
+        try:
+            yield held
+        finally:
+            held.release()
+
+    def stats(self) -> Dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_hold_seconds": self._hold_seconds,
+        }
+
+
+class AdmissionController:
+    """
+    Admission control and backpressure for the query endpoints.
+
+    A request is admitted by `admit()` before any work starts: at most
+    ADMISSION_MAX_IN_FLIGHT requests run at once, up to ADMISSION_MAX_QUEUE
+    more wait, for at most ADMISSION_QUEUE_TIMEOUT_SECONDS. Beyond that the
+    request is shed at once (Overloaded: 429 for a full queue, 503 for a
+    missed deadline) instead of slowing every other request down.
+
+    Inside the pipeline, `stage(name)` caps the concurrent embedding,
+    retrieval and LLM calls (EMBEDDING_CONCURRENCY, RETRIEVAL_CONCURRENCY,
+    LLM_CONCURRENCY), so admitted requests queue in front of the scarce
+    resource (the local LLM) rather than overloading it.
+    """
+
+    STAGES = ("embedding", "retrieval", "llm")
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.requests = ConcurrencyLimiter(
+            "requests",
+            self.config.ADMISSION_MAX_IN_FLIGHT,
+            max_waiting=self.config.ADMISSION_MAX_QUEUE,
+            timeout=self.config.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        )
+        self.stages = {
+            "embedding": ConcurrencyLimiter("embedding", self.config.EMBEDDING_CONCURRENCY),
+            "retrieval": ConcurrencyLimiter("retrieval", self.config.RETRIEVAL_CONCURRENCY),
+            "llm": ConcurrencyLimiter("llm", self.config.LLM_CONCURRENCY),
+        }
+
+    async def admit(self) -> Slot:
+        """
+        Waits for a request slot; release it when the response is complete.
+        Raises Overloaded if the request is shed.
+        """
+        return await self.requests.acquire()
+
+    def stage(self, name: str):
+        """Async context manager holding a slot of a pipeline stage."""
+        return self.stages[name].slot()
+
+    @property
+    def queue_depth(self) -> int:
+        return self.requests.waiting
+
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "requests": self.requests.stats(),
+            "stages": {name: limiter.stats() for name, limiter in self.stages.items()},
+        }
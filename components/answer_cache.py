@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Caches generated answers by question embedding.
+
+    A small exact inner-product FAISS index over L2-normalized question
+    embeddings is searched for the nearest prior question; its answer is
+    reused when the cosine similarity is at least `threshold`. The cache is
+    emptied whenever the index generation changes, since answers computed
+    from an older index may be stale. Oldest entries are evicted first.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._index = None
+        self._entries: "OrderedDict[int, Tuple[str, str]]" = OrderedDict()  # id -> (question, answer)
+        self._next_id = 0
+        self._generation = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _sync_generation(self, generation: int) -> bool:
+        """
+        Moves the cache to `generation` (emptying it) if that is newer.
+        Returns False for an older generation, which must not touch the cache.
+        """
+        if self._generation is not None and generation < self._generation:
+            return False
+        if generation != self._generation:
+            self._index = None
+            self._entries.clear()
+            self._generation = generation
+        return True
+
+    def lookup(self, vector: List[float], generation: int) -> Optional[Tuple[str, str, float]]:
+        """
+        Returns (cached question, answer, similarity) for the closest prior
+        question above the threshold, or None.
+        """
+        query = self._normalize(vector)
+        with self._lock:
+            if not self._sync_generation(generation) or self._index is None or self._index.ntotal == 0:
+                self.misses += 1
+                return None
+
+            scores, ids = self._index.search(query, 1)
+            score, entry_id = float(scores[0][0]), int(ids[0][0])
+            if entry_id < 0 or score < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            question, answer = self._entries[entry_id]
+            return question, answer, score
+
+    def store(self, vector: List[float], question: str, answer: str, generation: int):
+        """
+        Adds a question/answer pair computed against `generation`. An answer
+        that finished after a newer generation was seen is dropped.
+        """
+        embedding = self._normalize(vector)
+        with self._lock:
+            if not self._sync_generation(generation):
+                return
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(embedding.shape[1]))
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(embedding, np.array([entry_id], dtype=np.int64))
+            self._entries[entry_id] = (question, answer)
+
+            if len(self._entries) > self.max_entries:
+                oldest_id, _ = self._entries.popitem(last=False)
+                self._index.remove_ids(np.array([oldest_id], dtype=np.int64))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
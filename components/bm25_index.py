@@ -0,0 +1,514 @@
+import copy
+import math
+import os
+import json
+import re
+import shutil
+import itertools
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from langchain_community.docstore.document import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from components.rw_lock import ReadWriteLock
+from components.vector_store_io import fetch_documents
+
+
+# Files of a saved index directory
+_META_FILE = "meta.json"
+_DELTA_FILE = "delta.jsonl"
+_ARRAY_FILES = ("terms", "ids", "sorted_ids", "sorted_cols", "doc_len", "indptr", "indices", "tf", "weights", "idf")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cases and splits text into word tokens for BM25 scoring.
+
+    Args:
+      text (str): The text to tokenize.
+
+    Returns:
+      List[str]: The list of tokens.
+    """
+    return re.findall(r"\w+", text.lower())
+
+
+class IncrementalBM25Index:
+    """
+    Okapi BM25 index over a SciPy CSR term-document matrix.
+
+    The main segment stores, per (term, chunk), the raw term frequency and
+    the precomputed weight tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)),
+    plus a precomputed IDF per term. Queries are scored with one sparse
+    product of their IDF vectors and the weight matrix (several queries at
+    once with `search_batch`), and the top-k are picked with `np.argpartition`.
+
+    Updates do not rebuild the matrix: added chunks go to a small delta
+    segment scored from its postings, and removed chunks are masked out.
+    As in Lucene, removed chunks still count in the term statistics until
+    the next compaction folds the delta into a new main segment.
+
+    Only term statistics and chunk ids are held; chunk text stays in the
+    docstore. Persistence is a directory of .npy arrays (memory-mappable)
+    plus an append-only JSONL delta log. Uploads only append to the log;
+    the log is folded back into the arrays once it grows past
+    `compact_threshold` records.
+
+    Searches may run while the index is updated: they hold a shared lock,
+    and every update takes it exclusively. Updates themselves must not run
+    concurrently (the RetrieverProvider serializes them).
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, compact_threshold: int = 50):
+        self.k1 = k1
+        self.b = b
+        self.compact_threshold = compact_threshold
+        self.delta_records = 0
+        self._rw = ReadWriteLock()
+
+        self._set_main(
+            terms=np.zeros(0, dtype="U1"),
+            ids=np.zeros(0, dtype="S1"),
+            doc_len=np.zeros(0, dtype=np.float32),
+            tf=csr_matrix((0, 0), dtype=np.float32),
+        )
+
+        # Delta segment: chunk id -> term freqs / length, and term -> {chunk id: tf}
+        self.delta_tf: Dict[str, Dict[str, int]] = {}
+        self.delta_len: Dict[str, int] = {}
+        self.delta_postings: Dict[str, Dict[str, int]] = {}
+        self.delta_total_len = 0
+
+    # --- Main segment ---
+
+    def _set_main(self, terms, ids, doc_len, tf, weights=None, idf=None, sorted_ids=None, sorted_cols=None):
+        """
+        Installs a main segment, deriving whatever was not passed in
+        (weights, IDF and the sorted id lookup arrays).
+        """
+        main = self._build_main(terms, ids, doc_len, tf, weights, idf, sorted_ids, sorted_cols)
+        with self._rw.write():
+            vars(self).update(main)
+
+    def _build_main(self, terms, ids, doc_len, tf, weights=None, idf=None, sorted_ids=None, sorted_cols=None) -> Dict[str, Any]:
+        """
+        Returns the attributes of a main segment, without installing it.
+        """
+        main_total_len = float(doc_len.sum())
+        n_docs = len(ids)
+        if idf is None:
+            df = np.diff(tf.indptr)
+            idf = np.log((n_docs - df + 0.5) / (df + 0.5) + 1.0).astype(np.float32)
+        if weights is None:
+            avgdl = main_total_len / n_docs if n_docs else 1.0
+            norms = self.k1 * (1 - self.b + self.b * doc_len / avgdl)
+            data = tf.data * (self.k1 + 1) / (tf.data + norms[tf.indices])
+            weights = csr_matrix((data.astype(np.float32), tf.indices, tf.indptr), shape=tf.shape)
+        if sorted_ids is None:
+            sorted_cols = np.argsort(ids, kind="stable").astype(np.int64)
+            sorted_ids = ids[sorted_cols]
+
+        return {
+            "terms": terms,
+            "ids": ids,
+            "doc_len": doc_len,
+            "tf": tf,
+            "main_total_len": main_total_len,
+            "alive": np.ones(n_docs, dtype=bool),
+            "removed_main": 0,
+            "idf": idf,
+            "weights": weights,
+            "sorted_ids": sorted_ids,
+            "sorted_cols": sorted_cols,
+        }
+
+    def _term_row(self, term: str) -> int:
+        row = int(np.searchsorted(self.terms, term))
+        if row < len(self.terms) and self.terms[row] == term:
+            return row
+        return -1
+
+    def _col_of(self, doc_id: str) -> int:
+        key = np.bytes_(doc_id.encode("utf-8"))
+        pos = int(np.searchsorted(self.sorted_ids, key))
+        if pos < len(self.sorted_ids) and self.sorted_ids[pos] == key:
+            return int(self.sorted_cols[pos])
+        return -1
+
+    def compact(self, extra_ids: List[str] = (), extra_tf: List[Dict[str, int]] = ()):
+        """
+        Rebuilds the main segment from its live chunks, the delta segment
+        and optionally `extra_ids` / `extra_tf` (term freqs per chunk).
+
+        The new segment is built aside while searches continue on the
+        current one, and swapped in (with the delta cleared) at once.
+        """
+        delta_ids = list(self.delta_tf) + list(extra_ids)
+        delta_tf = list(self.delta_tf.values()) + list(extra_tf)
+
+        # Live (term, column, tf) entries of the current main segment
+        coo = self.tf.tocoo()
+        keep = self.alive[coo.col]
+        new_cols = np.cumsum(self.alive) - 1
+        terms = [self.terms[coo.row[keep]].astype(str)]
+        cols = [new_cols[coo.col[keep]].astype(np.int64)]
+        freqs = [coo.data[keep].astype(np.float32)]
+
+        n_alive = int(self.alive.sum())
+        for offset, term_freqs in enumerate(delta_tf):
+            terms.append(np.array(list(term_freqs), dtype=str))
+            cols.append(np.full(len(term_freqs), n_alive + offset, dtype=np.int64))
+            freqs.append(np.array(list(term_freqs.values()), dtype=np.float32))
+
+        vocab, rows = np.unique(np.concatenate(terms), return_inverse=True)
+        n_docs = n_alive + len(delta_ids)
+        tf = csr_matrix((np.concatenate(freqs), (rows, np.concatenate(cols))), shape=(len(vocab), n_docs))
+        tf.indptr = tf.indptr.astype(np.int64)
+        tf.indices = tf.indices.astype(np.int64)
+
+        ids = np.array(
+            list(self.ids[self.alive]) + [doc_id.encode("utf-8") for doc_id in delta_ids], dtype=np.bytes_
+        ) if n_docs else np.zeros(0, dtype="S1")
+        doc_len = np.concatenate([
+            self.doc_len[self.alive],
+            np.array([sum(term_freqs.values()) for term_freqs in delta_tf], dtype=np.float32),
+        ]).astype(np.float32)
+
+        main = self._build_main(terms=vocab if len(vocab) else np.zeros(0, dtype="U1"), ids=ids, doc_len=doc_len, tf=tf)
+        with self._rw.write():
+            vars(self).update(main)
+            self.delta_tf, self.delta_len, self.delta_postings, self.delta_total_len = {}, {}, {}, 0
+
+    # --- Building and updating ---
+
+    @classmethod
+    def from_vector_store(cls, vector_store, batch_size: int = 1000, **kwargs) -> "IncrementalBM25Index":
+        """
+        Builds an index over every chunk in a FAISS store's docstore,
+        fetching the chunks in bulk batches.
+        """
+        ids = list(vector_store.index_to_docstore_id.values())
+        built_ids, built_tf = [], []
+        for start in range(0, len(ids), batch_size):
+            for doc in fetch_documents(vector_store, ids[start:start + batch_size]):
+                built_ids.append(doc.id)
+                built_tf.append(Counter(tokenize(doc.page_content)))
+
+        index = cls(**kwargs)
+        index.compact(built_ids, built_tf)
+        return index
+
+    def __len__(self):
+        return len(self.ids) - self.removed_main + len(self.delta_tf)
+
+    def __contains__(self, doc_id: str):
+        if doc_id in self.delta_tf:
+            return True
+        col = self._col_of(doc_id)
+        return col >= 0 and bool(self.alive[col])
+
+    def add_documents(self, documents: List[Document], ids: List[str]):
+        """
+        Adds documents to the delta segment.
+
+        Args:
+          documents (List[Document]): The chunks to index.
+          ids (List[str]): Docstore ids of the chunks (same order as documents).
+        """
+        new_tf = [
+            (doc_id, dict(Counter(tokenize(doc.page_content))))
+            for doc_id, doc in zip(ids, documents) if doc_id not in self
+        ]
+        with self._rw.write():
+            for doc_id, term_freqs in new_tf:
+                if doc_id not in self.delta_tf:
+                    self._add_delta(doc_id, term_freqs)
+
+    def _add_delta(self, doc_id: str, term_freqs: Dict[str, int]):
+        self.delta_tf[doc_id] = term_freqs
+        self.delta_len[doc_id] = sum(term_freqs.values())
+        self.delta_total_len += self.delta_len[doc_id]
+        for term, freq in term_freqs.items():
+            self.delta_postings.setdefault(term, {})[doc_id] = freq
+
+    def remove_documents(self, ids: Iterable[str]):
+        """
+        Removes documents: delta chunks are dropped, main chunks are masked out.
+
+        Args:
+          ids (Iterable[str]): Docstore ids of the chunks to remove.
+        """
+        with self._rw.write():
+            self._remove(ids)
+
+    def _remove(self, ids: Iterable[str]):
+        for doc_id in ids:
+            term_freqs = self.delta_tf.pop(doc_id, None)
+            if term_freqs is not None:
+                self.delta_total_len -= self.delta_len.pop(doc_id)
+                for term in term_freqs:
+                    postings = self.delta_postings[term]
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del self.delta_postings[term]
+                continue
+
+            col = self._col_of(doc_id)
+            if col >= 0 and self.alive[col]:
+                self.alive[col] = False
+                self.removed_main += 1
+
+    # --- Search ---
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[str, float]]:
+        """
+        Scores the documents that share at least one term with the query.
+
+        Args:
+          query (str): The query text.
+          k (int): The number of results to return.
+
+        Returns:
+          List[Tuple[str, float]]: (doc id, score) pairs, best first.
+        """
+        return self.search_batch([query], k)[0]
+
+    def search_batch(self, queries: List[str], k: int = 4) -> List[List[Tuple[str, float]]]:
+        """
+        Scores several queries with a single sparse matrix product.
+
+        Args:
+          queries (List[str]): The query texts.
+          k (int): The number of results per query.
+
+        Returns:
+          List[List[Tuple[str, float]]]: Per query, (doc id, score) pairs, best first.
+        """
+        with self._rw.read():
+            n_main = len(self.ids)
+            n_docs = n_main + len(self.delta_tf)
+            if n_docs == 0 or k <= 0:
+                return [[] for _ in queries]
+
+            # Query x term matrix holding each query term's IDF
+            rows, cols, values = [], [], []
+            delta_idf: List[Dict[str, float]] = []
+            for query_row, query in enumerate(queries):
+                delta_idf.append({})
+                for term in set(tokenize(query)):
+                    term_row = self._term_row(term)
+                    delta_df = len(self.delta_postings.get(term, ()))
+                    if term_row >= 0 and not self.delta_tf:
+                        idf = float(self.idf[term_row])
+                    else:
+                        main_df = int(self.tf.indptr[term_row + 1] - self.tf.indptr[term_row]) if term_row >= 0 else 0
+                        if main_df + delta_df == 0:
+                            continue
+                        idf = math.log((n_docs - main_df - delta_df + 0.5) / (main_df + delta_df + 0.5) + 1.0)
+
+                    if term_row >= 0:
+                        rows.append(query_row)
+                        cols.append(term_row)
+                        values.append(idf)
+                    if delta_df:
+                        delta_idf[query_row][term] = idf
+
+            main_scores = None
+            if n_main and values:
+                query_matrix = csr_matrix(
+                    (np.array(values, dtype=np.float32), (rows, cols)), shape=(len(queries), len(self.terms))
+                )
+                main_scores = query_matrix @ self.weights
+
+            avgdl = (self.main_total_len + self.delta_total_len) / n_docs
+            results = []
+            for query_row in range(len(queries)):
+                hits: List[Tuple[str, float]] = []
+
+                if main_scores is not None:
+                    start, end = main_scores.indptr[query_row], main_scores.indptr[query_row + 1]
+                    doc_cols = main_scores.indices[start:end]
+                    scores = main_scores.data[start:end]
+                    if self.removed_main:
+                        live = self.alive[doc_cols]
+                        doc_cols, scores = doc_cols[live], scores[live]
+                    if len(scores) > k:
+                        top = np.argpartition(-scores, k - 1)[:k]
+                        doc_cols, scores = doc_cols[top], scores[top]
+                    hits.extend((self.ids[col].decode("utf-8"), float(score)) for col, score in zip(doc_cols, scores))
+
+                # The delta segment is small; score it from its postings
+                delta_scores: Dict[str, float] = {}
+                for term, idf in delta_idf[query_row].items():
+                    for doc_id, freq in self.delta_postings[term].items():
+                        norm = self.k1 * (1 - self.b + self.b * self.delta_len[doc_id] / avgdl)
+                        delta_scores[doc_id] = delta_scores.get(doc_id, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+                hits.extend(delta_scores.items())
+
+                hits.sort(key=lambda item: item[1], reverse=True)
+                results.append(hits[:k])
+
+            return results
+
+    # --- Persistence ---
+
+    def save(self, path: str):
+        """
+        Compacts the index and writes it as a fresh directory of .npy arrays,
+        discarding the delta log. The previous directory is replaced as a whole.
+        """
+        if self.delta_tf or self.removed_main:
+            self.compact()
+        self.delta_records = 0
+
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        arrays = {
+            "terms": self.terms,
+            "ids": self.ids,
+            "sorted_ids": self.sorted_ids,
+            "sorted_cols": self.sorted_cols,
+            "doc_len": self.doc_len,
+            "indptr": self.tf.indptr,
+            "indices": self.tf.indices,
+            "tf": self.tf.data,
+            "weights": self.weights.data,
+            "idf": self.idf,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        with open(os.path.join(tmp_path, _META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "n_terms": len(self.terms), "n_docs": len(self.ids)}, f)
+
+        old_path = f"{path}.old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.isdir(path):
+            os.replace(path, old_path)
+        elif os.path.exists(path):
+            # A legacy pickled index
+            os.remove(path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    def append_delta(self, path: str, ids: List[str], removed_ids: List[str] = ()):
+        """
+        Persists only the change (added chunk ids, with their term freqs
+        from the delta segment, and removed ids) by appending it to the
+        delta log. Compacts into a fresh snapshot once the log is long enough.
+        """
+        if not os.path.exists(os.path.join(path, _META_FILE)) or any(doc_id not in self.delta_tf for doc_id in ids):
+            # Nothing to append to, or the chunks were already compacted
+            # (e.g. by an earlier attempt whose snapshot was not published)
+            self.save(path)
+            return
+
+        record = {
+            "removed": list(removed_ids),
+            "added": [[doc_id, self.delta_tf[doc_id]] for doc_id in ids if doc_id in self.delta_tf],
+        }
+        with open(os.path.join(path, _DELTA_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.delta_records += 1
+
+        if self.delta_records >= self.compact_threshold:
+            print(f"Compacting BM25 delta log ({self.delta_records} records)...")
+            self.save(path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = False, **kwargs) -> "IncrementalBM25Index":
+        """
+        Loads the arrays at `path` (memory-mapped if `mmap`) and replays the delta log.
+        """
+        with open(os.path.join(path, _META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        mmap_mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in _ARRAY_FILES}
+        shape = (meta["n_terms"], meta["n_docs"])
+
+        index = cls(k1=meta["k1"], b=meta["b"], **kwargs)
+        index._set_main(
+            terms=arrays["terms"],
+            ids=arrays["ids"],
+            doc_len=arrays["doc_len"],
+            tf=csr_matrix((arrays["tf"], arrays["indices"], arrays["indptr"]), shape=shape),
+            weights=csr_matrix((arrays["weights"], arrays["indices"], arrays["indptr"]), shape=shape),
+            idf=arrays["idf"],
+            sorted_ids=arrays["sorted_ids"],
+            sorted_cols=arrays["sorted_cols"],
+        )
+
+        index.replay_delta(path)
+        return index
+
+    def replay_delta(self, path: str) -> int:
+        """
+        Applies the records of the delta log at `path` that this index has
+        not seen yet (the first `delta_records` are skipped), e.g. those
+        appended by another process since this index was loaded.
+        Returns the number of records applied.
+        """
+        delta_path = os.path.join(path, _DELTA_FILE)
+        if not os.path.exists(delta_path):
+            return 0
+
+        with open(delta_path, "r", encoding="utf-8") as f:
+            records = (line for line in f if line.strip())
+            new_records = [json.loads(line) for line in itertools.islice(records, self.delta_records, None)]
+
+        with self._rw.write():
+            for record in new_records:
+                self._remove(record["removed"])
+                for doc_id, term_freqs in record["added"]:
+                    if doc_id not in self:
+                        self._add_delta(doc_id, term_freqs)
+                self.delta_records += 1
+        return len(new_records)
+
+    def fork(self) -> "IncrementalBM25Index":
+        """
+        Returns a copy that shares the (never modified) main segment arrays
+        and owns its removal mask and delta segment, so it can be updated
+        while searches continue on this one.
+        """
+        with self._rw.read():
+            index = copy.copy(self)
+            index._rw = ReadWriteLock()
+            index.alive = self.alive.copy()
+            index.delta_tf = dict(self.delta_tf)
+            index.delta_len = dict(self.delta_len)
+            index.delta_postings = {term: dict(postings) for term, postings in self.delta_postings.items()}
+        return index
+
+    def replace_with(self, other: "IncrementalBM25Index"):
+        """
+        Takes over `other`'s contents in place, so retrievers holding this
+        index search them from now on. `other` must not be used afterwards.
+        """
+        state = {name: value for name, value in vars(other).items() if name != "_rw"}
+        with self._rw.write():
+            vars(self).update(state)
+
+
+class BM25IndexRetriever(BaseRetriever):
+    """
+    LangChain retriever over an IncrementalBM25Index.
+    Holds a reference to the index, so updates are visible without rebuilding;
+    the text of the hits is fetched in bulk from the FAISS store's docstore.
+    """
+
+    index: IncrementalBM25Index
+    vector_store: Any
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        hits = self.index.search(query, self.k)
+        return fetch_documents(self.vector_store, [doc_id for doc_id, _ in hits])
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from components.lru_cache import LRUCache
+from components.token_counter import TokenCounter
+
+
+# The rolling summary is carried as a leading (human, ai) turn, so every
+# prompt path that takes a chat history handles it unchanged.
+SUMMARY_TURN = "Summary of the earlier conversation"
+
+
+def window_history(
+    turns: List[Tuple[str, str]], counter: TokenCounter, max_tokens: int
+) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+    """
+    Keeps the most recent turns that fit in `max_tokens`. If even the last
+    turn does not fit, its answer is truncated so the question survives;
+    a question longer than the whole budget is truncated itself and its
+    answer dropped.
+
+    Returns:
+      Tuple[List, List]: (kept turns, older turns that were dropped).
+    """
+    kept: List[Tuple[str, str]] = []
+    used = 0
+    start = len(turns)
+    for human, ai in reversed(turns):
+        cost = counter.count(human) + counter.count(ai)
+        if used + cost > max_tokens:
+            if not kept and max_tokens > 0:
+                question_tokens = counter.count(human)
+                if question_tokens >= max_tokens:
+                    kept.append((counter.truncate(human, max_tokens), ""))
+                else:
+                    kept.append((human, counter.truncate(ai, max_tokens - question_tokens)))
+                start -= 1
+            break
+        kept.append((human, ai))
+        used += cost
+        start -= 1
+    kept.reverse()
+    return kept, turns[:start]
+
+
+class ChatSession:
+    """
+    Server-side conversation state: the recent turns plus a rolling summary
+    of the turns that no longer fit in the history window.
+    """
+
+    def __init__(self):
+        self.session_id = uuid.uuid4().hex
+        self.turns: List[Tuple[str, str]] = []
+        self.summary = ""
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        # Serializes summary updates for this session
+        self.summary_lock = asyncio.Lock()
+
+    def history(self) -> List[Tuple[str, str]]:
+        """The turns to build prompts from, led by the summary if there is one."""
+        if self.summary:
+            return [(SUMMARY_TURN, self.summary)] + self.turns
+        return list(self.turns)
+
+    def to_dict(self) -> Dict:
+        return {
+            "session_id": self.session_id,
+            "turns": self.turns,
+            "summary": self.summary,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ChatSession":
+        session = cls()
+        for key, value in data.items():
+            setattr(session, key, value)
+        session.turns = [tuple(turn) for turn in session.turns]
+        return session
+
+
+class SessionStore:
+    """
+    Bounded in-memory session store. Sessions idle for longer than `ttl`
+    seconds expire, and the least recently used are evicted beyond
+    `max_sessions`.
+    """
+
+    def __init__(self, max_sessions: int = 10_000, ttl: Optional[float] = 3600):
+        self._sessions = LRUCache(max_entries=max_sessions, ttl=ttl)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def create(self) -> ChatSession:
+        session = ChatSession()
+        self._sessions.set(session.session_id, session)
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        """Returns the session (restarting its TTL), or None if unknown or expired."""
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.updated_at = time.time()
+            self._sessions.set(session_id, session)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id) is not None
+
+    def save(self, session: ChatSession, *fields: str):
+        """Sessions are held by reference, so their changes are already stored."""
+
+
+class SQLiteSessionStore:
+    """
+    Session store in a SQLite file shared by every API worker process, so
+    a session can be continued on whichever worker serves the request.
+    Same interface and limits as `SessionStore`; changes made to a
+    session are written back with `save()`.
+
+    `save()` only writes the fields it is given, so a summary finished in
+    the background does not overwrite turns recorded meanwhile by another
+    worker. Two turns of one session answered at the same time by
+    different workers still race; the last one saved wins.
+    """
+
+    _FIELDS = ("turns", "summary")
+
+    def __init__(self, path: str, max_sessions: int = 10_000, ttl: Optional[float] = 3600):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        # Waits for other workers' writes instead of failing at once
+        self._conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id TEXT PRIMARY KEY, turns TEXT NOT NULL, summary TEXT NOT NULL, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def _expired_before(self) -> float:
+        return time.time() - self.ttl if self.ttl is not None else float("-inf")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE updated_at >= ?", (self._expired_before(),)
+            ).fetchone()[0]
+
+    def create(self) -> ChatSession:
+        session = ChatSession()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sessions (id, turns, summary, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (session.session_id, "[]", "", session.created_at, session.updated_at),
+            )
+            # Expired sessions go first, then the least recently used beyond the limit
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (self._expired_before(),))
+            self._conn.execute(
+                "DELETE FROM sessions WHERE id IN "
+                "(SELECT id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            )
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        """Returns the session (restarting its TTL), or None if unknown or expired."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT turns, summary, created_at FROM sessions WHERE id = ? AND updated_at >= ?",
+                (session_id, self._expired_before()),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE sessions SET updated_at = ? WHERE id = ?", (now, session_id))
+        turns, summary, created_at = row
+        return ChatSession.from_dict({
+            "session_id": session_id,
+            "turns": json.loads(turns),
+            "summary": summary,
+            "created_at": created_at,
+            "updated_at": now,
+        })
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+
+    def save(self, session: ChatSession, *fields: str):
+        """
+        Writes back the given fields ('turns', 'summary') of a session
+        returned by `get()`. A session deleted or evicted meanwhile stays gone.
+        """
+        values = {
+            "turns": json.dumps(session.turns, ensure_ascii=False),
+            "summary": session.summary,
+        }
+        assignments = [f"{field} = ?" for field in fields if field in self._FIELDS]
+        params = [values[field] for field in fields if field in self._FIELDS]
+        session.updated_at = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE sessions SET {', '.join(assignments + ['updated_at = ?'])} WHERE id = ?",
+                params + [session.updated_at, session.session_id],
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
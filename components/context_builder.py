@@ -0,0 +1,159 @@
+from typing import Dict, List, Optional, Tuple
+
+from langchain_community.docstore.document import Document
+
+from components.format_docs import format_docs
+from components.token_counter import TokenCounter
+
+
+def merge_overlapping(first: str, second: str, min_overlap: int = 20) -> Optional[str]:
+    """
+    Merges two chunks of the same text if one contains the other or the end
+    of one is the start of the other (by at least `min_overlap` characters).
+
+    Returns:
+      str | None: The merged text, or None if the chunks do not overlap.
+    """
+    if second in first:
+        return first
+    if first in second:
+        return second
+    for left, right in ((first, second), (second, first)):
+        probe = right[:min_overlap]
+        if len(probe) < min_overlap:
+            continue
+        position = left.find(probe, max(0, len(left) - len(right)))
+        while position != -1:
+            if right.startswith(left[position:]):
+                return left[:position] + right
+            position = left.find(probe, position + 1)
+    return None
+
+
+class _Passage:
+    def __init__(self, doc: Document, score: float):
+        self.text = doc.page_content
+        self.score = score
+        self.start = doc.metadata.get("start_index")
+        self.end = self.start + len(self.text) if self.start is not None else None
+
+    def absorb(self, other: "_Passage", min_overlap: int) -> bool:
+        """Merges `other` into this passage if they overlap or touch."""
+        if self.start is not None and other.start is not None:
+            if other.start == self.end:
+                merged = self.text + other.text
+            elif self.start == other.end:
+                merged = other.text + self.text
+            else:
+                merged = merge_overlapping(self.text, other.text, min_overlap)
+        else:
+            merged = merge_overlapping(self.text, other.text, min_overlap)
+        if merged is None:
+            return False
+
+        if self.start is not None and other.start is not None:
+            self.start = min(self.start, other.start)
+            self.end = self.start + len(merged)
+        else:
+            self.start = self.end = None
+        self.text = merged
+        self.score = max(self.score, other.score)
+        return True
+
+
+class ContextBuilder:
+    """
+    Assembles the retrieved chunks into the answer prompt's context.
+
+    Chunks overlap by MODEL_SAFE_CHUNK_OVERLAP characters, so neighbouring
+    hits repeat text that is paid for again in prefill. Chunks of the same
+    source (and page) that overlap, contain one another or touch (by their
+    `start_index`) are merged into one passage, and paragraphs already
+    present in a better passage are dropped. Passages are ordered by score
+    (the best chunk they contain, by the fused or rerank score the
+    retrievers put in its metadata) and packed into `max_tokens` tokens,
+    counted with the LLM's tokenizer.
+    """
+
+    def __init__(self, token_counter: TokenCounter, max_tokens: int = 2048, min_overlap: int = 20):
+        self.token_counter = token_counter
+        self.max_tokens = max_tokens
+        self.min_overlap = min_overlap
+
+    def _passages(self, docs: List[Document], scores: List[float]) -> List[_Passage]:
+        by_source: Dict[Tuple, List[_Passage]] = {}
+        for doc, score in zip(docs, scores):
+            key = (doc.metadata.get("source"), doc.metadata.get("page"))
+            group = by_source.setdefault(key, [])
+            passage = _Passage(doc, score)
+            # A merge can make a passage reach others, so keep absorbing
+            merged = True
+            while merged:
+                merged = False
+                for other in group:
+                    if passage.absorb(other, self.min_overlap):
+                        group.remove(other)
+                        merged = True
+                        break
+            group.append(passage)
+        return sorted((p for group in by_source.values() for p in group), key=lambda p: p.score, reverse=True)
+
+    def build(self, docs: List[Document], scores: Optional[List[float]] = None) -> Tuple[str, Dict[str, int]]:
+        """
+        Args:
+          docs (list): Retrieved documents, best first.
+          scores (list | None): Their scores. If omitted, the metadata["score"]
+            set by the hybrid retriever (fused score) or the reranker
+            (cross-encoder score) is used, and rank order for documents
+            without one.
+
+        Returns:
+          Tuple[str, Dict]: The context, and stats with the token counts of
+          the plain `format_docs` context ("tokens_in"), of this context
+          ("tokens_out") and the difference ("tokens_saved").
+        """
+        if scores is None:
+            scores = [doc.metadata.get("score") for doc in docs]
+            if any(score is None for score in scores):
+                scores = [1.0 / (rank + 1) for rank in range(len(docs))]
+
+        # Drop paragraphs already seen in a better passage (e.g. the same
+        # text indexed under two sources)
+        seen = set()
+        passages = []
+        for passage in self._passages(docs, scores):
+            paragraphs = []
+            for paragraph in passage.text.split("\n\n"):
+                key = " ".join(paragraph.split())
+                if key and key in seen:
+                    continue
+                seen.add(key)
+                paragraphs.append(paragraph)
+            text = "\n\n".join(paragraphs).strip()
+            if text:
+                passages.append(text)
+
+        # Pack the best passages into the budget; only the best one is ever
+        # truncated, so the context is never empty
+        packed = []
+        used = 0
+        separator_tokens = self.token_counter.count("\n\n")
+        for text in passages:
+            cost = self.token_counter.count(text) + (separator_tokens if packed else 0)
+            if used + cost <= self.max_tokens:
+                packed.append(text)
+                used += cost
+            elif not packed:
+                packed.append(self.token_counter.truncate(text, self.max_tokens))
+                used = self.max_tokens
+
+        context = "\n\n".join(packed)
+        tokens_in = self.token_counter.count(format_docs(docs))
+        tokens_out = self.token_counter.count(context)
+        return context, {
+            "chunks": len(docs),
+            "passages": len(packed),
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "tokens_saved": max(0, tokens_in - tokens_out),
+        }
@@ -1,30 +1,29 @@
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
+import glob
+import os
+from langchain_community.document_loaders import TextLoader
 from langchain_community.docstore.document import Document
-from typing import Iterator
+from typing import List
 
-def load_documents_lazy(directory_path="./data") -> Iterator[Document]:
+def list_document_paths(directory_path="./data") -> List[str]:
     """
-    Lazily loads document from the specified directory.
-    This returns an iterator.
+    Lists the document files (**/*.txt) under a directory.
 
     Args:
         directory_path (str): The path to the directory containing documents.
     Returns:
-        (Iterator[Document]): Iterator yielding Document objects.
+        (List[str]): Sorted list of file paths.
     """
-    print(f"Setting up lazy loader from: {directory_path}")
+    pattern = os.path.join(directory_path, "**", "*.txt")
+    return sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
 
-    loader = DirectoryLoader(
-        directory_path,
-        glob="**/*.txt",
-        loader_cls=TextLoader,
-        loader_kwargs={"encoding": "UTF-8"},
-        show_progress=True,
-        use_multithreading=True,
-    )
 
-    try:
-        return loader.lazy_load()
-    except Exception as e:
-        print(f"Error setting up lazy loader: {e}")
-        return iter([])  # returns empty iterator
+def load_document(file_path: str) -> List[Document]:
+    """
+    Loads a single text file.
+
+    Args:
+        file_path (str): The path to the file.
+    Returns:
+        (List[Document]): The loaded document(s).
+    """
+    return TextLoader(file_path, encoding="UTF-8").load()
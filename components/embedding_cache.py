@@ -0,0 +1,221 @@
+import os
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from components.lru_cache import LRUCache
+from components.write_behind import DebouncedWriter
+
+
+def embed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embeds several queries in one model call.
+
+    Uses the wrapper's `embed_queries` when it has one (so query caches are
+    honoured), else `embed_documents`: without query-specific encode kwargs
+    (see get_embedding_model) query and document encoding are identical.
+    """
+    if not texts:
+        return []
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    return embeddings.embed_documents(texts)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Persistent document-embedding cache wrapped around an embedding model.
+
+    Chunks are keyed by SHA-1 of (model name, whitespace-normalized text), so
+    re-ingesting unchanged text never reaches the model. Entries are kept in
+    LRU order, bounded by `max_entries`, and saved as a single `.npz` file
+    (a uint8 key matrix and a float32 vector matrix) in the background.
+    The file is only read on the first `embed_documents` call, so processes
+    that just answer queries never hold it in memory. Query embeddings are
+    passed through uncached.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        cache_path: str,
+        max_entries: int = 200_000,
+        save_delay: float = 5.0,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        self._writer = DebouncedWriter(self.save, delay=save_delay, max_delay=save_delay * 6)
+
+    def _key(self, text: str) -> bytes:
+        normalized = " ".join(text.split())
+        return hashlib.sha1(f"{self.model_name}\0{normalized}".encode("utf-8")).digest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._ensure_loaded()
+        keys = [self._key(text) for text in texts]
+        vectors = [None] * len(texts)
+
+        # 1. Look up cached vectors
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    vectors[i] = vector
+
+        # 2. Embed the misses (deduplicated) in one model call
+        missing = {}
+        for i, key in enumerate(keys):
+            if vectors[i] is None:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            miss_texts = [texts[positions[0]] for positions in missing.values()]
+            new_vectors = self.embeddings.embed_documents(miss_texts)
+
+            with self._lock:
+                for (key, positions), vector in zip(missing.items(), new_vectors):
+                    vector = np.asarray(vector, dtype=np.float32)
+                    self._entries[key] = vector
+                    for i in positions:
+                        vectors[i] = vector
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            self._writer.mark_dirty()
+
+        n_misses = sum(len(positions) for positions in missing.values())
+        with self._lock:
+            self.misses += n_misses
+            self.hits += len(texts) - n_misses
+
+        return [vector.tolist() for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # Queries are not cached here, like embed_query
+        return embed_queries(self.embeddings, texts)
+
+    # --- Stats ---
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self) -> str:
+        return (
+            f"Embedding cache: {self.hits} hits, {self.misses} misses "
+            f"({self.hit_rate:.1%} hit rate), {len(self._entries)} entries."
+        )
+
+    # --- Persistence ---
+
+    def _ensure_loaded(self):
+        with self._load_lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+
+    def _load(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with np.load(self.cache_path) as data:
+                keys, vectors = data["keys"], data["vectors"]
+            entries = OrderedDict((key.tobytes(), vector) for key, vector in zip(keys, vectors))
+        except Exception as e:
+            print(f"Could not load embedding cache ({e}). Starting empty.")
+            return
+        with self._lock:
+            self._entries = entries
+        print(f"Loaded {len(entries)} cached embeddings from {self.cache_path}")
+
+    def save(self):
+        """
+        Writes the cache to disk atomically, through a temporary file of its
+        own (the CLI and the API's ingestion writer may save concurrently).
+        """
+        with self._lock:
+            if not self._entries:
+                return
+            keys = np.frombuffer(b"".join(self._entries.keys()), dtype=np.uint8).reshape(-1, 20)
+            vectors = np.stack(list(self._entries.values()))
+
+        tmp_path = f"{self.cache_path}.{os.getpid()}-{uuid.uuid4().hex}.tmp.npz"
+        try:
+            np.savez(tmp_path, keys=keys, vectors=vectors)
+            os.replace(tmp_path, self.cache_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def flush(self):
+        """
+        Saves pending cache entries immediately.
+        """
+        self._writer.flush()
+
+
+class QueryCachedEmbeddings(Embeddings):
+    """
+    In-process LRU cache for query embeddings, bounded by TTL and total bytes.
+
+    Repeated questions skip the model forward pass entirely. Document
+    embeddings are passed through unchanged.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_bytes: int = 32 * 1024 * 1024, ttl: float = 3600.0):
+        self.embeddings = embeddings
+        self.cache = LRUCache(
+            max_bytes=max_bytes,
+            ttl=ttl,
+            sizeof=lambda vector: vector.nbytes,
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = " ".join(text.split())
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+            self.cache.set(key, vector)
+        return vector.tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds several queries, sending all cache misses to the model in one call.
+        """
+        keys = [" ".join(text.split()) for text in texts]
+        vectors = {key: self.cache.get(key) for key in set(keys)}
+
+        missing = [key for key, vector in vectors.items() if vector is None]
+        if missing:
+            for key, vector in zip(missing, embed_queries(self.embeddings, missing)):
+                vectors[key] = np.asarray(vector, dtype=np.float32)
+                self.cache.set(key, vectors[key])
+
+        return [vectors[key].tolist() for key in keys]
+
+    def stats(self):
+        return self.cache.stats()
@@ -1,7 +1,21 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
 from langchain_huggingface import HuggingFaceEmbeddings
 
 
-def get_embedding_model(model_name="all-MiniLm-L6-v2", device="cpu"):
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx")
+
+
+def get_embedding_model(
+    model_name="all-MiniLm-L6-v2",
+    device="cpu",
+    normalize=True,
+    backend="torch",
+    num_threads=0,
+    onnx_file: Optional[str] = None,
+):
     """
     Initializes and returns the embedding model.
 
@@ -10,17 +24,40 @@ def get_embedding_model(model_name="all-MiniLm-L6-v2", device="cpu"):
     Args:
       model_name (str): The name of the HuggingFace model to use.
       device (str): The device to run the model on ('cpu' or 'cuda')
+      normalize (bool): L2-normalize embeddings, so inner product equals cosine similarity.
+      backend (str): 'torch' (fp32), 'torch-int8' (dynamic int8 quantization of the
+        Linear layers, CPU only) or 'onnx' (ONNX Runtime; needs sentence-transformers[onnx]).
+      num_threads (int): CPU threads used by the backend (0 = library default).
+      onnx_file (str | None): ONNX file inside the model repository, e.g. a
+        quantized 'onnx/model_quint8_avx2.onnx' (None = the fp32 'onnx/model.onnx').
 
     Returns:
       HuggingFaceEmbeddings: The initialized embedding model object.
     """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}. Use one of {', '.join(EMBEDDING_BACKENDS)}.")
 
-    print(f"Initializing embedding model: {model_name} on device: {device}")
+    print(f"Initializing embedding model: {model_name} on device: {device} (backend: {backend})")
 
     model_kwargs = {'device': device}
 
+    if backend == "onnx":
+        model_kwargs['backend'] = 'onnx'
+        onnx_kwargs = {}
+        if onnx_file:
+            onnx_kwargs['file_name'] = onnx_file
+        if num_threads:
+            import onnxruntime
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = num_threads
+            onnx_kwargs['session_options'] = session_options
+        model_kwargs['model_kwargs'] = onnx_kwargs
+    elif num_threads:
+        import torch
+        torch.set_num_threads(num_threads)
+
     # For sentence-transformers, encode kwargs specifies normalization
-    encode_kwargs = {'normalize_embeddings': False}
+    encode_kwargs = {'normalize_embeddings': normalize}
 
     embeddings = HuggingFaceEmbeddings(
         model_name = model_name,
@@ -28,5 +65,89 @@ def get_embedding_model(model_name="all-MiniLm-L6-v2", device="cpu"):
         encode_kwargs = encode_kwargs
     )
 
+    if backend == "torch-int8":
+        import torch
+        # Weights of the Linear layers (nearly all the FLOPs) become int8;
+        # activations are quantized on the fly
+        torch.quantization.quantize_dynamic(
+            embeddings._client, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+
     print("Embedding model initialized successfully.")
-    return embeddings
\ No newline at end of file
+    return embeddings
+
+
+def embedding_cache_key(config) -> str:
+    """
+    Model identity for the embedding cache. Quantized backends produce
+    slightly different vectors, so they get their own entries ('torch'
+    keeps the original key).
+    """
+    key = f"{config.EMBEDDING_MODEL_NAME}:normalize={config.EMBEDDING_NORMALIZE}"
+    if config.EMBEDDING_BACKEND == "onnx":
+        key += f":backend=onnx:{config.EMBEDDING_ONNX_FILE}"
+    elif config.EMBEDDING_BACKEND != "torch":
+        key += f":backend={config.EMBEDDING_BACKEND}"
+    return key
+
+
+def embedding_agreement_report(
+    reference, candidate, texts: List[str], k: int = 10, batch_size: int = 64, num_threads: int = 0
+) -> Dict[str, float]:
+    """
+    Compares a candidate embedding model (e.g. a quantized backend) with the
+    fp32 reference on the same texts: per-text cosine agreement, overlap of
+    each text's k nearest neighbours among the others (retrieval agreement),
+    and throughput.
+
+    With `num_threads`, torch is pinned to that many threads for both runs,
+    so throughput is compared at the same thread count (an ONNX candidate
+    must be created with the same `num_threads`).
+
+    Returns:
+      Dict[str, float]: 'mean_cosine', 'min_cosine', 'neighbour_overlap',
+      'reference_texts_per_sec', 'candidate_texts_per_sec', 'speedup'.
+    """
+    def embed(model) -> Tuple[np.ndarray, float]:
+        if num_threads:
+            import torch
+            torch.set_num_threads(num_threads)
+        model.embed_documents(texts[:batch_size])  # warm-up
+        start = time.perf_counter()
+        vectors = np.asarray(model.embed_documents(texts), dtype=np.float32)
+        rate = len(texts) / (time.perf_counter() - start)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12), rate
+
+    reference_vectors, reference_rate = embed(reference)
+    candidate_vectors, candidate_rate = embed(candidate)
+    cosines = np.sum(reference_vectors * candidate_vectors, axis=1)
+
+    k = min(k, len(texts) - 1)
+
+    def neighbours(vectors: np.ndarray) -> np.ndarray:
+        similarities = vectors @ vectors.T
+        np.fill_diagonal(similarities, -np.inf)
+        return np.argsort(-similarities, axis=1)[:, :k]
+
+    overlap = 1.0
+    if k > 0:
+        expected, found = neighbours(reference_vectors), neighbours(candidate_vectors)
+        overlap = float(np.mean([len(set(a) & set(b)) / k for a, b in zip(expected, found)]))
+
+    report = {
+        "mean_cosine": float(cosines.mean()),
+        "min_cosine": float(cosines.min()),
+        "neighbour_overlap": overlap,
+        "reference_texts_per_sec": reference_rate,
+        "candidate_texts_per_sec": candidate_rate,
+        "speedup": candidate_rate / reference_rate,
+    }
+
+    print(f"\nEmbedding agreement with fp32 ({len(texts)} texts):")
+    print(f"  cosine: mean {report['mean_cosine']:.4f}, min {report['min_cosine']:.4f}")
+    print(f"  neighbour overlap@{k}: {report['neighbour_overlap']:.3f}")
+    print(
+        f"  throughput: {reference_rate:.1f} -> {candidate_rate:.1f} texts/sec "
+        f"({report['speedup']:.2f}x)"
+    )
+    return report
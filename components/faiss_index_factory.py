@@ -0,0 +1,182 @@
+import time
+from typing import Dict, List
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+from config import Config
+
+
+def create_faiss_index(dim: int, config: Config, index_type: str | None = None, nlist: int | None = None) -> faiss.Index:
+    """
+    Creates an empty inner-product FAISS index of the configured type.
+
+    Args:
+      dim (int): Embedding dimension.
+      config (Config): Supplies FAISS_INDEX_TYPE and its build parameters.
+      index_type (str | None): Overrides config.FAISS_INDEX_TYPE ('flat', 'ivf' or 'hnsw').
+      nlist (int | None): Overrides config.FAISS_IVF_NLIST.
+
+    Returns:
+      faiss.Index: The index ('ivf' indexes still need training).
+    """
+    index_type = (index_type or config.FAISS_INDEX_TYPE).lower()
+
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim)
+
+    if index_type == "ivf":
+        quantizer = faiss.IndexFlatIP(dim)
+        return faiss.IndexIVFFlat(quantizer, dim, nlist or config.FAISS_IVF_NLIST, faiss.METRIC_INNER_PRODUCT)
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, config.FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = config.FAISS_HNSW_EF_CONSTRUCTION
+        return index
+
+    raise ValueError(f"Unknown FAISS_INDEX_TYPE: {index_type}. Use 'flat', 'ivf' or 'hnsw'.")
+
+
+def train_index(index: faiss.Index, vectors: np.ndarray, config: Config) -> faiss.Index:
+    """
+    Trains an (empty) IVF index on a sample of `vectors`; other types are
+    returned unchanged. If there are too few vectors for the configured nlist
+    (FAISS wants ~39 training points per list), a smaller IVF index is
+    created instead, so use the returned index.
+    """
+    if index.is_trained:
+        return index
+
+    nlist = faiss.extract_index_ivf(index).nlist
+    max_nlist = max(1, len(vectors) // 39)
+    if nlist > max_nlist:
+        print(f"Reducing IVF nlist from {nlist} to {max_nlist} for {len(vectors)} training vectors.")
+        index = create_faiss_index(index.d, config, "ivf", nlist=max_nlist)
+        nlist = max_nlist
+
+    if len(vectors) > config.FAISS_IVF_TRAIN_SIZE:
+        sample = np.random.default_rng(0).choice(len(vectors), config.FAISS_IVF_TRAIN_SIZE, replace=False)
+        vectors = vectors[sample]
+
+    print(f"Training IVF index (nlist={nlist}) on {len(vectors)} vectors...")
+    index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+    apply_search_params(index, config)
+    return index
+
+
+def apply_search_params(index: faiss.Index, config: Config):
+    """
+    Applies query-time parameters (nprobe for IVF, efSearch for HNSW).
+    """
+    base = faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        base.nprobe = config.FAISS_IVF_NPROBE
+    elif isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = config.FAISS_HNSW_EF_SEARCH
+
+
+def supports_removal(index: faiss.Index) -> bool:
+    """
+    Whether chunks can be deleted in place. LangChain's FAISS.delete assumes
+    row ids are renumbered after `remove_ids`, which only holds for flat indexes.
+    """
+    return isinstance(faiss.downcast_index(index), faiss.IndexFlat)
+
+
+def create_vector_store(embeddings, dim: int, config: Config, docstore=None) -> FAISS:
+    """
+    Creates an empty LangChain FAISS store over a configured index.
+    Embeddings are expected to be L2-normalized, so inner product is cosine.
+    Uses an in-memory docstore unless `docstore` is given.
+    """
+    index = create_faiss_index(dim, config)
+    apply_search_params(index, config)
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore if docstore is not None else InMemoryDocstore(),
+        index_to_docstore_id={},
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+    )
+
+
+def configure_loaded_store(vector_store: FAISS, config: Config) -> FAISS:
+    """
+    Restores settings that `FAISS.load_local` does not persist: the distance
+    strategy (from the index metric) and the query-time search parameters.
+    """
+    if vector_store.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        vector_store.distance_strategy = DistanceStrategy.MAX_INNER_PRODUCT
+    apply_search_params(vector_store.index, config)
+    return vector_store
+
+
+def get_index_vectors(index: faiss.Index) -> np.ndarray:
+    """
+    Reconstructs all stored vectors from an index.
+    """
+    base = faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        base.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def recall_report(vectors: np.ndarray, config: Config, k: int = 10, n_queries: int = 200) -> List[Dict]:
+    """
+    Measures recall@k and per-query latency of IVF / HNSW settings against
+    the exact flat index, using stored vectors (perturbed) as queries.
+
+    Args:
+      vectors (np.ndarray): Normalized corpus vectors.
+      config (Config): Base build parameters.
+      k (int): Cut-off for recall.
+      n_queries (int): Number of sampled queries.
+
+    Returns:
+      List[Dict]: One row per setting with 'index', 'param', 'recall', 'ms_per_query'.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    dim = vectors.shape[1]
+    rng = np.random.default_rng(0)
+
+    queries = vectors[rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    faiss.normalize_L2(queries)
+
+    def timed_search(index):
+        start = time.perf_counter()
+        _, ids = index.search(queries, k)
+        return ids, (time.perf_counter() - start) * 1000 / len(queries)
+
+    exact = create_faiss_index(dim, config, "flat")
+    exact.add(vectors)
+    truth, exact_ms = timed_search(exact)
+
+    def recall(ids):
+        return float(np.mean([len(set(found) & set(expected)) / k for found, expected in zip(ids, truth)]))
+
+    rows = [{"index": "flat", "param": "-", "recall": 1.0, "ms_per_query": exact_ms}]
+
+    ivf = train_index(create_faiss_index(dim, config, "ivf"), vectors, config)
+    ivf.add(vectors)
+    for nprobe in sorted({1, 4, 16, 64, config.FAISS_IVF_NPROBE}):
+        ivf.nprobe = nprobe
+        ids, ms = timed_search(ivf)
+        rows.append({"index": "ivf", "param": f"nprobe={nprobe}", "recall": recall(ids), "ms_per_query": ms})
+
+    hnsw = create_faiss_index(dim, config, "hnsw")
+    hnsw.add(vectors)
+    for ef_search in sorted({16, 32, 64, 128, config.FAISS_HNSW_EF_SEARCH}):
+        hnsw.hnsw.efSearch = ef_search
+        ids, ms = timed_search(hnsw)
+        rows.append({"index": "hnsw", "param": f"efSearch={ef_search}", "recall": recall(ids), "ms_per_query": ms})
+
+    print(f"\nRecall@{k} vs exact search ({len(vectors)} vectors, {len(queries)} queries):")
+    print(f"{'index':<6} {'param':<14} {'recall':>7} {'ms/query':>9}")
+    for row in rows:
+        print(f"{row['index']:<6} {row['param']:<14} {row['recall']:>7.3f} {row['ms_per_query']:>9.3f}")
+
+    return rows
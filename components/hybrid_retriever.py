@@ -0,0 +1,213 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from langchain_community.docstore.document import Document
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.retrievers import BaseRetriever
+from pydantic import Field
+
+from components.bm25_index import IncrementalBM25Index
+from components.embedding_cache import embed_queries
+from components.rw_lock import ReadWriteLock
+from components.vector_store_io import fetch_documents
+
+
+# Runs the lexical search while the calling thread embeds and searches FAISS
+# (both release the GIL for most of their work)
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid-search")
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[str]], weights: List[float], c: int = 60) -> List[Tuple[str, float]]:
+    """
+    Weighted RRF: each list contributes weight / (c + rank) to its ids.
+
+    Returns:
+      List[Tuple[str, float]]: (id, fused score) pairs, best first.
+    """
+    scores: Dict[str, float] = {}
+    for ids, weight in zip(ranked_lists, weights):
+        for rank, doc_id in enumerate(ids, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (c + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def blend_scores(scored_lists: List[List[Tuple[str, float]]], weights: List[float]) -> List[Tuple[str, float]]:
+    """
+    Min-max normalizes each list's scores to [0, 1] and sums them weighted;
+    an id missing from a list gets 0 from it.
+
+    Returns:
+      List[Tuple[str, float]]: (id, fused score) pairs, best first.
+    """
+    scores: Dict[str, float] = {}
+    for hits, weight in zip(scored_lists, weights):
+        if not hits:
+            continue
+        values = np.array([score for _, score in hits], dtype=np.float64)
+        low, span = values.min(), values.max() - values.min()
+        for (doc_id, _), value in zip(hits, values):
+            normalized = float((value - low) / span) if span > 0 else 1.0
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight * normalized
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def with_score(doc: Document, score: float) -> Document:
+    """
+    Copy of `doc` with `score` in its metadata (docstores may hand out
+    shared instances, so the original is left untouched).
+    """
+    return Document(id=doc.id, page_content=doc.page_content, metadata={**doc.metadata, "score": score})
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Single-pass hybrid retriever over the FAISS store and the BM25 index.
+
+    Lexical and dense search run concurrently and return only chunk ids
+    with scores, over-fetching `lexical_pool` / `dense_pool` candidates.
+    The two candidate lists are fused by id, with weighted reciprocal rank
+    fusion ('rrf') or min-max normalized score blending ('blend'). Text is
+    fetched from the docstore in one bulk read, and only for the final `k`.
+
+    `weights` are [lexical, dense], like the EnsembleRetriever weights.
+    FAISS is searched under a shared hold of `index_lock`, the lock the
+    RetrieverProvider takes exclusively to add vectors.
+    """
+
+    vector_store: Any
+    bm25_index: IncrementalBM25Index
+    index_lock: Any = Field(default_factory=ReadWriteLock)
+    k: int = 4
+    dense_pool: int = 20
+    lexical_pool: int = 20
+    fusion: str = "rrf"
+    weights: List[float] = [0.5, 0.5]
+    rrf_c: int = 60
+
+    def dense_search(self, query: str) -> List[Tuple[str, float]]:
+        """
+        Embeds the query and searches FAISS, returning (chunk id, similarity) pairs.
+        """
+        vector = self.vector_store.embedding_function.embed_query(query)
+        return self._dense_hits(np.array([vector], dtype=np.float32))[0]
+
+    def dense_search_batch(self, queries: List[str]) -> List[List[Tuple[str, float]]]:
+        """
+        Embeds all queries in one model call and searches FAISS once for all of them.
+        """
+        vectors = embed_queries(self.vector_store.embedding_function, queries)
+        return self._dense_hits(np.array(vectors, dtype=np.float32))
+
+    def _dense_hits(self, vectors: np.ndarray) -> List[List[Tuple[str, float]]]:
+        # Higher is better for fusion, whatever the index metric
+        sign = -1.0 if self.vector_store.distance_strategy == DistanceStrategy.EUCLIDEAN_DISTANCE else 1.0
+        with self.index_lock.read():
+            scores, rows = self.vector_store.index.search(vectors, self.dense_pool)
+            id_map = self.vector_store.index_to_docstore_id
+            return [
+                [(id_map[int(row)], sign * float(score)) for score, row in zip(query_scores, query_rows) if row >= 0]
+                for query_scores, query_rows in zip(scores, rows)
+            ]
+
+    def lexical_search(self, query: str) -> List[Tuple[str, float]]:
+        return self.bm25_index.search(query, self.lexical_pool)
+
+    def fuse(self, lexical_hits: List[Tuple[str, float]], dense_hits: List[Tuple[str, float]]) -> List[Tuple[str, float]]:
+        """
+        Fuses the two candidate lists by chunk id and keeps the top `k`.
+        """
+        if self.fusion == "rrf":
+            fused = reciprocal_rank_fusion(
+                [[doc_id for doc_id, _ in lexical_hits], [doc_id for doc_id, _ in dense_hits]],
+                self.weights,
+                self.rrf_c,
+            )
+        elif self.fusion == "blend":
+            fused = blend_scores([lexical_hits, dense_hits], self.weights)
+        else:
+            raise ValueError(f"Unknown fusion method: {self.fusion}. Use 'rrf' or 'blend'.")
+        return fused[:self.k]
+
+    def search(self, query: str) -> List[Tuple[str, float]]:
+        """
+        Runs both searches concurrently and returns the fused (chunk id, score) top-k.
+        """
+        lexical = _executor.submit(self.lexical_search, query)
+        dense_hits = self.dense_search(query)
+        return self.fuse(lexical.result(), dense_hits)
+
+    async def asearch(self, query: str) -> List[Tuple[str, float]]:
+        loop = asyncio.get_running_loop()
+        lexical_hits, dense_hits = await asyncio.gather(
+            loop.run_in_executor(_executor, self.lexical_search, query),
+            loop.run_in_executor(_executor, self.dense_search, query),
+        )
+        return self.fuse(lexical_hits, dense_hits)
+
+    def search_batch(self, queries: List[str]) -> List[List[Tuple[str, float]]]:
+        """
+        Batched `search`: one embedding call, one FAISS search and one BM25
+        matrix product for all queries.
+        """
+        if not queries:
+            return []
+        lexical = _executor.submit(self.bm25_index.search_batch, queries, self.lexical_pool)
+        dense_hits = self.dense_search_batch(queries)
+        return [self.fuse(lexical_hits, hits) for lexical_hits, hits in zip(lexical.result(), dense_hits)]
+
+    def materialize(self, hits: List[Tuple[str, float]]) -> List[Document]:
+        """
+        Fetches the text of the fused hits in one bulk read, keeping their order.
+        """
+        return self.materialize_batch([hits])[0]
+
+    def materialize_batch(self, hits_per_query: List[List[Tuple[str, float]]]) -> List[List[Document]]:
+        """
+        Fetches the text of several queries' hits in one bulk read. Each
+        document is a copy carrying its fused score as metadata["score"].
+        """
+        unique_ids = list(dict.fromkeys(doc_id for hits in hits_per_query for doc_id, _ in hits))
+        docs = {doc.id: doc for doc in fetch_documents(self.vector_store, unique_ids)}
+        return [
+            [with_score(docs[doc_id], score) for doc_id, score in hits if doc_id in docs]
+            for hits in hits_per_query
+        ]
+
+    def retrieve_batch(self, queries: List[str]) -> List[List[Document]]:
+        """
+        Retrieves the documents for many queries at once (see `search_batch`).
+        """
+        return self.materialize_batch(self.search_batch(queries))
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.materialize(self.search(query))
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        hits = await self.asearch(query)
+        return await asyncio.get_running_loop().run_in_executor(_executor, self.materialize, hits)
+
+
+class ReadLockedRetriever(BaseRetriever):
+    """
+    Runs another retriever under a shared hold of `lock`, e.g. the FAISS
+    retriever of the ensemble, whose index is extended under the exclusive lock.
+    """
+
+    retriever: BaseRetriever
+    lock: Any
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        with self.lock.read():
+            return self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
@@ -0,0 +1,303 @@
+import os
+import re
+import uuid
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from components.vector_store_io import DOCSTORE_FILE, OVERLAY_FILE
+
+
+CURRENT_FILE = "CURRENT"
+PUBLISH_LOCK_FILE = ".publish.lock"
+VECTOR_DIR = "faiss_index"
+BM25_DIR = "bm25_index"
+
+# Files written in place (the docstore overlay, the BM25 delta log) are
+# copied into a staged generation; every other file, including the base
+# docstore, is only ever replaced, so it is hard-linked
+_MUTABLE_FILES = (OVERLAY_FILE, "delta.jsonl")
+
+# Reopened with every generation, so they do not decide segment reuse
+_DOCSTORE_FILES = (DOCSTORE_FILE, OVERLAY_FILE)
+
+_GENERATION_DIR = re.compile(r"^gen-(\d+)$")
+# Private files and directories, tagged with the pid of the process using them
+_PRIVATE_ENTRY = re.compile(r"^\.(?:staging|working)-(\d+)-")
+
+# One publish at a time per snapshot root within the process; the file
+# lock under the root extends this to other processes
+_publish_locks: Dict[str, threading.Lock] = {}
+_publish_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _publish_lock(root: str):
+    with _publish_locks_guard:
+        thread_lock = _publish_locks.setdefault(os.path.abspath(root), threading.Lock())
+    with thread_lock, open(os.path.join(root, PUBLISH_LOCK_FILE), "a+") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            # Retries for about 10s before raising OSError
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def segment_identity(directory: str) -> FrozenSet[Tuple]:
+    """
+    Identifies the immutable files of a snapshot directory by inode. A
+    generation staged from another hard-links the files it did not change,
+    so equal identities mean the segment can be reused as loaded.
+    """
+    identity = []
+    for name in os.listdir(directory):
+        if name in _MUTABLE_FILES or name in _DOCSTORE_FILES:
+            continue
+        stat = os.stat(os.path.join(directory, name))
+        identity.append((name, stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns))
+    return frozenset(identity)
+
+
+def _process_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # os.kill would terminate the process; keep the entry
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SnapshotConflictError(RuntimeError):
+    """Another writer published a generation after this one was staged."""
+
+
+class IndexSnapshots:
+    """
+    Generation-numbered index snapshots under `root`:
+
+      root/gen-000007/faiss_index/   FAISS index, row ids, SQLite docstore
+      root/gen-000007/bm25_index/    BM25 arrays and delta log
+      root/CURRENT                   "7"
+
+    Published generations are never modified. A writer stages the next
+    generation in a private directory (optionally starting from a copy of
+    a base generation), then `publish` renames it to the next number and
+    atomically replaces CURRENT. Readers resolve CURRENT once and keep
+    using their generation; its files stay valid while they are open,
+    even after the directory is pruned.
+    """
+
+    def __init__(self, root: str, keep: int = 3):
+        self.root = root
+        self.keep = max(1, keep)
+
+    def path(self, generation: int) -> str:
+        return os.path.join(self.root, f"gen-{generation:06d}")
+
+    @staticmethod
+    def vector_path(snapshot_path: str) -> str:
+        return os.path.join(snapshot_path, VECTOR_DIR)
+
+    @staticmethod
+    def bm25_path(snapshot_path: str) -> str:
+        return os.path.join(snapshot_path, BM25_DIR)
+
+    def current(self) -> Optional[int]:
+        """The published generation, or None if nothing was published yet."""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), "r", encoding="utf-8") as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def generations(self) -> List[int]:
+        if not os.path.isdir(self.root):
+            return []
+        found = (_GENERATION_DIR.match(name) for name in os.listdir(self.root))
+        return sorted(int(match.group(1)) for match in found if match)
+
+    def stage(self, base: Optional[int] = None, skip: tuple = ()) -> str:
+        """
+        Creates a private directory for building the next generation,
+        populated from generation `base` if given (files named in `skip`
+        are left out).
+        """
+        staging_path = self.private_path("staging")
+        if base is None:
+            os.makedirs(staging_path)
+            return staging_path
+
+        def copy_file(source: str, target: str):
+            name = os.path.basename(source)
+            if name in _MUTABLE_FILES:
+                shutil.copy2(source, target)
+            else:
+                os.link(source, target)
+
+        shutil.copytree(
+            self.path(base),
+            staging_path,
+            copy_function=copy_file,
+            ignore=lambda _, names: [name for name in names if name in skip],
+        )
+        return staging_path
+
+    def private_path(self, kind: str, suffix: str = "") -> str:
+        """
+        A unique path under `root` for this process's temporary `kind`
+        ('staging' or 'working') entry, removed by `sweep` once it exits.
+        """
+        return os.path.join(self.root, f".{kind}-{os.getpid()}-{uuid.uuid4().hex}{suffix}")
+
+    def sweep(self) -> int:
+        """
+        Removes staging directories and working files left behind by
+        processes that no longer run (e.g. killed mid-save). Returns the
+        number of entries removed.
+        """
+        if not os.path.isdir(self.root):
+            return 0
+        removed = 0
+        for name in os.listdir(self.root):
+            match = _PRIVATE_ENTRY.match(name)
+            if not match or int(match.group(1)) == os.getpid() or _process_alive(int(match.group(1))):
+                continue
+            path = os.path.join(self.root, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+            removed += 1
+        if removed:
+            print(f"Removed {removed} leftover staging/working entries from {self.root}.")
+        return removed
+
+    def discard(self, staging_path: str):
+        shutil.rmtree(staging_path, ignore_errors=True)
+
+    def publish(self, staging_path: str, base: Optional[int]) -> int:
+        """
+        Publishes a staged directory as the next generation. The check of
+        the current generation and the rename happen under a file lock in
+        `root`, so publishers in other processes cannot interleave.
+
+        Raises:
+          SnapshotConflictError: if the current generation is no longer
+            `base`, i.e. the staged changes were built on an outdated index.
+        """
+        with _publish_lock(self.root):
+            current = self.current()
+            if current != base:
+                self.discard(staging_path)
+                raise SnapshotConflictError(
+                    f"Index generation moved from {base} to {current} while this one was being built."
+                )
+
+            generation = max([current or 0] + self.generations()) + 1
+            os.rename(staging_path, self.path(generation))
+
+            tmp_path = os.path.join(self.root, f"{CURRENT_FILE}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(f"{generation}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, os.path.join(self.root, CURRENT_FILE))
+
+            self._prune(generation)
+        return generation
+
+    def _prune(self, current: int):
+        """Removes all but the `keep` newest generations."""
+        for generation in self.generations():
+            if generation <= current - self.keep:
+                shutil.rmtree(self.path(generation), ignore_errors=True)
+
+    def adopt(self, vector_path: str, bm25_path: str) -> Optional[int]:
+        """
+        Moves indexes saved before snapshots existed (at `vector_path` /
+        `bm25_path`) into the first generation, if nothing is published yet.
+        """
+        if self.current() is not None or not os.path.exists(vector_path):
+            return None
+        os.makedirs(self.root, exist_ok=True)
+        staging_path = self.stage()
+        os.rename(vector_path, self.vector_path(staging_path))
+        if os.path.exists(bm25_path):
+            os.rename(bm25_path, self.bm25_path(staging_path))
+        generation = self.publish(staging_path, None)
+        print(f"Moved the index at {vector_path} into snapshot generation {generation} under {self.root}.")
+        return generation
+
+
+class WriterLock:
+    """
+    Non-blocking, advisory lock on a file, held by at most one process.
+    The operating system releases it when the holder exits, so another
+    process can take over.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        """Takes the lock if it is free. Returns whether this process holds it."""
+        if self._file is not None:
+            return True
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lock_file = open(self.path, "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            return False
+
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
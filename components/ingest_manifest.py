@@ -0,0 +1,94 @@
+import os
+import json
+import hashlib
+from typing import Dict, List, Tuple
+
+
+def file_sha256(file_path: str) -> str:
+    """
+    Hashes a file's content in 1MB blocks.
+
+    Args:
+      file_path (str): The path to the file.
+
+    Returns:
+      str: The hex SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    """
+    Records which files are in the index and which chunk ids they produced.
+
+    Each entry maps a file path to its size, mtime, content hash and chunk
+    ids, so a re-ingest can skip unchanged files, re-process modified ones
+    and delete the chunks of files that disappeared.
+    """
+
+    def __init__(self, path: str, entries: Dict[str, Dict] | None = None):
+        self.path = path
+        self.entries: Dict[str, Dict] = entries or {}
+
+    @classmethod
+    def load(cls, path: str) -> "IngestManifest":
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(path, json.load(f).get("files", {}))
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.entries}, f)
+        os.replace(tmp_path, self.path)
+
+    def diff(self, file_paths: List[str]) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Compares files on disk against the manifest.
+
+        Size and mtime are checked first; the content hash is only computed
+        when they differ, so unchanged corpora are scanned cheaply. Files whose
+        content hash still matches only get their stat info refreshed.
+
+        Returns:
+          Tuple[List[str], List[str], List[str]]: (added, modified, deleted) paths.
+        """
+        added, modified = [], []
+        for file_path in file_paths:
+            entry = self.entries.get(file_path)
+            if entry is None:
+                added.append(file_path)
+                continue
+
+            stat = os.stat(file_path)
+            if stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]:
+                continue
+
+            if file_sha256(file_path) == entry["sha256"]:
+                entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime
+            else:
+                modified.append(file_path)
+
+        on_disk = set(file_paths)
+        deleted = [file_path for file_path in self.entries if file_path not in on_disk]
+        return added, modified, deleted
+
+    def chunk_ids(self, file_paths: List[str]) -> List[str]:
+        return [chunk_id for file_path in file_paths for chunk_id in self.entries.get(file_path, {}).get("chunk_ids", [])]
+
+    def record(self, file_path: str, chunk_ids: List[str]):
+        stat = os.stat(file_path)
+        self.entries[file_path] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": file_sha256(file_path),
+            "chunk_ids": chunk_ids,
+        }
+
+    def remove(self, file_path: str):
+        self.entries.pop(file_path, None)
@@ -0,0 +1,131 @@
+import time
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_community.docstore.document import Document
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+from components.hybrid_retriever import with_score
+
+
+# Loaded cross-encoders by (model name, device), shared by every retriever rebuild
+_cross_encoders: Dict[Tuple[str, str], Any] = {}
+_cross_encoders_lock = threading.Lock()
+
+
+def load_cross_encoder(model_name: str, device: str = "cpu"):
+    """
+    Loads a sentence-transformers cross-encoder once per process (imported
+    here, so the package is only needed when reranking is enabled).
+    """
+    with _cross_encoders_lock:
+        model = _cross_encoders.get((model_name, device))
+        if model is None:
+            from sentence_transformers import CrossEncoder
+
+            print(f"Initializing cross-encoder: {model_name} on device: {device}")
+            model = CrossEncoder(model_name, device=device)
+            _cross_encoders[(model_name, device)] = model
+        return model
+
+
+class CrossEncoderReranker(BaseRetriever):
+    """
+    Reranks another retriever's results with a cross-encoder and keeps the
+    best `top_n`, each carrying its cross-encoder score as metadata["score"].
+
+    The first stage retrieves wide and cheaply; every (query, chunk) pair,
+    for every query of a batch, is scored in one batched forward pass. At
+    most `max_candidates` chunks per query are scored, fewer if the
+    measured cost per pair says more would not fit in `max_latency`
+    seconds. On the async path a pass that overruns the budget is not
+    waited for: the first-stage order is used instead, and a pass that
+    only gets a thread after its deadline is skipped rather than run.
+    """
+
+    retriever: BaseRetriever
+    model: Any
+    top_n: int = 4
+    max_candidates: int = 32
+    max_latency: float = 0.15
+    batch_size: int = 64
+
+    # Moving average of the scoring cost per pair, in seconds
+    _pair_seconds: float = PrivateAttr(default=0.0)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def _candidate_count(self, available: int) -> int:
+        count = min(available, self.max_candidates)
+        if self._pair_seconds > 0:
+            count = min(count, max(self.top_n, int(self.max_latency / self._pair_seconds)))
+        return count
+
+    def _score(self, pairs: List[List[str]]) -> List[float]:
+        start_time = time.perf_counter()
+        scores = self.model.predict(pairs, batch_size=max(self.batch_size, len(pairs)), show_progress_bar=False)
+        per_pair = (time.perf_counter() - start_time) / len(pairs)
+        with self._lock:
+            self._pair_seconds = per_pair if self._pair_seconds == 0 else 0.8 * self._pair_seconds + 0.2 * per_pair
+        return [float(score) for score in scores]
+
+    def rerank_batch(self, queries: List[str], results: List[List[Document]]) -> List[List[Document]]:
+        """
+        Reranks the first-stage results of several queries in one pass.
+        """
+        candidates = [docs[:self._candidate_count(len(docs))] for docs in results]
+        pairs = [[query, doc.page_content] for query, docs in zip(queries, candidates) for doc in docs]
+        if not pairs:
+            return [[] for _ in queries]
+
+        scores = iter(self._score(pairs))
+        reranked = []
+        for docs in candidates:
+            scored = [(next(scores), doc) for doc in docs]
+            scored.sort(key=lambda item: item[0], reverse=True)
+            reranked.append([with_score(doc, score) for score, doc in scored[:self.top_n]])
+        return reranked
+
+    def rerank(self, query: str, docs: List[Document]) -> List[Document]:
+        return self.rerank_batch([query], [docs])[0]
+
+    def _rerank_until(self, query: str, docs: List[Document], deadline: float) -> Optional[List[Document]]:
+        # Queued behind other work for the whole budget: the caller has moved on
+        if time.monotonic() >= deadline:
+            return None
+        return self.rerank(query, docs)
+
+    def retrieve_batch(self, queries: List[str]) -> List[List[Document]]:
+        if hasattr(self.retriever, "retrieve_batch"):
+            results = self.retriever.retrieve_batch(queries)
+        else:
+            results = self.retriever.batch(queries)
+        return self.rerank_batch(queries, results)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        docs = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return self.rerank(query, docs)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        docs = await self.retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + self.max_latency
+        try:
+            reranked = await asyncio.wait_for(
+                loop.run_in_executor(None, self._rerank_until, query, docs, deadline), timeout=self.max_latency
+            )
+        except asyncio.TimeoutError:
+            reranked = None
+        if reranked is None:
+            print(f"Reranking exceeded {self.max_latency * 1000:.0f}ms; using first-stage order.")
+            return docs[:self.top_n]
+        return reranked
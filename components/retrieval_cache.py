@@ -0,0 +1,96 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_community.docstore.document import Document
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.retrievers import BaseRetriever
+
+from components.lru_cache import LRUCache
+
+
+def documents_size(docs: List[Document]) -> int:
+    """
+    Approximate memory footprint of a result list (its text), in bytes.
+    """
+    return sum(len(doc.page_content) for doc in docs) + 64 * len(docs)
+
+
+class CachedRetriever(BaseRetriever):
+    """
+    Caches the results of another retriever.
+
+    Keys are (normalized query, `params`, index generation). `params` holds
+    everything that changes results (k values, ensemble weights), and the
+    generation is read from `generation()` before each lookup, so results
+    computed against an older index can never be served after an ingestion.
+
+    `generation()` returns None once the wrapped retriever no longer
+    searches the current index (it was replaced by a newer generation);
+    the cache is then bypassed. Results are only stored if the generation
+    did not change while they were retrieved.
+    """
+
+    retriever: BaseRetriever
+    cache: LRUCache
+    generation: Callable[[], Optional[int]]
+    params: Tuple[Any, ...] = ()
+
+    def _key(self, query: str, generation: Optional[int]):
+        return (" ".join(query.lower().split()), self.params, generation)
+
+    def _lookup(self, key):
+        return None if key[-1] is None else self.cache.get(key)
+
+    def _store(self, key, docs: List[Document]):
+        if key[-1] is not None and self.generation() == key[-1]:
+            self.cache.set(key, docs)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        key = self._key(query, self.generation())
+        docs = self._lookup(key)
+        if docs is None:
+            docs = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+            self._store(key, docs)
+        return list(docs)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        key = self._key(query, self.generation())
+        docs = self._lookup(key)
+        if docs is None:
+            docs = await self.retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+            self._store(key, docs)
+        return list(docs)
+
+    def retrieve_batch(self, queries: List[str]) -> List[List[Document]]:
+        """
+        Serves cached queries and retrieves the rest in one batch, using the
+        wrapped retriever's `retrieve_batch` if it has one.
+        """
+        generation = self.generation()
+        keys = [self._key(query, generation) for query in queries]
+        results = [self._lookup(key) for key in keys]
+
+        # Duplicate queries within the batch are retrieved once
+        pending: Dict[Any, str] = {}
+        for key, query, docs in zip(keys, queries, results):
+            if docs is None:
+                pending.setdefault(key, query)
+
+        if pending:
+            missing_queries = list(pending.values())
+            if hasattr(self.retriever, "retrieve_batch"):
+                fetched = self.retriever.retrieve_batch(missing_queries)
+            else:
+                fetched = self.retriever.batch(missing_queries)
+            found = dict(zip(pending, fetched))
+            for key, docs in found.items():
+                self._store(key, docs)
+            results = [docs if docs is not None else found[key] for key, docs in zip(keys, results)]
+
+        return [list(docs) for docs in results]
@@ -0,0 +1,126 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class _Flight:
+    """
+    Events of one shared stream: everything produced so far is kept, so
+    a subscriber joining late replays it before following live events.
+    """
+
+    def __init__(self):
+        self.events: List[Any] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._signal = asyncio.Event()
+
+    def publish(self, event):
+        self.events.append(event)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.finished = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        self._signal.set()
+        self._signal = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator:
+        index = 0
+        while True:
+            signal = self._signal
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            await signal.wait()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical work (Go's singleflight).
+
+    The first caller for a key starts the work in its own task, so it
+    survives that caller leaving; callers arriving while it runs share it.
+    `run` awaits the same result; `stream` replays the events produced so
+    far and then follows the live ones, so every subscriber sees the whole
+    stream. A stream whose subscribers all left is cancelled. Finished
+    work is forgotten at once: keeping results is the caches' job.
+    """
+
+    def __init__(self):
+        self._results: Dict[Hashable, asyncio.Future] = {}
+        self._streams: Dict[Hashable, _Flight] = {}
+
+        self.started = 0
+        self.coalesced = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._results) + len(self._streams)
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable]):
+        """
+        Returns the result of `factory()`, shared with the concurrent calls
+        for the same key. A caller being cancelled does not cancel the work.
+        """
+        future = self._results.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._results[key] = future
+            future.add_done_callback(lambda done: self._forget(self._results, key, done))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)
+
+    async def stream(self, key: Hashable, factory: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """
+        Yields the events of `factory()`, shared with the concurrent
+        subscribers for the same key.
+        """
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._streams[key] = flight
+            flight.task = asyncio.ensure_future(self._produce(key, flight, factory))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        flight.subscribers += 1
+        try:
+            async for event in flight.follow():
+                yield event
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.finished:
+                # Nobody is listening any more; later callers start anew
+                self._forget(self._streams, key, flight)
+                flight.task.cancel()
+
+    async def _produce(self, key: Hashable, flight: _Flight, factory: Callable[[], AsyncIterator]):
+        error = None
+        try:
+            async for event in factory():
+                flight.publish(event)
+        except asyncio.CancelledError as e:
+            error = e
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            self._forget(self._streams, key, flight)
+            flight.finish(error)
+
+    @staticmethod
+    def _forget(flights: Dict, key: Hashable, flight):
+        if flights.get(key) is flight:
+            del flights[key]
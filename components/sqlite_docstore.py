@@ -0,0 +1,251 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Tuple
+
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.docstore.document import Document
+
+
+# SQLite caps the number of bound parameters per statement
+_MAX_PARAMS = 500
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    LangChain docstore keeping chunk text and metadata in a SQLite file.
+
+    Nothing is loaded up front: chunks are read on demand (single or bulk),
+    so memory does not grow with the corpus and opening the store is
+    constant-time. Writes are committed as they happen, so persisting the
+    FAISS store only has to write the index and the row -> id map.
+
+    With `base_path` the file at `path` is an overlay over another
+    docstore, which is only ever read: added chunks go to the overlay and
+    removed base chunks are recorded there, so a published docstore can
+    be shared (hard-linked) between generations and extended without
+    copying it.
+
+    Args:
+      path (str): The database file (the overlay if `base_path` is given).
+      read_only (bool): Open the file read-only (no writes, no schema changes).
+      base_path (str | None): The docstore the overlay at `path` extends.
+    """
+
+    def __init__(self, path: str, read_only: bool = False, base_path: str | None = None):
+        self.path = path
+        self.read_only = read_only
+        self.base_path = base_path
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        mode = "?mode=ro" if self.read_only else ""
+        conn = sqlite3.connect(f"file:{os.path.abspath(self.path)}{mode}", uri=True, check_same_thread=False)
+        if not self.read_only:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id TEXT PRIMARY KEY, page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            if self.base_path is not None:
+                conn.execute("CREATE TABLE IF NOT EXISTS removed (id TEXT PRIMARY KEY)")
+            conn.commit()
+        # Let SQLite read pages through mmap, sharing them via the OS page cache
+        conn.execute("PRAGMA mmap_size = 268435456")
+
+        # Reads go through `visible`: the base chunks not removed, then the overlay's own
+        if self.base_path is None:
+            conn.execute("CREATE TEMP VIEW visible AS SELECT 0 AS segment, rowid AS pos, * FROM main.chunks")
+        else:
+            conn.execute("ATTACH DATABASE ? AS base", (f"file:{os.path.abspath(self.base_path)}?mode=ro",))
+            conn.execute("PRAGMA base.mmap_size = 268435456")
+            conn.execute(
+                "CREATE TEMP VIEW visible AS "
+                "SELECT 0 AS segment, rowid AS pos, * FROM base.chunks WHERE id NOT IN (SELECT id FROM main.removed) "
+                "UNION ALL SELECT 1, rowid, * FROM main.chunks"
+            )
+        return conn
+
+    @staticmethod
+    def _to_document(doc_id: str, page_content: str, metadata: str) -> Document:
+        return Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM visible").fetchone()[0]
+
+    @property
+    def overlay_size(self) -> int:
+        """Chunks added or removed by the overlay (0 without a base)."""
+        if self.base_path is None:
+            return 0
+        with self._lock:
+            return sum(
+                self._conn.execute(f"SELECT COUNT(*) FROM main.{table}").fetchone()[0]
+                for table in ("chunks", "removed")
+            )
+
+    def search(self, search: str) -> Document | str:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, page_content, metadata FROM visible WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return self._to_document(*row)
+
+    def mget(self, ids: List[str]) -> List[Document | None]:
+        """
+        Fetches many chunks with one query per 500 ids.
+
+        Returns:
+          List[Document | None]: The chunks in the order of `ids` (None if unknown).
+        """
+        found: Dict[str, Document] = {}
+        with self._lock:
+            for start in range(0, len(ids), _MAX_PARAMS):
+                batch = ids[start:start + _MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT id, page_content, metadata FROM visible WHERE id IN ({placeholders})", batch
+                ).fetchall()
+                for row in rows:
+                    found[row[0]] = self._to_document(*row)
+        return [found.get(doc_id) for doc_id in ids]
+
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[Tuple[str, Document]]:
+        """
+        Streams every (id, chunk) pair in insertion order, `batch_size` rows at a time.
+        """
+        last = (0, 0)
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT segment, pos, id, page_content, metadata FROM visible "
+                    "WHERE (segment, pos) > (?, ?) ORDER BY segment, pos LIMIT ?",
+                    (*last, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for _, _, doc_id, page_content, metadata in rows:
+                yield doc_id, self._to_document(doc_id, page_content, metadata)
+            last = rows[-1][:2]
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        records = [
+            (doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False, default=str))
+            for doc_id, doc in texts.items()
+        ]
+        with self._lock:
+            if self.base_path is not None:
+                existing = self._existing_base_ids([record[0] for record in records])
+                if existing:
+                    raise ValueError(f"Tried to add ids that already exist: {sorted(existing)[:5]}")
+            try:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT INTO main.chunks (id, page_content, metadata) VALUES (?, ?, ?)", records
+                    )
+            except sqlite3.IntegrityError as e:
+                raise ValueError(f"Tried to add ids that already exist: {e}") from e
+
+    def _existing_base_ids(self, ids: List[str]) -> set:
+        """The ids visible through the base (not removed by the overlay)."""
+        existing = set()
+        for start in range(0, len(ids), _MAX_PARAMS):
+            batch = ids[start:start + _MAX_PARAMS]
+            placeholders = ",".join("?" * len(batch))
+            existing.update(
+                row[0] for row in self._conn.execute(
+                    f"SELECT id FROM visible WHERE segment = 0 AND id IN ({placeholders})", batch
+                )
+            )
+        return existing
+
+    def delete(self, ids: List) -> None:
+        with self._lock, self._conn:
+            for start in range(0, len(ids), _MAX_PARAMS):
+                batch = list(ids[start:start + _MAX_PARAMS])
+                placeholders = ",".join("?" * len(batch))
+                self._conn.execute(f"DELETE FROM main.chunks WHERE id IN ({placeholders})", batch)
+                if self.base_path is not None:
+                    self._conn.execute(
+                        f"INSERT OR IGNORE INTO main.removed SELECT id FROM base.chunks WHERE id IN ({placeholders})",
+                        batch,
+                    )
+
+    def move(self, path: str):
+        """
+        Atomically moves the database file to `path` (replacing any file
+        there) and reopens it. Connections other processes hold on the
+        replaced file keep reading their old copy until they reopen.
+        """
+        with self._lock:
+            self._conn.close()
+            os.replace(self.path, path)
+            self.path = path
+            self._conn = self._connect()
+
+    def copy_to(self, path: str) -> "SQLiteDocstore":
+        """
+        Writes a consistent copy of the database to `path` (replacing any
+        file there) with SQLite's online backup, and returns it opened
+        writable. An overlay is copied without its base, which the copy
+        shares. This store is left as it was.
+        """
+        if os.path.exists(path):
+            os.remove(path)
+        target = sqlite3.connect(path)
+        try:
+            with self._lock:
+                self._conn.backup(target)
+        finally:
+            target.close()
+        return SQLiteDocstore(path, base_path=self.base_path)
+
+    def branch(self, path: str) -> "SQLiteDocstore":
+        """
+        Returns a writable docstore at `path` with the same chunks, whose
+        changes never reach this store's files: a copy of the overlay over
+        the same base, or a new, empty overlay over this file.
+        """
+        if self.base_path is not None:
+            return self.copy_to(path)
+        if os.path.exists(path):
+            os.remove(path)
+        return SQLiteDocstore(path, base_path=self.path)
+
+    def flatten_to(self, path: str) -> "SQLiteDocstore":
+        """
+        Writes a standalone copy of the visible chunks to `path` (the base
+        with the overlay applied, replacing any file there) and returns it
+        opened writable.
+        """
+        if self.base_path is None:
+            return self.copy_to(path)
+        if os.path.exists(path):
+            os.remove(path)
+        target = sqlite3.connect(path)
+        try:
+            base = sqlite3.connect(f"file:{os.path.abspath(self.base_path)}?mode=ro", uri=True)
+            try:
+                base.backup(target)
+            finally:
+                base.close()
+            with self._lock:
+                target.execute("ATTACH DATABASE ? AS overlay", (f"file:{os.path.abspath(self.path)}?mode=ro",))
+                with target:
+                    target.execute("DELETE FROM chunks WHERE id IN (SELECT id FROM overlay.removed)")
+                    target.execute(
+                        "INSERT INTO chunks (id, page_content, metadata) "
+                        "SELECT id, page_content, metadata FROM overlay.chunks ORDER BY rowid"
+                    )
+                target.execute("DETACH DATABASE overlay")
+        finally:
+            target.close()
+        return SQLiteDocstore(path)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
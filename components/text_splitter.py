@@ -1,6 +1,6 @@
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-def split_documents(documents, chunk_size=1000, chunk_overlap=200):
+def split_documents(documents, chunk_size=1000, chunk_overlap=200, verbose=True):
   """
   Splits a list of documents into smaller chunks.
 
@@ -8,20 +8,25 @@ def split_documents(documents, chunk_size=1000, chunk_overlap=200):
     documents (list): The list of Document objects to split.
     chunk_size (int): The maximum size of each chunk (in characters).
     chunk_overlap (int): The number of characters to overlap between chunks.
+    verbose (bool): Whether to print progress messages.
 
   Returns:
     list: A list of smaller Document objects (chunks).
   """
 
-  print(f"Splitting {len(documents)} document(s) into chunks (size={chunk_size}, overlap={chunk_overlap})....")
+  if verbose:
+    print(f"Splitting {len(documents)} document(s) into chunks (size={chunk_size}, overlap={chunk_overlap})....")
   
   text_splitter = RecursiveCharacterTextSplitter(
     chunk_size = chunk_size,
     chunk_overlap = chunk_overlap,
-    length_function = len
+    length_function = len,
+    # Offsets let the context builder merge neighbouring chunks exactly
+    add_start_index = True
   )
 
   chunks = text_splitter.split_documents(documents)
 
-  print(f"Successfully split into {len(chunks)} chunks.")
+  if verbose:
+    print(f"Successfully split into {len(chunks)} chunks.")
   return chunks
\ No newline at end of file
@@ -0,0 +1,54 @@
+import threading
+from typing import Optional
+
+
+class TokenCounter:
+    """
+    Counts tokens with the LLM's Hugging Face tokenizer.
+
+    The tokenizer is loaded on first use. If it cannot be loaded (no
+    network, unknown name) counts fall back to an estimate of
+    `chars_per_token` characters per token, so budgets still hold roughly.
+    """
+
+    def __init__(self, tokenizer_name: Optional[str], chars_per_token: float = 4.0):
+        self.tokenizer_name = tokenizer_name
+        self.chars_per_token = chars_per_token
+
+        self._lock = threading.Lock()
+        self._tokenizer = None
+        self._loaded = False
+
+    def _get_tokenizer(self):
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                if self.tokenizer_name:
+                    try:
+                        from transformers import AutoTokenizer
+                        self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+                    except Exception as e:
+                        print(f"Could not load tokenizer '{self.tokenizer_name}' ({e}); estimating token counts.")
+            return self._tokenizer
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        tokenizer = self._get_tokenizer()
+        if tokenizer is None:
+            return max(1, round(len(text) / self.chars_per_token))
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Returns the longest prefix of `text` with at most `max_tokens` tokens.
+        """
+        if max_tokens <= 0:
+            return ""
+        tokenizer = self._get_tokenizer()
+        if tokenizer is None:
+            return text[:int(max_tokens * self.chars_per_token)]
+        token_ids = tokenizer.encode(text, add_special_tokens=False)
+        if len(token_ids) <= max_tokens:
+            return text
+        return tokenizer.decode(token_ids[:max_tokens])
@@ -0,0 +1,285 @@
+import os
+import copy
+import shutil
+from collections.abc import Mapping
+from typing import Iterator, List
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+from config import Config
+from components.faiss_index_factory import configure_loaded_store
+from components.sqlite_docstore import SQLiteDocstore
+
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+OVERLAY_FILE = "docstore-overlay.sqlite"
+ROW_IDS_FILE = "row_ids.npy"
+
+# Written by earlier versions; removed once the store is saved in the current layout
+_LEGACY_FILES = (
+    "index.pkl",
+    "chunks.jsonl",
+    "chunk_offsets.npy",
+    "chunk_ids.npy",
+    "chunk_ids_sorted.npy",
+    "chunk_rows_sorted.npy",
+)
+
+
+class RowIdMap(Mapping):
+    """
+    Lazy FAISS row -> docstore id mapping over a (memory-mapped) id array,
+    usable as a LangChain FAISS `index_to_docstore_id`.
+    """
+
+    def __init__(self, ids: np.ndarray):
+        self.ids = ids
+
+    def __getitem__(self, row: int) -> str:
+        if not 0 <= row < len(self.ids):
+            raise KeyError(row)
+        return self.ids[row].decode("utf-8")
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self.ids)))
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _write_row_ids(path: str, vector_store: FAISS):
+    ids: List[str] = [vector_store.index_to_docstore_id[row] for row in range(vector_store.index.ntotal)]
+    id_array = np.array([doc_id.encode("utf-8") for doc_id in ids], dtype=np.bytes_) if ids else np.zeros(0, dtype="S1")
+    tmp_path = os.path.join(path, f"{ROW_IDS_FILE}.tmp.npy")
+    np.save(tmp_path, id_array)
+    os.replace(tmp_path, os.path.join(path, ROW_IDS_FILE))
+
+
+def new_docstore(path: str) -> SQLiteDocstore:
+    """
+    Creates an empty docstore for building a new store under `path`.
+    `save_vector_store` moves it into place, replacing the current one.
+    """
+    os.makedirs(path, exist_ok=True)
+    building_path = os.path.join(path, f"{DOCSTORE_FILE}.new")
+    if os.path.exists(building_path):
+        os.remove(building_path)
+    return SQLiteDocstore(building_path)
+
+
+def open_docstore(path: str, read_only: bool = False) -> SQLiteDocstore:
+    """
+    Opens the docstore saved in directory `path`: its overlay over the
+    base file if there is one, otherwise the base file.
+    """
+    docstore_path = os.path.join(path, DOCSTORE_FILE)
+    overlay_path = os.path.join(path, OVERLAY_FILE)
+    if os.path.exists(overlay_path):
+        return SQLiteDocstore(overlay_path, read_only=read_only, base_path=docstore_path)
+    return SQLiteDocstore(docstore_path, read_only=read_only)
+
+
+def detach_docstore(vector_store: FAISS, path: str):
+    """
+    Sends the docstore writes of a store loaded from staged directory
+    `path` to an overlay there. The staged base file is hard-linked to the
+    published generation's and must not be written.
+    """
+    docstore = vector_store.docstore
+    if isinstance(docstore, SQLiteDocstore) and docstore.base_path is None:
+        vector_store.docstore = docstore.branch(os.path.join(path, OVERLAY_FILE))
+        docstore.close()
+
+
+def _link_or_copy(source: str, target: str):
+    if os.path.exists(target):
+        if os.path.samefile(source, target):
+            return
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        # Different file system, or no hard link support
+        shutil.copy2(source, target)
+
+
+def _save_docstore(docstore: SQLiteDocstore, path: str, max_overlay_chunks: int) -> SQLiteDocstore:
+    """
+    Writes `docstore` into directory `path` and returns the docstore to
+    keep using. An overlay is saved next to a hard link to its base, and
+    folded into a new base file once it holds more than
+    `max_overlay_chunks` changes.
+    """
+    docstore_path = os.path.join(path, DOCSTORE_FILE)
+    overlay_path = os.path.join(path, OVERLAY_FILE)
+    in_path = os.path.dirname(os.path.abspath(docstore.path)) == os.path.abspath(path)
+
+    if docstore.base_path is None:
+        if not in_path:
+            docstore.copy_to(docstore_path).close()
+        elif os.path.abspath(docstore.path) != os.path.abspath(docstore_path):
+            docstore.move(docstore_path)
+        return docstore
+
+    if docstore.overlay_size > max_overlay_chunks:
+        building_path = os.path.join(path, f"{DOCSTORE_FILE}.new")
+        docstore.flatten_to(building_path).move(docstore_path)
+        if in_path:
+            # The store was detached into this directory; it continues on the new base
+            docstore.close()
+            os.remove(overlay_path)
+            return SQLiteDocstore(docstore_path)
+        if os.path.exists(overlay_path):
+            os.remove(overlay_path)
+        return docstore
+
+    if not in_path:
+        _link_or_copy(docstore.base_path, docstore_path)
+        docstore.copy_to(overlay_path).close()
+    return docstore
+
+
+def save_vector_store(vector_store: FAISS, path: str, max_overlay_chunks: int = Config.DOCSTORE_OVERLAY_MAX_CHUNKS):
+    """
+    Saves a FAISS store: the index, the FAISS row -> docstore id map, and
+    the SQLite docstore. Chunk text is never pickled; a SQLite docstore is
+    already on disk (one built for `path` by `new_docstore` is moved into
+    place, one living elsewhere is copied and stays in use), and an
+    in-memory docstore is exported once and replaced by the file. Only the
+    overlay of an overlay docstore is copied; its base is hard-linked.
+
+    Args:
+      vector_store (FAISS): The store to save.
+      path (str): The target directory.
+      max_overlay_chunks (int): Overlay changes above which it is folded into a new base.
+    """
+    os.makedirs(path, exist_ok=True)
+    docstore_path = os.path.join(path, DOCSTORE_FILE)
+
+    docstore = vector_store.docstore
+    if isinstance(docstore, SQLiteDocstore):
+        vector_store.docstore = _save_docstore(docstore, path, max_overlay_chunks)
+    else:
+        exported = new_docstore(path)
+        ids = list(vector_store.index_to_docstore_id.values())
+        exported.add({doc_id: docstore.search(doc_id) for doc_id in ids})
+        exported.move(docstore_path)
+        vector_store.docstore = exported
+
+    tmp_index = os.path.join(path, f"{INDEX_FILE}.tmp")
+    faiss.write_index(vector_store.index, tmp_index)
+    os.replace(tmp_index, os.path.join(path, INDEX_FILE))
+    _write_row_ids(path, vector_store)
+
+    for file_name in _LEGACY_FILES:
+        legacy_path = os.path.join(path, file_name)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+
+def load_vector_store(path: str, embeddings, config: Config, read_only: bool | None = None) -> FAISS:
+    """
+    Loads a FAISS store saved by `save_vector_store`. Chunks stay in the
+    SQLite docstore and are fetched on demand, so loading does not depend
+    on the amount of corpus text.
+
+    With FAISS_LOAD_MODE 'memory' the index is read into the heap and the
+    store is writable. 'mmap' memory-maps the index vectors and the row id
+    map and opens the docstore read-only: startup does not depend on corpus
+    size, and the pages are shared between processes via the page cache.
+
+    Stores saved in the legacy pickled layout are loaded with
+    `FAISS.load_local` and converted on their next save.
+
+    Args:
+      path (str): The directory written by `save_vector_store`.
+      embeddings: Embedding function for queries.
+      config (Config): Supplies FAISS_LOAD_MODE and search parameters.
+      read_only (bool | None): Overrides the mode (False forces a writable store).
+
+    Returns:
+      FAISS: The loaded store.
+    """
+    if read_only is None:
+        read_only = config.FAISS_LOAD_MODE == "mmap"
+
+    docstore_path = os.path.join(path, DOCSTORE_FILE)
+    if not (os.path.exists(docstore_path) and os.path.exists(os.path.join(path, ROW_IDS_FILE))):
+        print(f"Loading legacy vector store from {path} (it is converted on the next save)...")
+        vector_store = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+        return configure_loaded_store(vector_store, config)
+
+    if read_only:
+        return _load_mmap(path, embeddings, config)
+
+    index = faiss.read_index(os.path.join(path, INDEX_FILE))
+    ids = np.load(os.path.join(path, ROW_IDS_FILE))
+    vector_store = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=open_docstore(path),
+        index_to_docstore_id={row: doc_id.decode("utf-8") for row, doc_id in enumerate(ids)},
+        distance_strategy=DistanceStrategy.EUCLIDEAN_DISTANCE,
+    )
+    return configure_loaded_store(vector_store, config)
+
+
+def _load_mmap(path: str, embeddings, config: Config) -> FAISS:
+    """
+    Opens a saved store without reading it into the heap: the FAISS vectors
+    and the row id map are memory-mapped, and chunk text is read on demand
+    from the read-only docstore (itself read through SQLite's mmap). All of
+    it is shared between processes through the page cache.
+    """
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    # Newer FAISS versions can also map flat/HNSW vector storage zero-copy
+    flags |= getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    index = faiss.read_index(os.path.join(path, INDEX_FILE), flags)
+
+    vector_store = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=open_docstore(path, read_only=True),
+        index_to_docstore_id=RowIdMap(np.load(os.path.join(path, ROW_IDS_FILE), mmap_mode="r")),
+        distance_strategy=DistanceStrategy.EUCLIDEAN_DISTANCE,
+    )
+    return configure_loaded_store(vector_store, config)
+
+
+def reopen_vector_store(vector_store: FAISS, path: str) -> FAISS:
+    """
+    Returns a store sharing `vector_store`'s FAISS index and row id map,
+    with the docstore saved at `path`. Used when a newer save left the
+    index files unchanged; `vector_store` itself is not modified.
+    """
+    reopened = copy.copy(vector_store)
+    reopened.docstore = open_docstore(path, read_only=is_read_only(vector_store))
+    return reopened
+
+
+def fetch_documents(vector_store: FAISS, ids: List[str]):
+    """
+    Fetches chunks by docstore id, in one query when the docstore supports it.
+    Unknown ids are skipped; returned documents always carry their id.
+    """
+    docstore = vector_store.docstore
+    if isinstance(docstore, SQLiteDocstore):
+        return [doc for doc in docstore.mget(ids) if doc is not None]
+
+    docs = []
+    for doc_id in ids:
+        doc = docstore.search(doc_id)
+        if isinstance(doc, str):
+            continue
+        # Documents pickled by older LangChain versions have no id
+        doc.id = doc.id or doc_id
+        docs.append(doc)
+    return docs
+
+
+def is_read_only(vector_store: FAISS) -> bool:
+    return getattr(vector_store.docstore, "read_only", False)
@@ -0,0 +1,78 @@
+import threading
+import time
+from typing import Callable
+
+
+class DebouncedWriter:
+    """
+    Runs a save callback in a background thread after changes settle.
+
+    Every `mark_dirty()` (re)starts a `delay` second timer, so a burst of
+    updates results in a single save. `max_delay` bounds how long a save
+    can be postponed under a continuous stream of updates.
+
+    A failed save leaves the changes dirty and is retried after `delay`;
+    the error is kept in `last_error` until a save succeeds.
+    """
+
+    def __init__(self, save_func: Callable[[], None], delay: float = 2.0, max_delay: float = 30.0):
+        self.save_func = save_func
+        self.delay = delay
+        self.max_delay = max_delay
+
+        self._lock = threading.Lock()
+        self._timer = None
+        self._first_dirty_at = None
+        self.last_error = None
+
+    @property
+    def dirty(self) -> bool:
+        return self._first_dirty_at is not None
+
+    def mark_dirty(self):
+        """
+        Schedules a save, postponing any pending one (up to `max_delay`).
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._first_dirty_at is None:
+                self._first_dirty_at = now
+
+            if self._timer is not None:
+                self._timer.cancel()
+
+            remaining = self.max_delay - (now - self._first_dirty_at)
+            self._timer = threading.Timer(max(0.0, min(self.delay, remaining)), self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self):
+        """
+        Drops any pending save without running it.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = None
+            self._first_dirty_at = None
+
+    def flush(self):
+        """
+        Runs the save now if there are unsaved changes.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = None
+            if self._first_dirty_at is None:
+                return
+            self._first_dirty_at = None
+
+        try:
+            self.save_func()
+        except Exception as e:
+            self.last_error = e
+            print(f"Error during background save: {e}. Retrying in {self.delay:g}s.")
+            self.mark_dirty()
+        else:
+            self.last_error = None
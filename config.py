@@ -8,23 +8,127 @@ class Config:
     
     # --- Directories ---
     DATA_DIRECTORY = './data'
-    VECTOR_DB_PATH = 'faiss_index'
-    BM25_INDEX_PATH = 'bm25_index.pkl'
+    INDEX_ROOT = 'index' # Generation-numbered snapshots (gen-N/faiss_index, gen-N/bm25_index) + CURRENT pointer
+    INDEX_SNAPSHOTS_KEEP = 3 # Published generations kept on disk; older ones are pruned
+    VECTOR_DB_PATH = 'faiss_index' # Pre-snapshot location, moved into INDEX_ROOT on first use
+    BM25_INDEX_PATH = 'bm25_index' # Pre-snapshot location (directory of .npy arrays + delta log)
+    INGEST_MANIFEST_PATH = 'ingest_manifest.json'
 
     # --- Models ---
     EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+    EMBEDDING_NORMALIZE = True # Unit-length embeddings; FAISS searches by inner product (cosine)
+    EMBEDDING_BACKEND = 'torch' # 'torch' (fp32), 'torch-int8' (dynamic quantization) or 'onnx' (ONNX Runtime)
+    EMBEDDING_ONNX_FILE = 'onnx/model_quint8_avx2.onnx' # Model file for the 'onnx' backend (None = fp32 onnx/model.onnx)
+    EMBEDDING_NUM_THREADS = 0 # CPU threads for embedding (0 = library default); check with --embedding-report
+
+    # --- FAISS Index ---
+    FAISS_INDEX_TYPE = 'flat' # 'flat' (exact), 'ivf' or 'hnsw' (approximate)
+    FAISS_IVF_NLIST = 1024 # Number of IVF lists (reduced automatically for small corpora)
+    FAISS_IVF_TRAIN_SIZE = 50_000 # Vectors sampled to train IVF
+    FAISS_IVF_NPROBE = 16 # Lists scanned per query (higher = better recall, slower)
+    FAISS_HNSW_M = 32 # Graph neighbours per node
+    FAISS_HNSW_EF_CONSTRUCTION = 200
+    FAISS_HNSW_EF_SEARCH = 64 # Candidate list size per query (higher = better recall, slower)
+    FAISS_LOAD_MODE = 'memory' # 'memory' (read-write) or 'mmap' (read-only, shared page cache, fast startup)
+
+    # --- Embedding Cache ---
+    EMBEDDING_CACHE_ENABLED = True
+    EMBEDDING_CACHE_PATH = 'embedding_cache.npz'
+    EMBEDDING_CACHE_MAX_ENTRIES = 200_000 # ~300MB for 384-dim float32 vectors
+    QUERY_EMBEDDING_CACHE_ENABLED = True
+    QUERY_EMBEDDING_CACHE_MAX_BYTES = 32 * 1024 * 1024
+    QUERY_EMBEDDING_CACHE_TTL_SECONDS = 3600
     
     # --- LLM (for RAG) ---
     LLM_BASE_URL = "http://localhost:1234/v1"
     LLM_MODEL_NAME = "phi-3-mini-4k-instruct"
     LLM_API_KEY = "not-needed-for-local" # Fetch from env or config in real scenarios
+    LLM_TOKENIZER_NAME = "microsoft/Phi-3-mini-4k-instruct" # Hugging Face tokenizer used to count prompt tokens
 
     # --- Ingestion Parameters ---
     MODEL_SAFE_CHUNK_SIZE = 1000
     MODEL_SAFE_CHUNK_OVERLAP = 200
-    INGESTION_BATCH_SIZE = 100
+    INGESTION_LOADER_WORKERS = 0 # Processes loading/splitting files (0 = one per CPU)
+    INGESTION_EMBED_BATCH_SIZE = 256 # Chunks per embedding call, across document boundaries
+    INGESTION_QUEUE_SIZE = 64 # Max batches buffered between pipeline stages
+    BM25_DELTA_COMPACT_THRESHOLD = 50 # Delta log records before the BM25 snapshot is rewritten
+    PERSIST_DEBOUNCE_SECONDS = 2.0 # Quiet period before in-memory index changes are saved
+    PERSIST_MAX_DELAY_SECONDS = 30.0 # Upper bound on how long a save can be postponed
+    DOCSTORE_OVERLAY_MAX_CHUNKS = 10_000 # Chunk changes kept in a generation's docstore overlay before it is folded into a new base file
+
+    # --- Upload Queue Parameters ---
+    INGEST_QUEUE_WINDOW_SECONDS = 0.5 # Uploads arriving within this window are ingested together
+    INGEST_QUEUE_MAX_BATCH = 32 # Max documents per ingestion batch
+    INGEST_QUEUE_MAX_PENDING = 1000 # Uploads waiting beyond this are rejected
+    INGEST_JOB_HISTORY = 1000 # Job statuses kept for the status endpoint
+
+    # --- Multi-worker API ---
+    API_WORKERS = 1 # >1 enables multi-worker mode; set it to N when running `uvicorn api:app --workers N` ('mmap' FAISS_LOAD_MODE shares index pages between workers)
+    INDEX_WATCH_INTERVAL_SECONDS = 1.0 # How often each worker checks for a newly published index generation
+    WRITER_LOCK_FILE = 'writer.lock' # In INDEX_ROOT; the worker holding it is the only one ingesting uploads
+    UPLOAD_SPOOL_DIRECTORY = 'upload_spool' # Uploads accepted by any worker, waiting for the writer
+    UPLOAD_SPOOL_POLL_SECONDS = 0.2 # How often the writer claims spooled uploads
 
     # --- Retriever Parameters ---
     FAISS_RETRIEVER_K = 2 # Number of results from FAISS
     BM25_RETRIEVER_K = 2  # Number of results from BM25
-    ENSEMBLE_WEIGHTS = [0.5, 0.5] # Weights for [BM25, FAISS]
\ No newline at end of file
+    ENSEMBLE_WEIGHTS = [0.5, 0.5] # Weights for [BM25, FAISS]
+
+    # --- Hybrid Retrieval ---
+    HYBRID_RETRIEVER_ENABLED = True # Single-pass hybrid retriever instead of the EnsembleRetriever
+    HYBRID_K = 4 # Chunks returned after fusion
+    HYBRID_DENSE_POOL = 20 # FAISS candidates fetched before fusion
+    HYBRID_LEXICAL_POOL = 20 # BM25 candidates fetched before fusion
+    HYBRID_FUSION = 'rrf' # 'rrf' (reciprocal rank fusion) or 'blend' (normalized score blending)
+    HYBRID_RRF_C = 60 # RRF rank constant
+
+    # --- Reranking ---
+    RERANK_ENABLED = False # Rerank a wide first stage with a CPU cross-encoder
+    RERANK_MODEL_NAME = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+    RERANK_CANDIDATES = 20 # First-stage results fetched per retriever when reranking
+    RERANK_MAX_CANDIDATES = 32 # Most chunks scored per query
+    RERANK_TOP_N = 4 # Chunks kept for generation
+    RERANK_MAX_LATENCY_MS = 150 # Scoring budget; candidates are cut to fit, first-stage order is used on overrun
+
+    # --- Batch Requests ---
+    BATCH_MAX_QUERIES = 1000 # Largest accepted /retrieve/batch or /chat/batch request
+    BATCH_LLM_CONCURRENCY = 8 # LLM calls in flight per batch (LLM_CONCURRENCY still applies)
+
+    # --- Admission Control ---
+    ADMISSION_MAX_IN_FLIGHT = 16 # Query requests (/chat, /chat/stream, batch endpoints) processed at once, per API worker
+    ADMISSION_MAX_QUEUE = 64 # Requests waiting for a slot; beyond this they are rejected at once (429)
+    ADMISSION_QUEUE_TIMEOUT_SECONDS = 10.0 # Max wait for a slot (503 past it, or at once if the expected wait is longer)
+    EMBEDDING_CONCURRENCY = 4 # Concurrent query embedding calls (0 = unlimited)
+    RETRIEVAL_CONCURRENCY = 8 # Concurrent retrievals (0 = unlimited)
+    LLM_CONCURRENCY = 2 # Concurrent calls to the LLM at LLM_BASE_URL, per API worker (0 = unlimited)
+
+    # --- Chat Sessions ---
+    SESSION_MAX_SESSIONS = 10_000 # Least recently used sessions are evicted beyond this
+    SESSION_TTL_SECONDS = 3600 # Idle sessions expire after this
+    SESSION_DB_FILE = 'sessions.sqlite' # In UPLOAD_SPOOL_DIRECTORY; shares sessions between API workers when API_WORKERS > 1 (in memory otherwise)
+    HISTORY_MAX_TOKENS = 1024 # History (summary included) sent to the rephrase and answer prompts
+    HISTORY_SUMMARY_ENABLED = False # Summarize session turns that fall out of the window with the LLM
+    HISTORY_SUMMARY_MAX_TOKENS = 256
+
+    # --- Context Assembly ---
+    CONTEXT_MAX_TOKENS = 2048 # Retrieved-context tokens sent to the answer prompt
+    CONTEXT_MERGE_MIN_OVERLAP = 20 # Characters chunks of the same source must share to be merged
+
+    # --- Speculative Retrieval (follow-up questions) ---
+    SPECULATIVE_RETRIEVAL_ENABLED = True # Retrieve on the raw follow-up while the LLM rephrases it
+    SPECULATIVE_SIMILARITY_THRESHOLD = 0.9 # Cosine similarity to the rephrased question needed to reuse results
+    REPHRASE_CACHE_MAX_ENTRIES = 4096
+    REPHRASE_CACHE_TTL_SECONDS = 3600
+
+    # --- Single-Flight ---
+    SINGLE_FLIGHT_ENABLED = True # Identical concurrent questions / retrieval batches share one pipeline run
+
+    # --- Retrieval Cache ---
+    RETRIEVAL_CACHE_ENABLED = True
+    RETRIEVAL_CACHE_MAX_ENTRIES = 2048
+    RETRIEVAL_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+    # --- Answer Cache (first-turn questions only) ---
+    ANSWER_CACHE_ENABLED = False
+    ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95 # Cosine similarity needed to reuse an answer
+    ANSWER_CACHE_MAX_ENTRIES = 1000
\ No newline at end of file
@@ -0,0 +1,16 @@
+from pydantic import BaseModel
+from typing import Dict
+
+class LimiterStatus(BaseModel):
+    limit: int
+    active: int
+    waiting: int
+    admitted: int
+    rejected: int
+    timed_out: int
+    avg_hold_seconds: float
+
+class AdmissionStatus(BaseModel):
+    queue_depth: int
+    requests: LimiterStatus
+    stages: Dict[str, LimiterStatus]
\ No newline at end of file
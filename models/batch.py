@@ -0,0 +1,27 @@
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional, Tuple
+
+from models.chat import ChatRequest
+
+class BatchRetrieveRequest(BaseModel):
+    queries: List[str]
+
+class RetrievedChunk(BaseModel):
+    source: str
+    content: str
+    metadata: Dict[str, Any] = {}
+
+class BatchRetrieveResult(BaseModel):
+    index: int
+    query: str
+    chunks: List[RetrievedChunk]
+
+class BatchChatRequest(BaseModel):
+    requests: List[ChatRequest]
+
+class BatchChatResult(BaseModel):
+    index: int
+    query: str
+    answer: Optional[str] = None
+    history: List[Tuple[str, str]] = []
+    error: Optional[str] = None
@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+from typing import Optional
+
+class CacheStats(BaseModel):
+    entries: int
+    bytes: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+
+class CacheStatus(BaseModel):
+    query_embeddings: Optional[CacheStats]
+    retrieval: Optional[CacheStats]
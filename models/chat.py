@@ -1,10 +1,17 @@
 from pydantic import BaseModel
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 class ChatRequest(BaseModel):
     query: str
     history: List[Tuple[str, str]] = []
+    session_id: Optional[str] = None # Use server-side history instead of `history`
 
 class ChatResponse(BaseModel):
     answer: str
-    history: List[Tuple[str, str]]
\ No newline at end of file
+    history: List[Tuple[str, str]] = [] # Echoed only for requests without a session
+    session_id: Optional[str] = None
+
+class SessionInfo(BaseModel):
+    session_id: str
+    history: List[Tuple[str, str]] = [] # Turns still in the history window
+    summary: str = ""
\ No newline at end of file
@@ -1,5 +1,17 @@
 from pydantic import BaseModel
+from typing import Optional
 
 class UploadResponse(BaseModel):
     message: str
-    filename: str
\ No newline at end of file
+    filename: str
+    job_id: str
+    status: str
+
+class IngestionJobStatus(BaseModel):
+    job_id: str
+    filename: str
+    status: str
+    chunks: int
+    error: Optional[str] = None
+    submitted_at: float
+    finished_at: Optional[float] = None
\ No newline at end of file
@@ -0,0 +1,103 @@
+import asyncio
+from typing import AsyncIterator, Dict, List, Tuple
+
+from config import Config
+from components.admission import AdmissionController
+from components.context_builder import ContextBuilder
+from components.token_counter import TokenCounter
+from langchain_community.docstore.document import Document
+from providers.chain_provider import ChainProvider, history_to_messages
+
+
+async def retrieve_batch(retriever, queries: List[str]) -> List[List[Document]]:
+    """
+    Retrieves documents for many queries. Retrievers with a `retrieve_batch`
+    method (hybrid, cached) embed and search all queries at once; others
+    fall back to LangChain's concurrent `abatch`.
+    """
+    if hasattr(retriever, "retrieve_batch"):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, retriever.retrieve_batch, queries)
+    return await retriever.abatch(queries)
+
+
+class BatchRunner:
+    """
+    Runs many retrieval or chat requests together, sharing the expensive work.
+
+    Retrieval embeds all queries in one model call and runs one FAISS search
+    and one BM25 matrix product for the whole batch. Chat first rephrases
+    follow-up questions, retrieves context for all standalone questions in
+    one batch, then generates the answers with at most
+    BATCH_LLM_CONCURRENCY LLM calls in flight, yielding them as they finish.
+    The retrieval and each LLM call also hold a slot of the matching
+    `admission` stage, shared with the other requests.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        retriever,
+        llm,
+        chain_provider: ChainProvider,
+        context_builder: ContextBuilder = None,
+        admission: AdmissionController = None,
+    ):
+        self.config = config
+        self.retriever = retriever
+        self.admission = admission or AdmissionController(config)
+        self.context_builder = context_builder or ContextBuilder(
+            TokenCounter(config.LLM_TOKENIZER_NAME), config.CONTEXT_MAX_TOKENS, config.CONTEXT_MERGE_MIN_OVERLAP
+        )
+        self.rephrase_chain = chain_provider.get_rephrase_chain(llm)
+        self.answer_chain = chain_provider.get_answer_chain(llm)
+
+    async def retrieve(self, queries: List[str]) -> List[List[Document]]:
+        async with self.admission.stage("retrieval"):
+            return await retrieve_batch(self.retriever, queries)
+
+    async def chat(self, requests: List[Tuple[str, List[Tuple[str, str]]]]) -> AsyncIterator[Dict]:
+        """
+        Answers (query, chat_history) requests.
+
+        Yields:
+          Dict: {"index", "query", "answer"} per request in completion order,
+          with "error" instead of "answer" if that request failed.
+        """
+        semaphore = asyncio.Semaphore(self.config.BATCH_LLM_CONCURRENCY)
+
+        # 1. Standalone questions (first turns are used as they are)
+        async def standalone(query: str, chat_history: List[Tuple[str, str]]) -> str:
+            if not chat_history:
+                return query
+            async with semaphore, self.admission.stage("llm"):
+                try:
+                    return await self.rephrase_chain.ainvoke(
+                        {"input": query, "chat_history": history_to_messages(chat_history)}
+                    )
+                except Exception as e:
+                    print(f"Rephrasing failed ({e}); retrieving with the raw follow-up.")
+                    return query
+
+        questions = await asyncio.gather(*(standalone(query, history) for query, history in requests))
+
+        # 2. One batched retrieval for every request
+        contexts = await self.retrieve(list(questions))
+
+        # 3. Answer generation, capped and streamed in completion order
+        async def answer(index: int) -> Dict:
+            query, chat_history = requests[index]
+            async with semaphore, self.admission.stage("llm"):
+                try:
+                    context, _ = self.context_builder.build(contexts[index])
+                    text = await self.answer_chain.ainvoke({
+                        "input": query,
+                        "chat_history": history_to_messages(chat_history),
+                        "context": context,
+                    })
+                    return {"index": index, "query": query, "answer": text}
+                except Exception as e:
+                    return {"index": index, "query": query, "error": str(e)}
+
+        for next_result in asyncio.as_completed([answer(index) for index in range(len(requests))]):
+            yield await next_result
@@ -1,10 +1,21 @@
 from components.format_docs import format_docs
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
-from langchain_classic.chains.combine_documents import create_stuff_documents_chain
-from langchain_classic.chains.history_aware_retriever import create_history_aware_retriever
-from langchain_core.runnables import RunnableLambda, RunnablePassthrough
-from typing import cast
+from langchain_core.runnables import RunnablePassthrough
+from langchain_core.messages import AIMessage, HumanMessage
+from typing import List, Tuple
+
+
+def history_to_messages(chat_history: List[Tuple[str, str]]):
+    """
+    Converts (human, ai) turn pairs into chat messages.
+    """
+    messages = []
+    for human, ai in chat_history:
+        messages.append(HumanMessage(content=human))
+        messages.append(AIMessage(content=ai))
+    return messages
+
 
 class ChainProvider:
     """
@@ -34,6 +45,18 @@ class ChainProvider:
         Answer:
         """
 
+        self.summary_template = """
+        Progressively summarize the conversation, adding the new lines to the
+        previous summary. Keep names, facts and open questions. Be brief.
+
+        Previous summary:
+        {summary}
+
+        New lines of conversation:
+        {conversation}
+
+        New summary:"""
+
         
     
     # For CLI purpose
@@ -66,48 +89,29 @@ class ChainProvider:
         print("RAG chain initialized.")
         return rag_chain
     
-    # conversational chain
-    def get_conversational_chain(self, retriever, llm):
+    def get_rephrase_chain(self, llm):
         """
-        Builds and returns the conversational RAG chain.
+        Builds the chain turning a follow-up ("input" + "chat_history") into a standalone question.
         """
-        print("Initializing Conversational RAG chain...")
-
-        # 1. Build rephrasing chain
         rephrase_prompt = ChatPromptTemplate.from_template(self.rephrase_template)
-        rephrasing_chain = (
-            rephrase_prompt
-            | llm
-            | StrOutputParser()
-        )
+        return rephrase_prompt | llm | StrOutputParser()
 
-        history_aware_retriever = create_history_aware_retriever(
-            llm, retriever, rephrase_prompt
-        )
-
-        # 3. Build the Answer-Generation Chain
+    def get_answer_chain(self, llm):
+        """
+        Builds the answer-generation chain over an already formatted
+        "context" (plus "input" and "chat_history").
+        """
         answer_prompt = ChatPromptTemplate.from_messages([
             ("system", self.answer_template),
             MessagesPlaceholder(variable_name="chat_history"),
             ("user", "{input}")
         ])
+        return answer_prompt | llm | StrOutputParser()
 
-        answer_chain = (
-            answer_prompt
-            | llm
-            | StrOutputParser()
-        )
-
-        # 4. Combine into Conversational RAG Chain
-        conversational_rag_chain = (
-            RunnablePassthrough.assign(
-                context=history_aware_retriever
-            )
-            | 
-            RunnablePassthrough.assign(context = lambda x: format_docs(x["context"]))
-            | answer_chain
-        )
-
-        print("Conversational RAG chain initialized.")
-        # answer part of the final dictionary
-        return conversational_rag_chain
\ No newline at end of file
+    def get_summary_chain(self, llm):
+        """
+        Builds the chain folding conversation lines ("conversation") into a
+        rolling "summary".
+        """
+        summary_prompt = ChatPromptTemplate.from_template(self.summary_template)
+        return summary_prompt | llm | StrOutputParser()
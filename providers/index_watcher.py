@@ -0,0 +1,84 @@
+import os
+import asyncio
+from typing import Optional
+
+from config import Config
+from components.index_snapshots import WriterLock
+from providers.ingestion_queue import IngestionQueue
+
+
+class IndexWatcher:
+    """
+    Multi-worker mode (`uvicorn api:app --workers N`): runs in every API
+    worker next to its RAGSystem.
+
+    Every INDEX_WATCH_INTERVAL_SECONDS it checks the published index
+    generation and, when it moved, loads the new one (reusing the BM25 base
+    segment; the FAISS index is reloaded after uploads). It also tries to take the writer lock: the
+    worker holding it runs the only IngestionQueue, fed from the upload
+    spool every worker writes to. Its uploads become visible to the other
+    workers once they are persisted (PERSIST_DEBOUNCE_SECONDS after the
+    last upload, at most PERSIST_MAX_DELAY_SECONDS after the first) and
+    the next check runs. If the writer exits, the lock is released and another
+    worker takes over.
+    """
+
+    def __init__(self, config: Config, rag_system, spool):
+        self.config = config
+        self.rag_system = rag_system
+        self.spool = spool
+
+        self.writer_lock = WriterLock(os.path.join(self.config.INDEX_ROOT, self.config.WRITER_LOCK_FILE))
+        self.ingestion_queue: Optional[IngestionQueue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_writer(self) -> bool:
+        return self.ingestion_queue is not None
+
+    def start(self):
+        """
+        Starts watching on the running event loop.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops watching and, on the writer, ingests the uploads it already
+        claimed. The writer lock is kept until `release()`, after the last
+        changes are persisted.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.ingestion_queue is not None:
+            await self.ingestion_queue.stop()
+
+    def release(self):
+        self.writer_lock.release()
+
+    async def check(self):
+        """
+        Takes over ingestion if no other worker holds the writer lock, then
+        moves to the newest published generation.
+        """
+        if self.ingestion_queue is None and self.writer_lock.acquire():
+            print(f"[IndexWatcher] Worker {os.getpid()} is now the ingestion writer.")
+            await self.rag_system.become_ingestion_writer()
+            self.ingestion_queue = IngestionQueue(self.config, self.rag_system, spool=self.spool)
+            self.ingestion_queue.start()
+
+        await self.rag_system.refresh_index()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                print(f"[IndexWatcher] Check failed: {e}")
+            await asyncio.sleep(self.config.INDEX_WATCH_INTERVAL_SECONDS)
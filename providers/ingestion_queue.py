@@ -0,0 +1,216 @@
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+from config import Config
+
+
+class IngestionJob:
+    """
+    Status record for a single uploaded document.
+    """
+
+    def __init__(self, filename: str):
+        self.job_id = uuid.uuid4().hex
+        self.filename = filename
+        self.status = "queued"  # queued -> processing -> done | failed
+        self.chunks = 0
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "filename": self.filename,
+            "status": self.status,
+            "chunks": self.chunks,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "IngestionJob":
+        job = cls(data["filename"])
+        for key, value in data.items():
+            setattr(job, key, value)
+        return job
+
+
+class IngestionQueue:
+    """
+    Background ingestion queue for uploaded documents.
+
+    A single worker task drains the queue, coalescing uploads that arrive
+    within `INGEST_QUEUE_WINDOW_SECONDS` (up to `INGEST_QUEUE_MAX_BATCH`
+    documents) into one `RAGSystem.add_documents_from_texts` call, i.e. one
+    embedding call, one index commit and one persistence step per batch.
+
+    With a `spool` (multi-worker mode), uploads accepted by any worker are
+    also claimed from it every UPLOAD_SPOOL_POLL_SECONDS, and job statuses
+    are written back to it. The spool keeps the text of an ingested upload
+    until the index generation holding it is published.
+    """
+
+    def __init__(self, config: Config, rag_system, spool=None):
+        self.config = config
+        self.rag_system = rag_system
+        self.spool = spool
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.config.INGEST_QUEUE_MAX_PENDING)
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._worker: Optional[asyncio.Task] = None
+        self._pump: Optional[asyncio.Task] = None
+        self._claimed: Set[str] = set()  # Spooled jobs queued or being ingested
+        # Ingested spooled jobs -> index generation they are published with
+        self._unpublished: Dict[str, int] = {}
+
+    def start(self):
+        """
+        Starts the background worker on the running event loop.
+        """
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        if self.spool is not None and self._pump is None:
+            self._pump = asyncio.create_task(self._claim_spooled())
+
+    async def stop(self):
+        """
+        Processes whatever is still queued, then stops the worker.
+        Spooled uploads not claimed yet stay in the spool.
+        """
+        if self._pump is not None:
+            self._pump.cancel()
+            try:
+                await self._pump
+            except asyncio.CancelledError:
+                pass
+            self._pump = None
+        if self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        if self._unpublished:
+            # Publish now so the spooled texts can be released
+            await asyncio.get_event_loop().run_in_executor(None, self.rag_system.flush_index)
+            self._release_published()
+
+    def submit(self, text_content: str, source_name: str) -> IngestionJob:
+        """
+        Queues a document for ingestion and returns its job immediately.
+        Raises asyncio.QueueFull if too many uploads are pending.
+        """
+        job = IngestionJob(source_name)
+        self._queue.put_nowait((job, text_content))
+        self._remember(job)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _remember(self, job: IngestionJob):
+        self._jobs[job.job_id] = job
+        # Forget the oldest jobs once the history is full
+        while len(self._jobs) > self.config.INGEST_JOB_HISTORY:
+            self._jobs.popitem(last=False)
+
+    def _report(self, jobs: List[IngestionJob]):
+        if self.spool is None:
+            return
+        for job in jobs:
+            try:
+                self.spool.update(job)
+            except OSError as e:
+                print(f"[IngestionQueue] Could not record status of job {job.job_id}: {e}")
+
+    def _release_published(self):
+        """Releases the spooled texts of jobs whose chunks are published."""
+        published = self.rag_system.published_generation
+        job_ids = [job_id for job_id, generation in self._unpublished.items() if generation <= published]
+        if not job_ids:
+            return
+        try:
+            self.spool.release(job_ids)
+        except OSError as e:
+            print(f"[IngestionQueue] Could not release spooled uploads: {e}")
+            return
+        for job_id in job_ids:
+            del self._unpublished[job_id]
+
+    async def _claim_spooled(self):
+        """
+        Moves uploads spooled by any worker into the queue, as long as it
+        has room, and releases the ones published since the last poll.
+        """
+        while True:
+            self._release_published()
+            free = self._queue.maxsize - self._queue.qsize()
+            if free > 0:
+                for job, text_content in self.spool.claim(self._claimed | self._unpublished.keys(), free):
+                    self._claimed.add(job.job_id)
+                    self._queue.put_nowait((job, text_content))
+                    self._remember(job)
+            await asyncio.sleep(self.config.UPLOAD_SPOOL_POLL_SECONDS)
+
+    async def _next_batch(self) -> List:
+        """
+        Waits for one upload, then collects more until the window closes
+        or the batch is full.
+        """
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.config.INGEST_QUEUE_WINDOW_SECONDS
+
+        while len(batch) < self.config.INGEST_QUEUE_MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            jobs = [job for job, _ in batch]
+            for job in jobs:
+                job.status = "processing"
+            self._report(jobs)
+
+            print(f"[IngestionQueue] Processing batch of {len(batch)} upload(s)...")
+            try:
+                chunk_counts = await self.rag_system.add_documents_from_texts(
+                    [(text_content, job.filename) for job, text_content in batch]
+                )
+                generation = self.rag_system.index_generation
+                for job, chunks in zip(jobs, chunk_counts):
+                    job.chunks = chunks
+                    job.status = "done"
+                    if job.job_id in self._claimed:
+                        self._unpublished[job.job_id] = generation
+            except Exception as e:
+                print(f"[IngestionQueue] Batch failed: {e}")
+                for job in jobs:
+                    job.status = "failed"
+                    job.error = str(e)
+            finally:
+                for job in jobs:
+                    job.finished_at = time.time()
+                self._report(jobs)
+                for job in jobs:
+                    self._claimed.discard(job.job_id)
+                    self._queue.task_done()
@@ -1,55 +1,260 @@
 import os
 import time
+import uuid
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from config import Config
-from typing import List, Callable
+from typing import List, Optional
 
-from components.document_loader import load_documents_lazy
+from components.bm25_index import IncrementalBM25Index
+from components.document_loader import list_document_paths, load_document
+from components.faiss_index_factory import create_vector_store, supports_removal, train_index
+from components.vector_store_io import detach_docstore, load_vector_store, new_docstore, save_vector_store
+from components.index_snapshots import IndexSnapshots, SnapshotConflictError
+from components.ingest_manifest import IngestManifest
+from components.sqlite_docstore import SQLiteDocstore
 from components.text_splitter import split_documents
 from langchain_community.vectorstores import FAISS
 from langchain_community.docstore.document import Document
 
 
+# Marks the end of a stage's output
+_DONE = object()
+
+
+def _load_and_split(file_path: str, chunk_size: int, chunk_overlap: int) -> Optional[List[Document]]:
+    """
+    Loads and splits a single file. Runs in a loader process.
+    Returns None if the file could not be loaded.
+    """
+    try:
+        docs = load_document(file_path)
+    except Exception as e:
+        print(f"Error loading {file_path}: {e}")
+        return None
+    return split_documents(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap, verbose=False)
+
+
 class Ingestor:
     """
     Responsible for the document ingestion pipeline.
     This process loads, splits, and create a persistent FAISS vector store.
+
+    The pipeline runs as three stages connected by bounded queues:
+      1. Loading + splitting in a process pool (one task per file).
+      2. Embedding in fixed-size chunk batches, independent of file boundaries.
+      3. A single writer adding the embedded batches to the FAISS store.
+
+    A manifest of ingested files (size, mtime, hash -> chunk ids) makes
+    re-runs incremental: only added/modified files go through the pipeline,
+    and chunks of modified/deleted files are removed from FAISS and BM25.
+
+    The result is built as the next index snapshot generation in a private
+    directory (an incremental run starts from a copy of the current one)
+    and published atomically, so readers never see partially written files.
     """
 
     def __init__(self, config: Config, embeddings):
         self.config = config
         self.embeddings = embeddings
 
-    def _process_batch_for_store(
-        self,
-        doc_batch: List[Document],
-        text_splitter_func: Callable[[List[Document]], List[Document]],
-        vector_store: FAISS | None,
-    ):
+    def _load_stage(self, file_paths: List[str], chunk_queue: queue.Queue, stats: dict, stop: threading.Event):
+        """
+        Stage 1: loads and splits files in a process pool, keeping at most
+        a few tasks per worker in flight, and forwards chunks in file order.
+        Files that fail to load are listed in `stats["failed"]`.
+        """
+        max_workers = self.config.INGESTION_LOADER_WORKERS or os.cpu_count() or 1
+        max_in_flight = max_workers * 2
+        context = multiprocessing.get_context("spawn")
+
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+                pending = []
+                paths = iter(file_paths)
+                while not stop.is_set():
+                    # Keep the pool busy without submitting every file up front
+                    for file_path in paths:
+                        pending.append((file_path, executor.submit(
+                            _load_and_split,
+                            file_path,
+                            self.config.MODEL_SAFE_CHUNK_SIZE,
+                            self.config.MODEL_SAFE_CHUNK_OVERLAP,
+                        )))
+                        if len(pending) >= max_in_flight:
+                            break
+                    if not pending:
+                        break
+
+                    file_path, future = pending.pop(0)
+                    chunks = future.result()
+                    if chunks is None:
+                        stats["failed"].append(file_path)
+                        continue
+                    stats["docs"] += 1
+                    if chunks:
+                        chunk_queue.put(chunks)
+        except Exception as e:
+            stats["error"] = e
+            stop.set()
+        finally:
+            chunk_queue.put(_DONE)
+
+    def _embed_stage(self, chunk_queue: queue.Queue, write_queue: queue.Queue, stats: dict, stop: threading.Event):
         """
-            Internal helper to split, embed, and add a single batch to the FAISS store.
+        Stage 2: regroups chunks into batches of INGESTION_EMBED_BATCH_SIZE and embeds them.
         """
+        batch_size = self.config.INGESTION_EMBED_BATCH_SIZE
+        buffer: List[Document] = []
+        loader_done = False
+
+        def embed(batch: List[Document]):
+            vectors = self.embeddings.embed_documents([chunk.page_content for chunk in batch])
+            write_queue.put((batch, vectors))
+
         try:
-            # 1. Split documents in the batch
-            chunks = text_splitter_func(doc_batch)
-            if not chunks:
-                print("Warning: No chunks created for this batch.")
-                return vector_store
-
-            # 2. Add to vector store
-            if vector_store is None:
-                print("Initializing vector store with first batch...")
-                vector_store = FAISS.from_documents(chunks, self.embeddings)
-            else:
-                vector_store.add_documents(chunks)
+            while not stop.is_set():
+                chunks = chunk_queue.get()
+                if chunks is _DONE:
+                    loader_done = True
+                    break
+                buffer.extend(chunks)
+                while len(buffer) >= batch_size:
+                    embed(buffer[:batch_size])
+                    buffer = buffer[batch_size:]
 
+            if buffer and not stop.is_set():
+                embed(buffer)
         except Exception as e:
-            print(f"Error processing batch: {e}")
+            stats["error"] = e
+            stop.set()
+        finally:
+            # Unblock the loader if we stopped early
+            while not loader_done:
+                loader_done = chunk_queue.get() is _DONE
+            write_queue.put(_DONE)
+
+    def _commit_batches(self, vector_store: FAISS, batches: List, stats: dict, written: dict):
+        """
+        Adds embedded batches to the store, training the index first if needed.
+        Records the new chunks and their ids (per source file) in `written`.
+        """
+        if not vector_store.index.is_trained:
+            vectors = np.array([vector for _, batch_vectors in batches for vector in batch_vectors], dtype=np.float32)
+            vector_store.index = train_index(vector_store.index, vectors, self.config)
+
+        for batch, vectors in batches:
+            ids = [str(uuid.uuid4()) for _ in batch]
+            vector_store.add_embeddings(
+                list(zip([chunk.page_content for chunk in batch], vectors)),
+                metadatas=[chunk.metadata for chunk in batch],
+                ids=ids,
+            )
+
+            written["chunks"].extend(batch)
+            written["ids"].extend(ids)
+            for chunk, chunk_id in zip(batch, ids):
+                written["ids_by_source"].setdefault(chunk.metadata.get("source"), []).append(chunk_id)
+
+            stats["chunks"] += len(batch)
+            print(f"Indexed {stats['chunks']} chunks from {stats['docs']} documents...")
+
+    def _write_stage(
+        self,
+        write_queue: queue.Queue,
+        stats: dict,
+        stop: threading.Event,
+        vector_store: FAISS | None,
+        written: dict,
+        vector_path: str,
+    ) -> FAISS | None:
+        """
+        Stage 3: the single writer adding embedded batches to the FAISS store.
+        Batches are held back until an untrained (IVF) index has
+        FAISS_IVF_TRAIN_SIZE vectors to train on.
+        """
+        pending, pending_vectors = [], 0
+        while True:
+            item = write_queue.get()
+            if item is _DONE:
+                break
+            if stop.is_set():
+                continue
+
+            batch, vectors = item
+            try:
+                if vector_store is None:
+                    print("Initializing vector store with first batch...")
+                    # Chunks go straight to a new on-disk docstore, moved into place on save
+                    vector_store = create_vector_store(
+                        self.embeddings,
+                        len(vectors[0]),
+                        self.config,
+                        docstore=new_docstore(vector_path),
+                    )
+
+                pending.append((batch, vectors))
+                pending_vectors += len(vectors)
+                if vector_store.index.is_trained or pending_vectors >= self.config.FAISS_IVF_TRAIN_SIZE:
+                    self._commit_batches(vector_store, pending, stats, written)
+                    pending, pending_vectors = [], 0
+            except Exception as e:
+                stats["error"] = e
+                stop.set()
+
+        if pending and not stop.is_set():
+            try:
+                self._commit_batches(vector_store, pending, stats, written)
+            except Exception as e:
+                stats["error"] = e
 
         return vector_store
 
-    def run(self):
+    def _load_vector_store(self, vector_path: str) -> FAISS:
+        # The Ingestor always needs a writable store
+        return load_vector_store(vector_path, self.embeddings, self.config, read_only=False)
+
+    def get_snapshots(self) -> IndexSnapshots:
+        """
+        The index snapshot root, adopting indexes saved before snapshots existed.
+        """
+        snapshots = IndexSnapshots(self.config.INDEX_ROOT, keep=self.config.INDEX_SNAPSHOTS_KEEP)
+        snapshots.adopt(self.config.VECTOR_DB_PATH, self.config.BM25_INDEX_PATH)
+        snapshots.sweep()
+        return snapshots
+
+    def _update_bm25(self, vector_store: FAISS, added_chunks: List[Document], added_ids: List[str], removed_ids: List[str], full_rebuild: bool, bm25_path: str):
+        """
+        Brings the persisted BM25 index in line with the FAISS store.
+        A full rebuild (or a missing index) builds a new snapshot; otherwise
+        only the removed/added chunks are applied and appended to the delta log.
+        """
+        if not full_rebuild and os.path.exists(bm25_path):
+            try:
+                bm25_index = IncrementalBM25Index.load(bm25_path)
+                bm25_index.remove_documents(removed_ids)
+                bm25_index.add_documents(added_chunks, added_ids)
+                bm25_index.append_delta(bm25_path, added_ids, removed_ids)
+                print(f"BM25 index updated (+{len(added_ids)} / -{len(removed_ids)} chunks).")
+                return
+            except Exception as e:
+                print(f"Could not update BM25 index ({e}). Rebuilding...")
+
+        bm25_index = IncrementalBM25Index.from_vector_store(
+            vector_store, compact_threshold=self.config.BM25_DELTA_COMPACT_THRESHOLD
+        )
+        bm25_index.save(bm25_path)
+        print(f"BM25 index rebuilt with {len(bm25_index)} chunks.")
+
+    def run(self, full_rebuild: bool = False):
         """
-        Runs the full document ingestion pipeline.
+        Runs the document ingestion pipeline.
+        Only new/changed files are processed unless `full_rebuild` is set
+        (or there is no manifest / index yet).
+        Returns the FAISS vector store (or None if nothing was ingested).
         """
         print("\nStarting Document Ingestion Pipeline...")
         start_time = time.perf_counter()
@@ -59,46 +264,122 @@ class Ingestor:
             print(f"Creating data directory: {self.config.DATA_DIRECTORY}")
             os.makedirs(self.config.DATA_DIRECTORY)
 
-        # 2. Set up document loader
-        print("Setting up lazy document loader and splitter...")
-        document_iterator = load_documents_lazy(self.config.DATA_DIRECTORY)
-        splitter_with_args = lambda docs: split_documents(
-            docs,
-            chunk_size=self.config.MODEL_SAFE_CHUNK_SIZE,
-            chunk_overlap=self.config.MODEL_SAFE_CHUNK_OVERLAP,
-        )
+        # 2. Discover documents and compare them with the manifest
+        file_paths = list_document_paths(self.config.DATA_DIRECTORY)
+        print(f"Found {len(file_paths)} documents in {self.config.DATA_DIRECTORY}")
+
+        snapshots = self.get_snapshots()
+        base_generation = snapshots.current()
+
+        manifest = IngestManifest.load(self.config.INGEST_MANIFEST_PATH)
+        full_rebuild = full_rebuild or not manifest.entries or base_generation is None
 
-        # 3. Process documents in batches
-        print(f"Starting batch ingestion (size: {self.config.INGESTION_BATCH_SIZE})...")
         vector_store = None
-        doc_batch = []
-        total_docs_processed = 0
-
-        for doc in document_iterator:
-            doc_batch.append(doc)
-            if len(doc_batch) >= self.config.INGESTION_BATCH_SIZE:
-                vector_store = self._process_batch_for_store(
-                    doc_batch, splitter_with_args, vector_store
-                )
-                total_docs_processed += len(doc_batch)
-                print(f"Processed {total_docs_processed} documents...")
-                doc_batch = []
-        
-        # 4. Process any remaining documents in the last batch
-        if doc_batch:
-            vector_store = self._process_batch_for_store(
-                doc_batch, splitter_with_args, vector_store
-            )
-            total_docs_processed += len(doc_batch)
-
-        # 5. Save the final vector store
-        if vector_store:
-            vector_store.save_local(self.config.VECTOR_DB_PATH)
-            print(f"\nFAISS index saved successfully to {self.config.VECTOR_DB_PATH}")
-            print(f"Total documents processed: {total_docs_processed}")
-            print("BM25 index will be created on first run.")
+        removed_ids: List[str] = []
+        if full_rebuild:
+            print("Running full rebuild...")
+            manifest = IngestManifest(self.config.INGEST_MANIFEST_PATH)
+            to_process, stale = file_paths, []
+            staging_path = snapshots.stage()
         else:
+            added, modified, deleted = manifest.diff(file_paths)
+            print(f"Incremental ingest: {len(added)} added, {len(modified)} modified, {len(deleted)} deleted.")
+            if not (added or modified or deleted):
+                manifest.save()
+                print("Index is up to date. Nothing to ingest.")
+                return self._load_vector_store(snapshots.vector_path(snapshots.path(base_generation)))
+
+            to_process, stale = added + modified, modified + deleted
+            # Changes are applied to a copy; the current generation stays untouched
+            staging_path = snapshots.stage(base_generation)
+            vector_store = self._load_vector_store(snapshots.vector_path(staging_path))
+            # The staged base docstore is shared with the current generation
+            detach_docstore(vector_store, snapshots.vector_path(staging_path))
+
+            # Remove chunks of modified/deleted files
+            existing_ids = set(vector_store.index_to_docstore_id.values())
+            removed_ids = [chunk_id for chunk_id in manifest.chunk_ids(stale) if chunk_id in existing_ids]
+            if removed_ids and not supports_removal(vector_store.index):
+                # IVF / HNSW indexes cannot drop rows in place
+                print("Index type does not support removing chunks. Running full rebuild...")
+                # Start from an empty directory: the staged copy holds the old overlay
+                if isinstance(vector_store.docstore, SQLiteDocstore):
+                    vector_store.docstore.close()
+                snapshots.discard(staging_path)
+                staging_path = snapshots.stage()
+                full_rebuild, vector_store, removed_ids = True, None, []
+                manifest = IngestManifest(self.config.INGEST_MANIFEST_PATH)
+                to_process, stale = file_paths, []
+            elif removed_ids:
+                vector_store.delete(removed_ids)
+                print(f"Removed {len(removed_ids)} stale chunks.")
+
+        # 3. Run the staged pipeline
+        print(
+            f"Starting pipelined ingestion (loader workers: {self.config.INGESTION_LOADER_WORKERS or os.cpu_count()}, "
+            f"embedding batch size: {self.config.INGESTION_EMBED_BATCH_SIZE})..."
+        )
+        stats = {"docs": 0, "chunks": 0, "error": None, "failed": []}
+        written = {"chunks": [], "ids": [], "ids_by_source": {}}
+        stop = threading.Event()
+        chunk_queue = queue.Queue(maxsize=self.config.INGESTION_QUEUE_SIZE)
+        write_queue = queue.Queue(maxsize=self.config.INGESTION_QUEUE_SIZE)
+
+        loader = threading.Thread(
+            target=self._load_stage, args=(to_process, chunk_queue, stats, stop), daemon=True
+        )
+        embedder = threading.Thread(
+            target=self._embed_stage, args=(chunk_queue, write_queue, stats, stop), daemon=True
+        )
+        loader.start()
+        embedder.start()
+        vector_path = snapshots.vector_path(staging_path)
+        vector_store = self._write_stage(write_queue, stats, stop, vector_store, written, vector_path)
+        embedder.join()
+        loader.join()
+
+        if stats["error"] is not None:
+            print(f"\nPipeline FAILED: {stats['error']}")
+            snapshots.discard(staging_path)
+            return None
+
+        if vector_store is None:
             print("\nPipeline FAILED: No documents were processed.")
+            snapshots.discard(staging_path)
+            return None
+
+        # 4. Save FAISS and BM25 into the staged generation and publish it,
+        # then save the manifest (last, so a crash re-processes)
+        save_vector_store(vector_store, vector_path, max_overlay_chunks=self.config.DOCSTORE_OVERLAY_MAX_CHUNKS)
+        self._update_bm25(
+            vector_store, written["chunks"], written["ids"], removed_ids, full_rebuild, snapshots.bm25_path(staging_path)
+        )
+        try:
+            generation = snapshots.publish(staging_path, base_generation)
+        except SnapshotConflictError as e:
+            print(f"\nPipeline FAILED: {e}")
+            return None
+        print(f"\nIndex generation {generation} published to {snapshots.path(generation)}")
 
-        end_time = time.perf_counter()
-        print(f"Total time taken: {end_time - start_time:.2f} seconds.")
\ No newline at end of file
+        # Files that failed to load are left out of the manifest, so the next run retries them
+        failed = set(stats["failed"])
+        for file_path in stale:
+            manifest.remove(file_path)
+        for file_path in to_process:
+            if file_path not in failed:
+                manifest.record(file_path, written["ids_by_source"].get(file_path, []))
+        manifest.save()
+        print(f"Total documents processed: {stats['docs']}")
+        if failed:
+            print(f"{len(failed)} document(s) could not be loaded and will be retried on the next run.")
+
+        # 5. Report throughput
+        elapsed = time.perf_counter() - start_time
+        print(f"Total time taken: {elapsed:.2f} seconds.")
+        if elapsed > 0:
+            print(
+                f"Throughput: {stats['docs'] / elapsed:.1f} docs/sec, "
+                f"{stats['chunks'] / elapsed:.1f} chunks/sec."
+            )
+
+        return vector_store
@@ -1,105 +1,591 @@
 import os
-import pickle
 import time
+import uuid
+import threading
+from typing import Any, Dict, List, Optional, Tuple
 from config import Config
 
-from langchain_community.vectorstores import FAISS
-from langchain_community.retrievers import BM25Retriever
+from components.bm25_index import IncrementalBM25Index, BM25IndexRetriever
+from components.embedding_cache import QueryCachedEmbeddings
+from components.hybrid_retriever import HybridRetriever, ReadLockedRetriever
+from components.reranker import CrossEncoderReranker, load_cross_encoder
+from components.vector_store_io import (
+    OVERLAY_FILE,
+    is_read_only,
+    load_vector_store,
+    open_docstore,
+    reopen_vector_store,
+    save_vector_store,
+)
+from components.index_snapshots import IndexSnapshots, SnapshotConflictError, segment_identity
+from components.sqlite_docstore import SQLiteDocstore
+from components.lru_cache import LRUCache
+from components.retrieval_cache import CachedRetriever, documents_size
+from components.write_behind import DebouncedWriter
+from components.rw_lock import ReadWriteLock
+from langchain_community.docstore.document import Document
 from langchain_classic.retrievers import EnsembleRetriever
 
 class RetrieverProvider:
     """
     Responsible for building and providing the ensemble retriever.
-    If the BM25 index is not pickled, it will be created from the FAISS docstore.
+    If the BM25 index is not saved yet, it will be created from the FAISS docstore.
+    Once loaded, the FAISS store and BM25 index stay resident in memory; new
+    chunks are added to them in place and persisted in the background.
+
+    Searches see uploads as soon as they are added: the resident FAISS
+    index and BM25 index are updated in place, under locks that keep
+    searches and updates apart, so they are not a frozen snapshot. Files
+    on disk are: uploaded chunk text goes to a private overlay over the
+    published docstore, and every save publishes a new generation (the
+    base docstore hard-linked, the overlay copied), so published files are
+    never modified. `refresh()` moves to a generation published by another
+    process; see there for which segments it can reuse.
     """
     def __init__(self, config: Config, embeddings):
         self.config = config
         self.embeddings = embeddings
+        self.query_embeddings = embeddings
+        if self.config.QUERY_EMBEDDING_CACHE_ENABLED:
+            # Used as the FAISS store's embedding function, so the dense
+            # side of the ensemble reuses embeddings of repeated queries.
+            self.query_embeddings = QueryCachedEmbeddings(
+                embeddings,
+                max_bytes=self.config.QUERY_EMBEDDING_CACHE_MAX_BYTES,
+                ttl=self.config.QUERY_EMBEDDING_CACHE_TTL_SECONDS,
+            )
+        self._vector_store = None
+        self._bm25_index = None
+        self._cross_encoder = None
+
+        self.snapshots = IndexSnapshots(self.config.INDEX_ROOT, keep=self.config.INDEX_SNAPSHOTS_KEEP)
+        self.snapshots.adopt(self.config.VECTOR_DB_PATH, self.config.BM25_INDEX_PATH)
+        self.snapshots.sweep()
+        # The published generation the resident indexes were loaded from
+        self.snapshot_generation = None
+        # File identities of its FAISS and BM25 segments, to detect which ones a newer generation shares
+        self._segments = {}
+        # Set in the process that ingests uploads: loads the store writable even in 'mmap' mode
+        self.ingestion_writer = False
+        # Overlay receiving uploads until the next save (None while the published docstore is in use)
+        self._working_docstore_path = None
+        self._pending_bm25: List[str] = []  # BM25 ids not yet appended to the delta log
+        # (chunks, ids, embeddings) added since the last publish, replayed by `_rebase()`
+        self._unpublished: List[Tuple[List[Document], List[str], List[List[float]]]] = []
+
+        # Bumped by every change to the indexes; part of every retrieval cache key
+        self.generation = 0
+        # `generation` as of the last published save: uploads added up to it are on disk
+        self.published_generation = 0
+        self.retrieval_cache = LRUCache(
+            max_entries=self.config.RETRIEVAL_CACHE_MAX_ENTRIES,
+            max_bytes=self.config.RETRIEVAL_CACHE_MAX_BYTES,
+            sizeof=documents_size,
+        )
+
+        # Guards mutations of the resident indexes and their persistence
+        self._lock = threading.RLock()
+        # Held shared by FAISS searches and exclusively while vectors are added
+        # (the BM25 index has its own)
+        self.index_lock = ReadWriteLock()
+        self._writer = DebouncedWriter(
+            self.persist,
+            delay=self.config.PERSIST_DEBOUNCE_SECONDS,
+            max_delay=self.config.PERSIST_MAX_DELAY_SECONDS,
+        )
         
-        if not os.path.exists(self.config.VECTOR_DB_PATH):
+        if self.snapshots.current() is None:
             raise FileNotFoundError(
-                f"Vector store not found at {self.config.VECTOR_DB_PATH}. "
+                f"No index published under {self.config.INDEX_ROOT}. "
                 "Please run the --ingest command first."
             )
 
+    def _snapshot_path(self) -> str:
+        return self.snapshots.path(self.snapshot_generation)
+
     def _load_faiss_store(self):
         """
-        Internal helper to load the FAISS vector store.
+        Internal helper to load the FAISS vector store of the current generation.
         """
-        if not os.path.exists(self.config.VECTOR_DB_PATH):
-            raise FileNotFoundError(f"Vector store not found at {self.config.VECTOR_DB_PATH}.")
-        
-        return FAISS.load_local(
-            self.config.VECTOR_DB_PATH,
-            self.embeddings,
-            allow_dangerous_deserialization=True,
+        generation = self.snapshots.current()
+        if generation is None:
+            raise FileNotFoundError(f"No index published under {self.config.INDEX_ROOT}.")
+
+        self.snapshot_generation = generation
+        print(f"Using index generation {generation}.")
+        vector_store = load_vector_store(
+            self.snapshots.vector_path(self._snapshot_path()), self.query_embeddings, self.config,
+            read_only=self._read_only(),
         )
+        self._record_segments()
+        return vector_store
+
+    def _read_only(self):
+        """Load mode override: the ingestion writer always needs a writable store."""
+        return False if self.ingestion_writer else None
+
+    def _record_segments(self):
+        snapshot_path = self._snapshot_path()
+        self._segments = {
+            "vector": segment_identity(self.snapshots.vector_path(snapshot_path)),
+        }
+        bm25_path = self.snapshots.bm25_path(snapshot_path)
+        if os.path.isdir(bm25_path):
+            self._segments["bm25"] = segment_identity(bm25_path)
+
+    def _publish(self, write, skip: tuple = ()):
+        """
+        Stages the next generation from the loaded one, lets `write(path)`
+        update the staged copy, and publishes it.
+        """
+        staging_path = self.snapshots.stage(self.snapshot_generation, skip=skip)
+        try:
+            write(staging_path)
+        except Exception:
+            self.snapshots.discard(staging_path)
+            raise
+        self.snapshot_generation = self.snapshots.publish(staging_path, self.snapshot_generation)
+        self._record_segments()
+        print(f"Index generation {self.snapshot_generation} published.")
     
 
     def _build_and_save_bm25(self, vector_store):
         """
-        Build the BM25 index from the FAISS docstore and save it to a pickle file (one-time operation, Memory-intensive).
+        Build the BM25 index from the FAISS docstore and save a snapshot (one-time operation).
         """
         print("\nWARNING: BM25 index not found...")
         print(f"Building new BM25 index from FAISS docstore...")
-        print("This is a one-time operation and may take a lot of memory.")
         start_time = time.perf_counter()
 
-        # 1. Extract all chunks from FAISS
-        all_chunks = []
+        # 1. Check the FAISS docstore
         if not vector_store.index_to_docstore_id:
             raise ValueError("FAISS docstore appears to be empty. Cannot init BM25.")
 
-        print(f"Extracting {len(vector_store.index_to_docstore_id)} chunks...")
-        for doc_id in vector_store.index_to_docstore_id.values():
-            all_chunks.append(vector_store.docstore.search(doc_id))
-        
-        if not all_chunks:
-            raise ValueError("No chunks found in FAISS docstore to initialize BM25.")
+        # 2. Build the index from every chunk (and its docstore id)
+        print(f"Initializing BM25 index with {len(vector_store.index_to_docstore_id)} chunks...")
+        bm25_index = IncrementalBM25Index.from_vector_store(
+            vector_store, compact_threshold=self.config.BM25_DELTA_COMPACT_THRESHOLD
+        )
 
-        # 2. Build the retriever
-        print(f"Initializing BM25 retriever with {len(all_chunks)} chunks...")
-        bm25_retriever = BM25Retriever.from_documents(all_chunks)
+        # 3. Save snapshot (as a new generation; readers of the mmap'd index cannot write)
+        if is_read_only(vector_store):
+            print("Index is loaded read-only; the BM25 index is kept in memory only.")
+        else:
+            print("Saving BM25 index...")
+            self._publish(lambda path: bm25_index.save(self.snapshots.bm25_path(path)))
 
-        # 3. Save to pickle
-        print(f"Saving BM25 index to {self.config.BM25_INDEX_PATH}...")
-        with open(self.config.BM25_INDEX_PATH, "wb") as f:
-            pickle.dump(bm25_retriever, f)
-        
         end_time = time.perf_counter()
         print(f"BM25 index built and saved in {end_time - start_time:.2f}s.")
-        
-        return bm25_retriever
-    
+
+        return bm25_index
+
+    def _load_or_build_bm25(self, vector_store):
+        """
+        Internal helper to load the BM25 index (snapshot + delta log),
+        falling back to a full build from the FAISS docstore.
+        """
+        bm25_path = self.snapshots.bm25_path(self._snapshot_path())
+        if os.path.exists(bm25_path):
+            print(f"Loading BM25 index from {bm25_path}...")
+            try:
+                return IncrementalBM25Index.load(
+                    bm25_path,
+                    mmap=self.config.FAISS_LOAD_MODE == "mmap",
+                    compact_threshold=self.config.BM25_DELTA_COMPACT_THRESHOLD,
+                )
+            except Exception as e:
+                # e.g. a legacy pickled index
+                print(f"Could not load BM25 index ({e}). Rebuilding...")
+
+        return self._build_and_save_bm25(vector_store)
+
+    def get_bm25_index(self, vector_store):
+        """
+        Returns the in-memory BM25 index, loading or building it on first access.
+        """
+        with self._lock:
+            if self._bm25_index is None:
+                self._bm25_index = self._load_or_build_bm25(vector_store)
+            return self._bm25_index
+
+    def update_bm25(self, vector_store, chunks: List[Document], ids: List[str]):
+        """
+        Adds newly ingested chunks to the in-memory BM25 index.
+        The delta is written to disk by the next `persist()`.
+        `vector_store` must already contain the chunks (used if a full build is needed).
+        """
+        with self._lock:
+            bm25_index = self.get_bm25_index(vector_store)
+
+            # A fresh build from the docstore already contains the new chunks
+            new_pairs = [(doc_id, chunk) for doc_id, chunk in zip(ids, chunks) if doc_id not in bm25_index]
+            if not new_pairs:
+                return bm25_index
+
+            new_ids = [doc_id for doc_id, _ in new_pairs]
+            new_chunks = [chunk for _, chunk in new_pairs]
+            bm25_index.add_documents(new_chunks, new_ids)
+            self._pending_bm25.extend(new_ids)
+            return bm25_index
+
     def get_vector_store(self):
         """
-        Public method to get the FAISS vector store.
+        Public method to get the resident FAISS vector store (loaded on first access).
         """
-        return self._load_faiss_store()
-    
+        with self._lock:
+            if self._vector_store is None:
+                self._vector_store = self._load_faiss_store()
+            return self._vector_store
+
+    def add_chunks(self, chunks: List[Document]) -> List[str]:
+        """
+        Embeds and adds chunks to the resident FAISS store and BM25 index,
+        then schedules a background save. Returns the new docstore ids.
+        """
+        if is_read_only(self.get_vector_store()):
+            raise RuntimeError(
+                "The index is loaded read-only (FAISS_LOAD_MODE='mmap'); "
+                "ingestion is disabled in this process."
+            )
+
+        # Explicit ids keep FAISS and BM25 entries aligned.
+        ids = [str(uuid.uuid4()) for _ in chunks]
+
+        # Embed outside the lock so searches and other uploads are not blocked
+        embeddings = self.embeddings.embed_documents([chunk.page_content for chunk in chunks])
+
+        with self._lock:
+            self._add_embedded(chunks, ids, embeddings)
+            self._unpublished.append((chunks, ids, embeddings))
+            self._bump_generation()
+
+        self._writer.mark_dirty()
+        return ids
+
+    def _add_embedded(self, chunks: List[Document], ids: List[str], embeddings: List[List[float]]):
+        """Adds embedded chunks to the resident indexes (caller holds `_lock`)."""
+        vector_store = self.get_vector_store()
+        with self.index_lock.write():
+            self._use_working_docstore(vector_store)
+            vector_store.add_embeddings(
+                zip([chunk.page_content for chunk in chunks], embeddings),
+                metadatas=[chunk.metadata for chunk in chunks],
+                ids=ids,
+            )
+        self.update_bm25(vector_store, chunks, ids)
+
+    def _use_working_docstore(self, vector_store):
+        """
+        Moves writes off the published generation: the first upload after a
+        load or save switches the store to a private overlay over its
+        docstore (a copy of the published overlay, if it has one).
+        """
+        docstore = vector_store.docstore
+        if isinstance(docstore, SQLiteDocstore) and self._working_docstore_path is None:
+            self._working_docstore_path = self.snapshots.private_path("working", ".sqlite")
+            # The published docstore stays open for searches already holding it
+            vector_store.docstore = docstore.branch(self._working_docstore_path)
+
+    def _drop_working_docstore(self):
+        if self._working_docstore_path is None:
+            return
+        try:
+            # Open connections keep reading the unlinked file
+            os.remove(self._working_docstore_path)
+        except OSError:
+            # Still open (Windows)
+            pass
+        self._working_docstore_path = None
+
+    def persist(self):
+        """
+        Publishes the resident FAISS store and pending BM25 deltas as a new
+        index generation.
+        """
+        with self._lock:
+            if self._vector_store is None:
+                return
+
+            start_time = time.perf_counter()
+
+            def write(path: str):
+                # The overlay is copied from the working one; the base stays linked
+                save_vector_store(
+                    self._vector_store, self.snapshots.vector_path(path),
+                    max_overlay_chunks=self.config.DOCSTORE_OVERLAY_MAX_CHUNKS,
+                )
+                if self._bm25_index is not None and self._pending_bm25:
+                    self._bm25_index.append_delta(self.snapshots.bm25_path(path), self._pending_bm25)
+
+            # Pending BM25 ids are only cleared once published; a failed
+            # attempt is retried by the writer from the same state
+            for attempt in range(2):
+                delta_records = self._bm25_index.delta_records if self._bm25_index is not None else 0
+                try:
+                    self._publish(write, skip=(OVERLAY_FILE,))
+                    break
+                except Exception as e:
+                    if self._bm25_index is not None:
+                        self._bm25_index.delta_records = delta_records
+                    if not isinstance(e, SnapshotConflictError) or attempt:
+                        raise
+                    # Another process published first (e.g. `--ingest`)
+                    print(f"{e} Moving unsaved uploads onto it...")
+                    self._rebase()
+            self._pending_bm25 = []
+            self._unpublished = []
+            self.published_generation = self.generation
+
+            # Read from the published docstore until the next upload branches it
+            # again; searches still holding the working one keep reading it
+            published = open_docstore(self.snapshots.vector_path(self._snapshot_path()))
+            with self.index_lock.write():
+                self._vector_store.docstore = published
+            self._drop_working_docstore()
+
+            end_time = time.perf_counter()
+            print(f"Indexes persisted to disk in {end_time - start_time:.2f}s.")
+
+    def _rebase(self):
+        """
+        Loads the current generation into the resident objects (so
+        retrievers holding them follow) and adds the unpublished uploads to
+        it again, ready to be published on top of it.
+        """
+        self.snapshot_generation = self.snapshots.current()
+        vector_store = load_vector_store(
+            self.snapshots.vector_path(self._snapshot_path()), self.query_embeddings, self.config, read_only=False,
+        )
+        bm25_index = self._load_or_build_bm25(vector_store) if self._bm25_index is not None else None
+
+        with self.index_lock.write():
+            self._vector_store.index = vector_store.index
+            self._vector_store.index_to_docstore_id = vector_store.index_to_docstore_id
+            self._vector_store.docstore = vector_store.docstore
+        if bm25_index is not None:
+            self._bm25_index.replace_with(bm25_index)
+        self._record_segments()
+        self._drop_working_docstore()
+
+        self._pending_bm25 = []
+        for chunks, ids, embeddings in self._unpublished:
+            self._add_embedded(chunks, ids, embeddings)
+        self._bump_generation()
+
+    def flush(self):
+        """
+        Persists any pending changes immediately (e.g. on shutdown).
+        """
+        self._writer.flush()
+
+    def close(self):
+        """
+        Persists pending changes. The working docstore overlay is removed
+        by a successful save, and kept if uploads could not be persisted.
+        """
+        self.flush()
+        if self._writer.dirty:
+            print(
+                f"WARNING: Uploads could not be persisted ({self._writer.last_error}); "
+                f"they remain only in {self._working_docstore_path} and are not published."
+            )
+
+    def refresh(self) -> bool:
+        """
+        Moves the resident indexes to a newer generation published by
+        another process. The BM25 base segment is reused whenever it is
+        unchanged: only the new delta log records are replayed. The FAISS
+        index has no delta segment; every save rewrites index.faiss, so it
+        is reloaded in full after any upload (cheap with FAISS_LOAD_MODE
+        'mmap', which maps it instead of reading it). It is only kept,
+        with the docstore reopened, across generations that did not save
+        vectors, such as a BM25 rebuild. The previous objects are not
+        modified, so retrievers built on them keep working until they are
+        replaced.
+
+        Returns whether a newer generation was loaded.
+        """
+        generation = self.snapshots.current()
+        with self._lock:
+            if self._vector_store is None or generation is None or generation == self.snapshot_generation:
+                return False
+            if self._writer.dirty or self._pending_bm25:
+                # Unsaved uploads are published first (moved onto this
+                # generation by `persist()` if it conflicts)
+                return False
+
+            start_time = time.perf_counter()
+            snapshot_path = self.snapshots.path(generation)
+            vector_path = self.snapshots.vector_path(snapshot_path)
+            bm25_path = self.snapshots.bm25_path(snapshot_path)
+            reused = []
+            try:
+                if segment_identity(vector_path) == self._segments.get("vector"):
+                    vector_store = reopen_vector_store(self._vector_store, vector_path)
+                    reused.append("FAISS index")
+                else:
+                    vector_store = load_vector_store(
+                        vector_path, self.query_embeddings, self.config, read_only=self._read_only()
+                    )
+
+                bm25_index = None
+                if (
+                    self._bm25_index is not None
+                    and os.path.isdir(bm25_path)
+                    and segment_identity(bm25_path) == self._segments.get("bm25")
+                ):
+                    bm25_index = self._bm25_index.fork()
+                    bm25_index.replay_delta(bm25_path)
+                    reused.append("BM25 base segment")
+            except FileNotFoundError:
+                # Pruned while loading; the next check finds a newer generation
+                return False
+
+            self._vector_store = vector_store
+            self._bm25_index = bm25_index
+            self.snapshot_generation = generation
+            self._record_segments()
+            self._bump_generation()
+
+        end_time = time.perf_counter()
+        print(
+            f"Moved to index generation {generation} in {end_time - start_time:.2f}s "
+            f"(reused: {', '.join(reused) or 'nothing'})."
+        )
+        return True
+
+    def reload(self):
+        """
+        Drops the resident indexes (and unsaved changes) so they are reloaded
+        from disk on next access, e.g. after a full re-ingestion.
+        """
+        with self._lock:
+            self._writer.cancel()
+            self._vector_store = None
+            self._bm25_index = None
+            self._pending_bm25 = []
+            self._unpublished = []
+            self.snapshot_generation = None
+            self._segments = {}
+            self._drop_working_docstore()
+            self._bump_generation()
+
+    def _generation_for(self, vector_store, bm25_index):
+        """
+        The retrieval cache generation of results from these indexes, or
+        None once they are no longer the resident ones (e.g. after `refresh()`).
+        """
+        generation = self.generation
+        if self._vector_store is not vector_store or self._bm25_index is not bm25_index:
+            return None
+        return generation
+
+    def _bump_generation(self):
+        """
+        Marks the indexes as changed; cached retrieval results become unreachable.
+        """
+        self.generation += 1
+        self.retrieval_cache.clear()
+
+    def cache_stats(self) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Entries, bytes and hit/miss counters of the query embedding and
+        retrieval caches (None for a disabled cache).
+        """
+        query_embeddings = None
+        if isinstance(self.query_embeddings, QueryCachedEmbeddings):
+            query_embeddings = self.query_embeddings.stats()
+        retrieval = self.retrieval_cache.stats() if self.config.RETRIEVAL_CACHE_ENABLED else None
+        return {"query_embeddings": query_embeddings, "retrieval": retrieval}
+
+    def _first_stage_k(self, k: int) -> int:
+        """Results per first-stage retriever: wide when a reranker picks the final ones."""
+        if self.config.RERANK_ENABLED:
+            return max(k, self.config.RERANK_CANDIDATES)
+        return k
+
+    def _with_reranker(self, retriever):
+        """
+        Puts the cross-encoder stage on top of the (cached) first stage, if
+        RERANK_ENABLED. Reranking is not cached, so a pass that ran out of
+        latency budget never pins first-stage order for later requests.
+        """
+        if not self.config.RERANK_ENABLED:
+            return retriever
+        if self._cross_encoder is None:
+            self._cross_encoder = load_cross_encoder(self.config.RERANK_MODEL_NAME)
+            print("Cross-encoder reranker initialized.")
+        return CrossEncoderReranker(
+            retriever=retriever,
+            model=self._cross_encoder,
+            top_n=self.config.RERANK_TOP_N,
+            max_candidates=self.config.RERANK_MAX_CANDIDATES,
+            max_latency=self.config.RERANK_MAX_LATENCY_MS / 1000,
+        )
+
+    def _get_hybrid_retriever(self, vector_store):
+        """
+        Builds the single-pass hybrid retriever (fusion by chunk id, text
+        fetched only for the final results), cached like the ensemble.
+        """
+        bm25_index = self.get_bm25_index(vector_store)
+        hybrid_retriever = HybridRetriever(
+            vector_store=vector_store,
+            bm25_index=bm25_index,
+            index_lock=self.index_lock,
+            k=self._first_stage_k(self.config.HYBRID_K),
+            dense_pool=self.config.HYBRID_DENSE_POOL,
+            lexical_pool=self.config.HYBRID_LEXICAL_POOL,
+            fusion=self.config.HYBRID_FUSION,
+            weights=self.config.ENSEMBLE_WEIGHTS,
+            rrf_c=self.config.HYBRID_RRF_C,
+        )
+        print("Hybrid retriever initialized.")
+        if not self.config.RETRIEVAL_CACHE_ENABLED:
+            return hybrid_retriever
+
+        return CachedRetriever(
+            retriever=hybrid_retriever,
+            cache=self.retrieval_cache,
+            generation=lambda: self._generation_for(vector_store, bm25_index),
+            params=(
+                "hybrid",
+                self._first_stage_k(self.config.HYBRID_K),
+                self.config.HYBRID_DENSE_POOL,
+                self.config.HYBRID_LEXICAL_POOL,
+                self.config.HYBRID_FUSION,
+                self.config.HYBRID_RRF_C,
+                tuple(self.config.ENSEMBLE_WEIGHTS),
+            ),
+        )
+
     def get_retriever(self):
         """
-        Loads and returns the ensemble retriever.
+        Loads and returns the hybrid retriever (or the ensemble retriever
+        if HYBRID_RETRIEVER_ENABLED is off), followed by the reranker if
+        RERANK_ENABLED.
         """
         print("Initializing retriever...")
 
         # 1. Load FAISS Retriever
         print("Loading FAISS vector store...")
-        vector_store = self._load_faiss_store()
-        faiss_retriever = vector_store.as_retriever(
-            search_kwargs={"k": self.config.FAISS_RETRIEVER_K}
+        vector_store = self.get_vector_store()
+
+        if self.config.HYBRID_RETRIEVER_ENABLED:
+            return self._with_reranker(self._get_hybrid_retriever(vector_store))
+
+        faiss_k = self._first_stage_k(self.config.FAISS_RETRIEVER_K)
+        bm25_k = self._first_stage_k(self.config.BM25_RETRIEVER_K)
+        faiss_retriever = ReadLockedRetriever(
+            retriever=vector_store.as_retriever(search_kwargs={"k": faiss_k}),
+            lock=self.index_lock,
         )
 
         # 2. Load or Build BM25 Retriever
-        if os.path.exists(self.config.BM25_INDEX_PATH):
-            print(f"Loading BM25 index from {self.config.BM25_INDEX_PATH}...")
-            with open(self.config.BM25_INDEX_PATH, "rb") as f:
-                bm25_retriever = pickle.load(f)
-        else:
-            # Pass the loaded vector_store to the builder
-            bm25_retriever = self._build_and_save_bm25(vector_store)
-        
-        bm25_retriever.k = self.config.BM25_RETRIEVER_K
+        bm25_index = self.get_bm25_index(vector_store)
+        bm25_retriever = BM25IndexRetriever(
+            index=bm25_index, vector_store=vector_store, k=bm25_k
+        )
 
         # 3. Initialize EnsembleRetriever
         print("Creating ensemble retriever...")
@@ -107,6 +593,22 @@ class RetrieverProvider:
             retrievers=[bm25_retriever, faiss_retriever],
             weights=self.config.ENSEMBLE_WEIGHTS,
         )
+
+        # 4. Cache results per index generation
+        if not self.config.RETRIEVAL_CACHE_ENABLED:
+            print("Retriever initialized.")
+            return self._with_reranker(ensemble_retriever)
+
+        cached_retriever = CachedRetriever(
+            retriever=ensemble_retriever,
+            cache=self.retrieval_cache,
+            generation=lambda: self._generation_for(vector_store, bm25_index),
+            params=(
+                faiss_k,
+                bm25_k,
+                tuple(self.config.ENSEMBLE_WEIGHTS),
+            ),
+        )
         
         print("Retriever initialized.")
-        return ensemble_retriever
\ No newline at end of file
+        return self._with_reranker(cached_retriever)
\ No newline at end of file
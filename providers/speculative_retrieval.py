@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+import json
+from typing import List, Tuple
+
+import numpy as np
+
+from config import Config
+from components.admission import AdmissionController
+from components.embedding_cache import embed_queries
+from components.hybrid_retriever import reciprocal_rank_fusion
+from components.lru_cache import LRUCache
+from langchain_community.docstore.document import Document
+from providers.chain_provider import history_to_messages
+
+
+def history_hash(chat_history: List[Tuple[str, str]]) -> str:
+    """
+    Stable SHA-1 of the (human, ai) turns, used to key rephrasings.
+    """
+    payload = json.dumps([list(turn) for turn in chat_history], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class SpeculativeRetriever:
+    """
+    Retrieves context for (possibly follow-up) questions without waiting
+    for the rephrase LLM call before searching.
+
+    For a follow-up, retrieval starts immediately on the raw input and on
+    the last user turn concatenated with it, while the LLM rephrases the
+    question. Once the standalone question is known it is embedded and
+    compared with the speculative queries: results of queries whose cosine
+    similarity reaches SPECULATIVE_SIMILARITY_THRESHOLD are reused (fused by
+    RRF if several qualify); otherwise the standalone question is retrieved
+    as before. Rephrasings are cached by (history hash, input), so repeated
+    follow-ups skip the LLM call altogether.
+
+    Every retrieval, LLM call and embedding call holds a slot of the
+    matching `admission` stage.
+    """
+
+    def __init__(self, config: Config, retriever, rephrase_chain, embeddings, admission: AdmissionController = None):
+        self.config = config
+        self.retriever = retriever
+        self.rephrase_chain = rephrase_chain
+        self.embeddings = embeddings
+        self.admission = admission or AdmissionController(config)
+        self.rephrase_cache = LRUCache(
+            max_entries=config.REPHRASE_CACHE_MAX_ENTRIES,
+            ttl=config.REPHRASE_CACHE_TTL_SECONDS,
+        )
+
+        self.reused = 0
+        self.fallbacks = 0
+
+    async def rephrase(self, query: str, chat_history: List[Tuple[str, str]]) -> str:
+        """
+        Returns the standalone question for a follow-up, from the cache if possible.
+        """
+        key = (history_hash(chat_history), query.strip())
+        question = self.rephrase_cache.get(key)
+        if question is None:
+            async with self.admission.stage("llm"):
+                question = await self.rephrase_chain.ainvoke(
+                    {"input": query, "chat_history": history_to_messages(chat_history)}
+                )
+            self.rephrase_cache.set(key, question)
+        return question
+
+    async def _search(self, query: str) -> List[Document]:
+        async with self.admission.stage("retrieval"):
+            return await self.retriever.ainvoke(query)
+
+    @staticmethod
+    def speculative_queries(query: str, chat_history: List[Tuple[str, str]]) -> List[str]:
+        """The raw follow-up, and the last user turn followed by it."""
+        last_turn = chat_history[-1][0]
+        return list(dict.fromkeys([query, f"{last_turn} {query}"]))
+
+    async def retrieve(self, query: str, chat_history: List[Tuple[str, str]]) -> Tuple[str, List[Document]]:
+        """
+        Returns:
+          Tuple[str, List[Document]]: the standalone question and its documents.
+        """
+        if not chat_history:
+            return query, await self._search(query)
+
+        cached_question = self.rephrase_cache.get((history_hash(chat_history), query.strip()))
+        if cached_question is not None or not self.config.SPECULATIVE_RETRIEVAL_ENABLED:
+            question = cached_question or await self.rephrase(query, chat_history)
+            return question, await self._search(question)
+
+        # 1. Speculative retrievals run while the LLM rephrases
+        candidates = self.speculative_queries(query, chat_history)
+        searches = [asyncio.ensure_future(self._search(candidate)) for candidate in candidates]
+        try:
+            question = await self.rephrase(query, chat_history)
+        except Exception as e:
+            print(f"Rephrasing failed ({e}); retrieving with the raw follow-up.")
+            question = query
+        results = await asyncio.gather(*searches)
+
+        # 2. Reuse the speculative results that are close enough
+        reusable = await self._reusable(question, candidates)
+        if not reusable:
+            self.fallbacks += 1
+            return question, await self._search(question)
+
+        self.reused += 1
+        if len(reusable) == 1:
+            return question, results[reusable[0]]
+        return question, self._merge([results[index] for index in reusable])
+
+    async def _reusable(self, question: str, candidates: List[str]) -> List[int]:
+        """
+        Indexes of the speculative queries similar enough to `question`.
+        """
+        normalized = normalize_query(question)
+        exact = [index for index, candidate in enumerate(candidates) if normalize_query(candidate) == normalized]
+        if exact:
+            return exact
+
+        # The candidates were just embedded for retrieval, so with the query
+        # embedding cache only the standalone question reaches the model.
+        loop = asyncio.get_event_loop()
+        async with self.admission.stage("embedding"):
+            vectors = await loop.run_in_executor(None, embed_queries, self.embeddings, [question] + candidates)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        similarities = vectors[1:] @ vectors[0]
+        return [
+            index for index, similarity in enumerate(similarities)
+            if similarity >= self.config.SPECULATIVE_SIMILARITY_THRESHOLD
+        ]
+
+    @staticmethod
+    def _merge(result_lists: List[List[Document]]) -> List[Document]:
+        """
+        Fuses several result lists by RRF, keeping the length of the longest.
+        """
+        docs = {}
+        ranked_lists = []
+        for result in result_lists:
+            keys = []
+            for doc in result:
+                key = doc.id or doc.page_content
+                docs.setdefault(key, doc)
+                keys.append(key)
+            ranked_lists.append(keys)
+
+        fused = reciprocal_rank_fusion(ranked_lists, [1.0] * len(ranked_lists))
+        k = max(len(result) for result in result_lists)
+        return [docs[key] for key, _ in fused[:k]]
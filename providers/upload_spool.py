@@ -0,0 +1,134 @@
+import os
+import json
+import asyncio
+from typing import List, Optional, Tuple
+
+from config import Config
+from providers.ingestion_queue import IngestionJob
+
+
+class UploadSpool:
+    """
+    Hands uploads from any API worker to the single ingestion writer in
+    multi-worker mode.
+
+    Each upload is a pair of files in `UPLOAD_SPOOL_DIRECTORY`:
+    <job_id>.txt (the text) and <job_id>.json (the job status, rewritten
+    by the writer as the job progresses). Both are written to a temporary
+    name and renamed, so a reader never sees a partial file. Any worker
+    can accept an upload or report its status; only the writer's
+    IngestionQueue claims and ingests them.
+
+    The text of a failed job is removed when it finishes, that of an
+    ingested one only by `release()`, once the index generation holding
+    its chunks is published. A writer that exits before that leaves the
+    upload pending, and the next writer ingests it again.
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.directory = self.config.UPLOAD_SPOOL_DIRECTORY
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, job_id: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.{extension}")
+
+    def _write(self, path: str, text: str):
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def _pending_ids(self) -> List[str]:
+        """Ids of the uploads not ingested yet, oldest first."""
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".txt")]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        return [entry.name[:-len(".txt")] for entry in entries]
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending_ids())
+
+    def submit(self, text_content: str, source_name: str) -> IngestionJob:
+        """
+        Spools a document for the writer and returns its job immediately.
+        Raises asyncio.QueueFull if too many uploads are pending.
+        """
+        if self.pending >= self.config.INGEST_QUEUE_MAX_PENDING:
+            raise asyncio.QueueFull()
+
+        job = IngestionJob(source_name)
+        # The status record goes first: a claimed text always has one
+        self.update(job)
+        self._write(self._path(job.job_id, "txt"), text_content)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[IngestionJob]:
+        try:
+            with open(self._path(job_id, "json"), "r", encoding="utf-8") as f:
+                return IngestionJob.from_dict(json.load(f))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def update(self, job: IngestionJob):
+        """
+        Records a job's status. Failed jobs give up their text.
+        """
+        self._write(self._path(job.job_id, "json"), json.dumps(job.to_dict()))
+        if job.finished_at is not None and job.status == "failed":
+            self.release([job.job_id])
+
+    def release(self, job_ids: List[str]):
+        """
+        Removes the texts of finished jobs (ingested ones once their chunks
+        are published); the oldest finished records beyond
+        INGEST_JOB_HISTORY are forgotten.
+        """
+        removed = False
+        for job_id in job_ids:
+            try:
+                os.remove(self._path(job_id, "txt"))
+                removed = True
+            except FileNotFoundError:
+                pass
+        if removed:
+            self._forget_old_jobs()
+
+    def _forget_old_jobs(self):
+        pending = set(self._pending_ids())
+        finished = [
+            entry for entry in os.scandir(self.directory)
+            if entry.name.endswith(".json") and entry.name[:-len(".json")] not in pending
+        ]
+        if len(finished) <= self.config.INGEST_JOB_HISTORY:
+            return
+        finished.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in finished[:len(finished) - self.config.INGEST_JOB_HISTORY]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def claim(self, exclude, limit: int) -> List[Tuple[IngestionJob, str]]:
+        """
+        Returns up to `limit` pending uploads as (job, text_content), oldest
+        first, skipping the job ids in `exclude` (already being ingested,
+        or ingested and waiting to be published). Uploads claimed by a
+        writer that exited before publishing them are pending again, so a
+        new writer picks them up.
+        """
+        claimed = []
+        for job_id in self._pending_ids():
+            if len(claimed) >= limit:
+                break
+            if job_id in exclude:
+                continue
+            job = self.get_job(job_id)
+            try:
+                with open(self._path(job_id, "txt"), "r", encoding="utf-8") as f:
+                    text_content = f.read()
+            except FileNotFoundError:
+                continue
+            if job is not None:
+                claimed.append((job, text_content))
+        return claimed
@@ -1,19 +1,28 @@
+import os
 import time
 import asyncio
-from typing import List, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 from config import Config
 
-from components.embedding_model import get_embedding_model
+from components.embedding_model import embedding_cache_key, get_embedding_model
+from components.embedding_cache import CachedEmbeddings
+from components.answer_cache import SemanticAnswerCache
+from components.context_builder import ContextBuilder
+from components.admission import AdmissionController
+from components.single_flight import SingleFlight
+from components.token_counter import TokenCounter
+from components.chat_session import ChatSession, SessionStore, SQLiteSessionStore, window_history
 
 from components.text_splitter import split_documents
 from langchain_community.docstore.document import Document
-from langchain_core.messages import HumanMessage, AIMessage
 
 from providers.ingestor import Ingestor
 from providers.llm_provider import LLMProvider
 from providers.retriever_provider import RetrieverProvider
-from providers.chain_provider import ChainProvider
+from providers.chain_provider import ChainProvider, history_to_messages
+from providers.batch_runner import BatchRunner
+from providers.speculative_retrieval import SpeculativeRetriever, history_hash, normalize_query
 
 class RAGSystem:
     """
@@ -25,7 +34,21 @@ class RAGSystem:
         
         print("Initializing RAG System...")
         # 1. Load embeddings
-        self.embeddings = get_embedding_model(self.config.EMBEDDING_MODEL_NAME)
+        self.embeddings = get_embedding_model(
+            self.config.EMBEDDING_MODEL_NAME,
+            normalize=self.config.EMBEDDING_NORMALIZE,
+            backend=self.config.EMBEDDING_BACKEND,
+            num_threads=self.config.EMBEDDING_NUM_THREADS,
+            onnx_file=self.config.EMBEDDING_ONNX_FILE,
+        )
+        if self.config.EMBEDDING_CACHE_ENABLED:
+            self.embeddings = CachedEmbeddings(
+                self.embeddings,
+                # Normalized and raw vectors (or those of another backend) must not share cache entries
+                model_name=embedding_cache_key(self.config),
+                cache_path=self.config.EMBEDDING_CACHE_PATH,
+                max_entries=self.config.EMBEDDING_CACHE_MAX_ENTRIES,
+            )
         
         # 2. Initialize the Ingestor (for --ingest command, if you keep it)
         self.ingestor = Ingestor(self.config, self.embeddings)
@@ -37,21 +60,133 @@ class RAGSystem:
         # 4. Initialize the retriever provider
         self.retriever_provider = RetrieverProvider(self.config, self.embeddings)
 
-        # 5. Lazy-loaded components
+        # 5. Optional semantic cache for first-turn answers
+        self.answer_cache = None
+        if self.config.ANSWER_CACHE_ENABLED:
+            self.answer_cache = SemanticAnswerCache(
+                threshold=self.config.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+                max_entries=self.config.ANSWER_CACHE_MAX_ENTRIES,
+            )
+
+        # 6. Server-side chat sessions and the token-budgeted history window
+        if self.config.API_WORKERS > 1:
+            # Any worker may serve the next request of a session
+            self.sessions = SQLiteSessionStore(
+                os.path.join(self.config.UPLOAD_SPOOL_DIRECTORY, self.config.SESSION_DB_FILE),
+                max_sessions=self.config.SESSION_MAX_SESSIONS,
+                ttl=self.config.SESSION_TTL_SECONDS,
+            )
+        else:
+            self.sessions = SessionStore(
+                max_sessions=self.config.SESSION_MAX_SESSIONS,
+                ttl=self.config.SESSION_TTL_SECONDS,
+            )
+        self.token_counter = TokenCounter(self.config.LLM_TOKENIZER_NAME)
+        self._summary_tasks = set()
+
+        # 7. Context assembly (merged, deduplicated, token-budgeted)
+        self.context_builder = ContextBuilder(
+            self.token_counter,
+            max_tokens=self.config.CONTEXT_MAX_TOKENS,
+            min_overlap=self.config.CONTEXT_MERGE_MIN_OVERLAP,
+        )
+
+        # 8. Admission control: request queue and per-stage concurrency limits
+        self.admission = AdmissionController(self.config)
+        # Concurrent identical requests share one execution
+        self.single_flight = SingleFlight()
+
+        # 9. Lazy-loaded components
         self._retriever = None
-        self._rag_chain = None
+        self._chains = None
+        self._summary_chain = None
+        self._speculative_retriever = None
+        self._batch_runner = None
         print("RAG System initialized.")
 
-    async def run_ingestion(self):
+    async def run_ingestion(self, full_rebuild: bool = False):
         """
         Runs the ingestion pipeline using the Ingestor component
         (e.g., for initial data directory setup).
+        Only changed files are re-ingested unless `full_rebuild` is set.
         """
+        # The Ingestor works on the on-disk indexes; save resident changes first.
+        self.retriever_provider.flush()
         loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, self.ingestor.run)
+        await loop.run_in_executor(None, self.ingestor.run, full_rebuild)
         print("Ingestion complete. Vector store should now be ready.")
-        self._retriever = None 
-        self._rag_chain = None
+        if isinstance(self.embeddings, CachedEmbeddings):
+            print(self.embeddings.report())
+            self.embeddings.flush()
+        # A new generation was published. Load it next to the current one and
+        # swap: requests in flight finish on the snapshot they started with.
+        self.retriever_provider.reload()
+        self._swap_retriever(await loop.run_in_executor(None, self.retriever_provider.get_retriever))
+
+    async def refresh_index(self) -> bool:
+        """
+        Picks up an index generation published by another process (e.g. the
+        ingestion writer in multi-worker mode), reusing the segments
+        `RetrieverProvider.refresh` can, and swaps in a retriever over it.
+        Returns whether a newer generation was loaded.
+        """
+        loop = asyncio.get_event_loop()
+        if not await loop.run_in_executor(None, self.retriever_provider.refresh):
+            return False
+        self._swap_retriever(await loop.run_in_executor(None, self.retriever_provider.get_retriever))
+        return True
+
+    async def become_ingestion_writer(self):
+        """
+        Makes this process the one that ingests uploads. Its indexes are
+        loaded writable, also with FAISS_LOAD_MODE 'mmap'.
+        """
+        self.retriever_provider.ingestion_writer = True
+        if self.config.FAISS_LOAD_MODE == "mmap":
+            self.retriever_provider.reload()
+            loop = asyncio.get_event_loop()
+            self._swap_retriever(await loop.run_in_executor(None, self.retriever_provider.get_retriever))
+
+    def _swap_retriever(self, retriever):
+        """Replaces the retriever; requests in flight keep the one they hold."""
+        self._retriever = retriever
+        self._speculative_retriever = None
+        self._batch_runner = None
+
+    @property
+    def index_generation(self) -> int:
+        """Counter bumped by every change to the resident indexes."""
+        return self.retriever_provider.generation
+
+    @property
+    def published_generation(self) -> int:
+        """
+        The `index_generation` whose changes were last published: uploads
+        added at or before it survive a restart.
+        """
+        return self.retriever_provider.published_generation
+
+    def cache_stats(self) -> dict:
+        """
+        Hit/miss counters of the query embedding and retrieval caches.
+        """
+        return self.retriever_provider.cache_stats()
+
+    def flush_index(self):
+        """
+        Publishes pending index changes now instead of after the write-behind delay.
+        """
+        self.retriever_provider.flush()
+
+    def close(self):
+        """
+        Flushes pending index changes (and cached embeddings) to disk.
+        """
+        self.retriever_provider.close()
+        if isinstance(self.embeddings, CachedEmbeddings):
+            self.embeddings.flush()
+        if isinstance(self.sessions, SQLiteSessionStore):
+            self.sessions.close()
 
     def _get_retriever(self):
         """Lazy-loads the retriever on first access."""
@@ -60,72 +195,93 @@ class RAGSystem:
             self._retriever = self.retriever_provider.get_retriever()
         return self._retriever
 
-    def _get_rag_chain(self):
-        """Lazy-loads the RAG chain on first access."""
-        if self._rag_chain is None:
-            print("Loading RAG chain...")
-            retriever = self._get_retriever()
+    def _get_chains(self):
+        """
+        Lazy-loads the (rephrase, answer) chains on first access. The pipeline
+        runs them step by step so the sources can be reported before generation.
+        """
+        if self._chains is None:
+            print("Loading RAG chains...")
             llm = self.llm_provider.get_llm()
-            self._rag_chain = self.chain_provider.get_conversational_chain(retriever, llm)
-        return self._rag_chain
+            self._chains = (self.chain_provider.get_rephrase_chain(llm), self.chain_provider.get_answer_chain(llm))
+        return self._chains
 
-    async def add_document_from_text(self, text_content: str, source_name: str = "uploaded_file"):
+    def _get_summary_chain(self):
+        """Lazy-loads the history summarization chain on first access."""
+        if self._summary_chain is None:
+            self._summary_chain = self.chain_provider.get_summary_chain(self.llm_provider.get_llm())
+        return self._summary_chain
+
+    def _get_speculative_retriever(self):
+        """Lazy-loads the follow-up aware retriever on first access."""
+        if self._speculative_retriever is None:
+            rephrase_chain, _ = self._get_chains()
+            self._speculative_retriever = SpeculativeRetriever(
+                self.config, self._get_retriever(), rephrase_chain, self.retriever_provider.query_embeddings,
+                admission=self.admission,
+            )
+        return self._speculative_retriever
+
+    def _get_batch_runner(self):
+        """Lazy-loads the batch runner on first access."""
+        if self._batch_runner is None:
+            self._batch_runner = BatchRunner(
+                self.config, self._get_retriever(), self.llm_provider.get_llm(), self.chain_provider, self.context_builder,
+                admission=self.admission,
+            )
+        return self._batch_runner
+
+    async def add_documents_from_texts(self, items: List[Tuple[str, str]]) -> List[int]:
         """
-        Ingests a single document from a text string.
-        This will update FAISS and trigger a full rebuild of the BM25 index.
+        Ingests a batch of documents given as (text_content, source_name) pairs.
+        All chunks go through one embedding call and one index update, so
+        the resident FAISS store and BM25 index are touched once per batch.
+
+        Returns the number of chunks created for each document.
         """
-        print(f"Ingesting new document: {source_name}")
-        
-        # 1. Create a Document object
-        doc = Document(page_content=text_content, metadata={"source": source_name})
-        
-        # 2. Split the document
-        chunks = split_documents(
-            [doc],
-            chunk_size=self.config.MODEL_SAFE_CHUNK_SIZE,
-            chunk_overlap=self.config.MODEL_SAFE_CHUNK_OVERLAP,
-        )
-        
-        if not chunks:
-            print("Warning: No chunks created from the document.")
-            return
+        print(f"Ingesting batch of {len(items)} document(s)...")
 
-        print(f"Created {len(chunks)} chunks for {source_name}")
+        # 1. Create Document objects
+        docs = [
+            Document(page_content=text_content, metadata={"source": source_name})
+            for text_content, source_name in items
+        ]
 
-        try:
-            loop = asyncio.get_event_loop()
-            
-            # 3. Get the FAISS vector store
-            print("Getting vector store for update...")
-            vector_store = await loop.run_in_executor(
-                None, self.retriever_provider.get_vector_store
+        # 2. Split the documents (per document, to report chunk counts)
+        chunks_per_doc = [
+            split_documents(
+                [doc],
+                chunk_size=self.config.MODEL_SAFE_CHUNK_SIZE,
+                chunk_overlap=self.config.MODEL_SAFE_CHUNK_OVERLAP,
             )
+            for doc in docs
+        ]
+        chunks = [chunk for doc_chunks in chunks_per_doc for chunk in doc_chunks]
 
-            # 4. Add documents to the FAISS vector store
-            await vector_store.aadd_documents(chunks)
-            print("Chunks added to FAISS store.")
+        if not chunks:
+            print("Warning: No chunks created from the batch.")
+            return [0 for _ in items]
 
-            # 5. Save the updated FAISS index (synchronous)
-            await loop.run_in_executor(
-                None, 
-                vector_store.save_local, 
-                self.config.VECTOR_DB_PATH
-            )
-            print(f"FAISS index saved to {self.config.VECTOR_DB_PATH}")
+        # 3. Add the chunks to the resident FAISS store and BM25 index.
+        # The retriever references the same objects, so there is no reload,
+        # and persistence happens in the background.
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(
+            None, self.retriever_provider.add_chunks, chunks
+        )
+        print(f"{len(chunks)} chunks added to FAISS store and BM25 index.")
 
-            # 6. CRITICAL: Rebuild the BM25 index (synchronous)
-            # This is slow but necessary for the ensemble retriever to work.
-            print("Rebuilding BM25 index. This may take a moment...")
-            await loop.run_in_executor(
-                None, self.retriever_provider._build_and_save_bm25, vector_store
-            )
-            print("BM25 index has been rebuilt and saved.")
+        return [len(doc_chunks) for doc_chunks in chunks_per_doc]
 
-            # 7. Force retriever and chain to reload on next call
-            # This ensures they pick up the newly indexed data.
-            self._retriever = None
-            self._rag_chain = None
+    async def add_document_from_text(self, text_content: str, source_name: str = "uploaded_file"):
+        """
+        Ingests a single document from a text string.
+        This will update the resident FAISS store and BM25 index in place.
+        """
+        print(f"Ingesting new document: {source_name}")
 
+        try:
+            await self.add_documents_from_texts([(text_content, source_name)])
         except Exception as e:
             print(f"Error adding document to vector store: {e}")
 
@@ -159,40 +315,213 @@ class RAGSystem:
         except Exception as e:
             print(f"Error during retrieval: {e}")
 
-    async def answer_question(self, query_text: str, chat_history: List[Tuple[str, str]] = []):
+    def window_history(self, chat_history: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
         """
-        Asks a question to the full RAG pipeline and streams the answer.
+        Trims a chat history to the most recent turns fitting in
+        HISTORY_MAX_TOKENS, so prompt size does not grow with the conversation.
+        """
+        return window_history(chat_history, self.token_counter, self.config.HISTORY_MAX_TOKENS)[0]
+
+    def create_session(self) -> ChatSession:
+        return self.sessions.create()
+
+    def _record_turn(self, session: ChatSession, query_text: str, answer: str):
+        """
+        Appends a turn to the session and drops the turns that no longer fit
+        in the window next to the summary. With HISTORY_SUMMARY_ENABLED they
+        are folded into the summary in the background, off the request path.
+        """
+        session.turns.append((query_text, answer))
+        budget = self.config.HISTORY_MAX_TOKENS - self.token_counter.count(session.summary)
+        _, dropped = window_history(session.turns, self.token_counter, budget)
+        session.turns = session.turns[len(dropped):]
+        self.sessions.save(session, "turns")
+        if dropped and self.config.HISTORY_SUMMARY_ENABLED:
+            task = asyncio.create_task(self._summarize(session, dropped))
+            self._summary_tasks.add(task)
+            task.add_done_callback(self._summary_tasks.discard)
+
+    async def _summarize(self, session: ChatSession, turns: List[Tuple[str, str]]):
+        conversation = "\n".join(f"User: {human}\nAssistant: {ai}" for human, ai in turns)
+        async with session.summary_lock:
+            try:
+                async with self.admission.stage("llm"):
+                    summary = await self._get_summary_chain().ainvoke(
+                        {"summary": session.summary or "(none)", "conversation": conversation}
+                    )
+            except Exception as e:
+                print(f"[RAGSystem] Could not summarize session {session.session_id}: {e}")
+                return
+            session.summary = self.token_counter.truncate(summary.strip(), self.config.HISTORY_SUMMARY_MAX_TOKENS)
+            self.sessions.save(session, "summary")
+
+    async def stream_answer(
+        self, query_text: str, chat_history: List[Tuple[str, str]] = [], session_id: Optional[str] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Runs the RAG pipeline for a question, yielding the events described
+        in `_run_pipeline`. With a `session_id` the history comes from (and
+        the new turn is saved to) that server-side session instead of
+        `chat_history`. Either way only the token-budgeted window of the
+        history reaches the prompts.
+
+        Identical questions in flight at the same time (same normalized
+        text, history window and index generation) share one pipeline run;
+        a caller joining late first receives the events already produced.
+        """
+        session = None
+        if session_id is not None:
+            session = self.sessions.get(session_id)
+            if session is None:
+                yield {"event": "error", "message": f"Unknown or expired session: {session_id}"}
+                return
+            chat_history = session.history()
+
+        async for event in self._shared_pipeline(query_text, self.window_history(chat_history)):
+            if event["event"] == "done" and session is not None:
+                self._record_turn(session, query_text, event["answer"])
+            yield event
+
+    def _shared_pipeline(self, query_text: str, chat_history: List[Tuple[str, str]]) -> AsyncIterator[Dict]:
+        """`_run_pipeline`, coalesced with identical runs in flight (SINGLE_FLIGHT_ENABLED)."""
+        if not self.config.SINGLE_FLIGHT_ENABLED:
+            return self._run_pipeline(query_text, chat_history)
+        key = ("answer", normalize_query(query_text), history_hash(chat_history), self.retriever_provider.generation)
+        return self.single_flight.stream(key, lambda: self._run_pipeline(query_text, chat_history))
+
+    async def _run_pipeline(self, query_text: str, chat_history: List[Tuple[str, str]]) -> AsyncIterator[Dict]:
+        """
+        Runs the RAG pipeline step by step, yielding events as they happen:
+
+          {"event": "sources", "documents": [...]}   retrieved chunks, before generation
+          {"event": "token", "text": "..."}          each generated piece of the answer
+          {"event": "done", "answer", "cached", "context_tokens", "context_tokens_saved",
+           "time_to_first_token", "total_time"}
+          {"event": "error", "message": "..."}       instead of "done" on failure
+
+        Times are in seconds from the start of the request.
         """
-        print(f"\n--- Querying RAG Pipeline: '{query_text}' ---")
         start_time = time.perf_counter()
 
         try:
-            rag_chain = self._get_rag_chain()
-            
-            history_messages = []
-            for human, ai in chat_history:
-                history_messages.append(HumanMessage(content=human))
-                history_messages.append(AIMessage(content=ai))
+            # Without history the input is already the standalone question,
+            # so a near-identical earlier question can reuse its answer.
+            question_embedding = None
+            generation = self.retriever_provider.generation
+            if self.answer_cache is not None and not chat_history:
+                loop = asyncio.get_event_loop()
+                async with self.admission.stage("embedding"):
+                    question_embedding = await loop.run_in_executor(
+                        None, self.retriever_provider.query_embeddings.embed_query, query_text
+                    )
+                cached = self.answer_cache.lookup(question_embedding, generation)
+                if cached is not None:
+                    cached_question, answer, similarity = cached
+                    print(f"Answer cache hit (similarity {similarity:.3f}): '{cached_question}'")
+                    yield {"event": "sources", "documents": []}
+                    yield {"event": "token", "text": answer}
+                    elapsed = time.perf_counter() - start_time
+                    yield {
+                        "event": "done", "answer": answer, "cached": True, "context_tokens": 0,
+                        "context_tokens_saved": 0, "time_to_first_token": elapsed, "total_time": elapsed,
+                    }
+                    return
 
-            print("\nAnswer:")
-            full_response = ""
-            
+            _, answer_chain = self._get_chains()
+
+            # 1. Standalone question and retrieval (follow-ups are rephrased
+            # while speculative retrievals run); the sources go out before
+            # generation starts
+            _, documents = await self._get_speculative_retriever().retrieve(query_text, chat_history)
+            yield {"event": "sources", "documents": documents}
+
+            # 2. Context assembly
+            context, context_stats = self.context_builder.build(documents)
+            print(
+                f"Context: {context_stats['chunks']} chunks -> {context_stats['passages']} passages, "
+                f"{context_stats['tokens_out']} tokens ({context_stats['tokens_saved']} saved)"
+            )
+
+            # 3. Generation
             input_dict = {
                 "input": query_text,
-                "chat_history": history_messages
+                "chat_history": history_to_messages(chat_history),
+                "context": context,
             }
-            
-            async for chunk in rag_chain.astream(input_dict):
-                full_response += chunk
-                print(chunk, end="", flush=True)
-            print()
-            
-            end_time = time.perf_counter()
-            print("--------------------")
-            print(f"Query completed in {end_time - start_time:.2f}s")
-            
-            return full_response
-            
+            full_response = ""
+            first_token_time = None
+            async with self.admission.stage("llm"):
+                async for chunk in answer_chain.astream(input_dict):
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter() - start_time
+                    full_response += chunk
+                    yield {"event": "token", "text": chunk}
+
+            if question_embedding is not None:
+                self.answer_cache.store(question_embedding, query_text, full_response, generation)
+
+            total_time = time.perf_counter() - start_time
+            yield {
+                "event": "done",
+                "answer": full_response,
+                "cached": False,
+                "context_tokens": context_stats["tokens_out"],
+                "context_tokens_saved": context_stats["tokens_saved"],
+                "time_to_first_token": first_token_time if first_token_time is not None else total_time,
+                "total_time": total_time,
+            }
+
         except Exception as e:
             print(f"\n[RAGSystem] An error occurred during the RAG pipeline: {e}")
-            return "An error occurred while processing your request."
\ No newline at end of file
+            yield {"event": "error", "message": "An error occurred while processing your request."}
+
+    async def answer_question(
+        self, query_text: str, chat_history: List[Tuple[str, str]] = [], session_id: Optional[str] = None
+    ):
+        """
+        Asks a question to the full RAG pipeline and streams the answer.
+        """
+        print(f"\n--- Querying RAG Pipeline: '{query_text}' ---")
+        print("\nAnswer:")
+
+        async for event in self.stream_answer(query_text, chat_history, session_id):
+            if event["event"] == "token":
+                print(event["text"], end="", flush=True)
+            elif event["event"] == "done":
+                print()
+                print("--------------------")
+                print(
+                    f"Query completed in {event['total_time']:.2f}s "
+                    f"(first token after {event['time_to_first_token']:.2f}s)"
+                )
+                return event["answer"]
+            elif event["event"] == "error":
+                return event["message"]
+
+    async def retrieve_batch(self, queries: List[str]) -> List[List[Document]]:
+        """
+        Retrieves chunks for many queries with one embedding call and one
+        batched FAISS / BM25 search. Identical batches in flight share one run.
+        """
+        print(f"\n--- Batch retrieval for {len(queries)} queries ---")
+        start_time = time.perf_counter()
+        if self.config.SINGLE_FLIGHT_ENABLED:
+            key = ("retrieve", tuple(normalize_query(query) for query in queries), self.retriever_provider.generation)
+            results = await self.single_flight.run(key, lambda: self._get_batch_runner().retrieve(queries))
+            results = [list(docs) for docs in results]
+        else:
+            results = await self._get_batch_runner().retrieve(queries)
+        print(f"Batch retrieval completed in {time.perf_counter() - start_time:.2f}s")
+        return results
+
+    async def answer_batch(self, requests: List[Tuple[str, List[Tuple[str, str]]]]) -> AsyncIterator[Dict]:
+        """
+        Answers many (query, chat_history) requests, yielding each result
+        ({"index", "query", "answer" or "error"}) as soon as it is ready.
+        """
+        print(f"\n--- Batch chat for {len(requests)} requests ---")
+        start_time = time.perf_counter()
+        requests = [(query, self.window_history(chat_history)) for query, chat_history in requests]
+        async for result in self._get_batch_runner().chat(requests):
+            yield result
+        print(f"Batch chat completed in {time.perf_counter() - start_time:.2f}s")
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from components.admission import ConcurrencyLimiter, Overloaded
+
+
+def test_waiters_are_admitted_in_fifo_order():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", 1)
+        order = []
+        first = await limiter.acquire()
+
+        async def wait(name):
+            slot = await limiter.acquire()
+            order.append(name)
+            await asyncio.sleep(0)
+            slot.release()
+
+        tasks = [asyncio.create_task(wait(name)) for name in "abcd"]
+        await asyncio.sleep(0.01)
+        assert limiter.waiting == 4 and order == []
+
+        first.release()
+        await asyncio.gather(*tasks)
+        return order, limiter
+
+    order, limiter = asyncio.run(scenario())
+    assert order == ["a", "b", "c", "d"]
+    assert (limiter.active, limiter.waiting, limiter.admitted) == (0, 0, 5)
+
+
+def test_new_callers_do_not_overtake_waiters():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", 1)
+        held = await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        held.release()
+        # The slot was handed to the waiter, not freed for a newcomer
+        assert limiter.active == 1
+        late = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert waiter.done() and not late.done()
+        (await waiter).release()
+        (await late).release()
+        return limiter
+
+    assert asyncio.run(scenario()).active == 0
+
+
+def test_full_queue_is_rejected_with_429():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", 1, max_waiting=1)
+        held = await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as rejected:
+            await limiter.acquire()
+        held.release()
+        (await waiter).release()
+        return rejected.value, limiter
+
+    error, limiter = asyncio.run(scenario())
+    assert error.status_code == 429 and error.retry_after >= 1
+    assert limiter.rejected == 1 and limiter.active == 0
+
+
+def test_wait_past_timeout_is_rejected_with_503_and_leaves_the_queue():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", 1, timeout=0.01)
+        held = await limiter.acquire()
+        with pytest.raises(Overloaded) as rejected:
+            await limiter.acquire()
+        assert limiter.waiting == 0
+        held.release()
+        return rejected.value, limiter
+
+    error, limiter = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert limiter.timed_out == 1 and limiter.active == 0
+
+
+def test_cancelled_waiter_gives_its_place_up():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", 1)
+        held = await limiter.acquire()
+        cancelled = asyncio.create_task(limiter.acquire())
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        held.release()
+        slot = await waiter
+        assert limiter.active == 1
+        slot.release()
+        slot.release()  # releasing twice is harmless
+        return limiter
+
+    assert asyncio.run(scenario()).active == 0
@@ -0,0 +1,48 @@
+import numpy as np
+
+from components.answer_cache import SemanticAnswerCache
+
+
+def unit(*values):
+    vector = np.zeros(8, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector.tolist()
+
+
+def test_similar_question_hits_and_different_one_misses():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store(unit(1, 0), "what is x?", "x is y", generation=1)
+
+    question, answer, score = cache.lookup(unit(1, 0.01), generation=1)
+    assert (question, answer) == ("what is x?", "x is y")
+    assert score > 0.95
+    assert cache.lookup(unit(0, 1), generation=1) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_new_generation_empties_cache():
+    cache = SemanticAnswerCache()
+    cache.store(unit(1), "q", "a", generation=1)
+    assert cache.lookup(unit(1), generation=2) is None
+    assert len(cache) == 0
+
+
+def test_answer_from_older_generation_is_dropped():
+    cache = SemanticAnswerCache()
+    cache.store(unit(1), "fresh", "new answer", generation=2)
+
+    # A slow answer computed against generation 1 finishes late
+    cache.store(unit(0, 1), "stale", "old answer", generation=1)
+    assert cache.lookup(unit(0, 1), generation=1) is None
+
+    assert len(cache) == 1
+    assert cache.lookup(unit(1), generation=2)[1] == "new answer"
+
+
+def test_oldest_entries_are_evicted():
+    cache = SemanticAnswerCache(max_entries=2)
+    for i in range(3):
+        cache.store(unit(*([0] * i + [1])), f"q{i}", f"a{i}", generation=1)
+    assert len(cache) == 2
+    assert cache.lookup(unit(1), generation=1) is None
+    assert cache.lookup(unit(0, 0, 1), generation=1)[1] == "a2"
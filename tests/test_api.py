@@ -0,0 +1,36 @@
+import pytest
+
+pytest.importorskip("langchain_huggingface")
+
+from fastapi.testclient import TestClient
+
+import api
+
+
+@pytest.fixture
+def client():
+    # Not entered as a context manager: the lifespan (model loading) does not run
+    return TestClient(api.app)
+
+
+def test_chat_batch_rejects_sessions(client):
+    response = client.post("/chat/batch", json={"requests": [{"query": "hi", "session_id": "abc"}]})
+    assert response.status_code == 422
+    assert "session" in response.json()["detail"].lower()
+
+
+def test_chat_batch_rejects_empty_batch(client):
+    assert client.post("/chat/batch", json={"requests": []}).status_code == 400
+
+
+def test_caches_reports_query_embedding_and_retrieval_caches(client, monkeypatch):
+    class FakeRAGSystem:
+        def cache_stats(self):
+            counters = {"entries": 1, "bytes": 64, "hits": 3, "misses": 1, "evictions": 0, "hit_rate": 0.75}
+            return {"query_embeddings": counters, "retrieval": None}
+
+    monkeypatch.setattr(api, "get_rag_system", lambda: FakeRAGSystem())
+    response = client.get("/caches")
+    assert response.status_code == 200
+    assert response.json()["query_embeddings"]["hit_rate"] == 0.75
+    assert response.json()["retrieval"] is None
@@ -0,0 +1,188 @@
+import math
+import random
+import threading
+from collections import Counter
+
+import pytest
+from langchain_community.docstore.document import Document
+
+from components.bm25_index import IncrementalBM25Index, tokenize
+
+
+DOCS = {
+    "a": "the quick brown fox jumps over the lazy dog",
+    "b": "a quick brown dog outpaces a quick red fox",
+    "c": "lorem ipsum dolor sit amet",
+    "d": "the dog sleeps all day long, the dog dreams",
+    "e": "foxes and dogs are not the same animal",
+}
+
+
+def reference_scores(docs, query, k1=1.5, b=0.75):
+    """Plain Okapi BM25 with the index's IDF (log((N - df + 0.5) / (df + 0.5) + 1))."""
+    tokenized = {doc_id: tokenize(text) for doc_id, text in docs.items()}
+    avgdl = sum(len(tokens) for tokens in tokenized.values()) / len(tokenized)
+    scores = {}
+    for term in set(tokenize(query)):
+        df = sum(1 for tokens in tokenized.values() if term in tokens)
+        if not df:
+            continue
+        idf = math.log((len(docs) - df + 0.5) / (df + 0.5) + 1.0)
+        for doc_id, tokens in tokenized.items():
+            freq = tokens.count(term)
+            if freq:
+                norm = k1 * (1 - b + b * len(tokens) / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (k1 + 1) / (freq + norm)
+    return scores
+
+
+def build(docs, as_delta=False):
+    index = IncrementalBM25Index()
+    if as_delta:
+        index.add_documents([Document(page_content=text) for text in docs.values()], list(docs))
+    else:
+        index.compact(list(docs), [Counter(tokenize(text)) for text in docs.values()])
+    return index
+
+
+@pytest.mark.parametrize("as_delta", [False, True])
+@pytest.mark.parametrize("query", ["quick fox", "dog", "lorem dog fox", "missing"])
+def test_scores_match_reference(as_delta, query):
+    hits = dict(build(DOCS, as_delta).search(query, k=len(DOCS)))
+    expected = reference_scores(DOCS, query)
+    assert hits.keys() == expected.keys()
+    for doc_id, score in expected.items():
+        assert hits[doc_id] == pytest.approx(score, rel=1e-5)
+
+
+def test_main_and_delta_segments_score_alike():
+    main_docs = {doc_id: DOCS[doc_id] for doc_id in "abc"}
+    index = build(main_docs)
+    index.add_documents([Document(page_content=DOCS["d"]), Document(page_content=DOCS["e"])], ["d", "e"])
+
+    expected = reference_scores(DOCS, "the dog fox")
+    hits = dict(index.search("the dog fox", k=5))
+    # Main segment weights keep their own average length until compaction
+    assert hits.keys() == expected.keys()
+    for doc_id in "de":
+        assert hits[doc_id] == pytest.approx(expected[doc_id], rel=1e-5)
+
+    index.compact()
+    assert dict(index.search("the dog fox", k=5)) == pytest.approx(expected, rel=1e-5)
+
+
+def test_removed_documents_are_not_returned():
+    index = build(DOCS)
+    index.add_documents([Document(page_content="another dog")], ["f"])
+    index.remove_documents(["d", "f"])
+    ids = [doc_id for doc_id, _ in index.search("dog", k=10)]
+    assert "d" not in ids and "f" not in ids
+    assert len(index) == len(DOCS) - 1
+
+
+def test_search_batch_matches_search():
+    index = build(DOCS)
+    queries = ["quick fox", "dog", "ipsum"]
+    assert index.search_batch(queries, k=3) == [index.search(query, k=3) for query in queries]
+
+
+def test_append_delta_is_replayed_on_load(tmp_path):
+    path = str(tmp_path / "bm25")
+    index = build(DOCS)
+    index.save(path)
+
+    index.add_documents([Document(page_content="a brand new fox")], ["f"])
+    index.append_delta(path, ["f"])
+
+    loaded = IncrementalBM25Index.load(path)
+    assert "f" in loaded
+    assert dict(loaded.search("new fox", k=6)) == pytest.approx(dict(index.search("new fox", k=6)), rel=1e-5)
+
+    # A fork replays only the records appended after it was made
+    fork = loaded.fork()
+    index.add_documents([Document(page_content="yet another fox")], ["g"])
+    index.append_delta(path, ["g"])
+    assert fork.replay_delta(path) == 1
+    assert "g" in fork and "g" not in loaded
+
+
+def test_append_delta_after_compaction_in_failed_attempt_saves(tmp_path):
+    index = build(DOCS)
+    index.compact_threshold = 1
+    index.save(str(tmp_path / "old"))
+    index.save(str(tmp_path / "retry"))
+
+    # The first attempt compacts the delta into memory, then is discarded
+    index.add_documents([Document(page_content="a brand new fox")], ["f"])
+    index.append_delta(str(tmp_path / "old"), ["f"])
+    index.append_delta(str(tmp_path / "retry"), ["f"])
+
+    assert "f" in IncrementalBM25Index.load(str(tmp_path / "retry"))
+
+
+def test_search_is_safe_during_updates():
+    index = build(DOCS)
+    stop = threading.Event()
+    errors = []
+
+    def search():
+        rng = random.Random()
+        while not stop.is_set():
+            try:
+                for hits in index.search_batch([f"w{rng.randrange(200)} dog", "fox"], k=5):
+                    assert len(hits) <= 5
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=search) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    try:
+        # The writer adds, removes and compacts while the readers search
+        for round_ in range(60):
+            ids = [f"w{round_}-{i}" for i in range(5)]
+            index.add_documents([Document(page_content=f"w{round_ * 3 + i} dog") for i in range(5)], ids)
+            index.remove_documents(ids[:2])
+            if round_ % 10 == 9:
+                index.compact()
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+
+    assert not errors, errors
+    assert len(index) == len(DOCS) + 60 * 3
+
+
+def test_search_is_safe_while_persisting_compacts(tmp_path):
+    path = str(tmp_path / "bm25")
+    index = IncrementalBM25Index(compact_threshold=2)
+    index.compact(list(DOCS), [Counter(tokenize(text)) for text in DOCS.values()])
+    index.save(path)
+    stop = threading.Event()
+    errors = []
+
+    def search():
+        while not stop.is_set():
+            try:
+                ids = {doc_id for doc_id, _ in index.search("dog", k=100)}
+                assert {"a", "b", "d"} <= ids
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+                return
+
+    reader = threading.Thread(target=search)
+    reader.start()
+    try:
+        # Every second append compacts the in-memory index and rewrites the arrays
+        for round_ in range(30):
+            doc_id = f"p{round_}"
+            index.add_documents([Document(page_content=f"dog {round_}")], [doc_id])
+            index.append_delta(path, [doc_id])
+    finally:
+        stop.set()
+        reader.join()
+
+    assert not errors, errors
+    assert len(IncrementalBM25Index.load(path)) == len(DOCS) + 30
@@ -0,0 +1,103 @@
+import pytest
+
+from components.chat_session import SUMMARY_TURN, ChatSession, SessionStore, SQLiteSessionStore, window_history
+from components.token_counter import TokenCounter
+
+
+@pytest.fixture
+def counter():
+    # No tokenizer: 4 characters per token
+    return TokenCounter(None)
+
+
+def cost(turns, counter):
+    return sum(counter.count(human) + counter.count(ai) for human, ai in turns)
+
+
+def test_keeps_most_recent_turns_that_fit(counter):
+    turns = [("q" * 40, "a" * 40), ("r" * 40, "b" * 40), ("s" * 40, "c" * 40)]
+    kept, dropped = window_history(turns, counter, max_tokens=45)
+    assert kept == turns[1:]
+    assert dropped == turns[:1]
+
+
+def test_everything_fits(counter):
+    turns = [("hello", "hi"), ("how are you", "fine")]
+    assert window_history(turns, counter, max_tokens=1000) == (turns, [])
+
+
+def test_long_answer_of_last_turn_is_truncated(counter):
+    turns = [("old", "turn"), ("q" * 40, "a" * 400)]
+    kept, dropped = window_history(turns, counter, max_tokens=30)
+    assert kept[0][0] == "q" * 40
+    assert kept[0][1] == "a" * 80
+    assert dropped == turns[:1]
+    assert cost(kept, counter) <= 30
+
+
+def test_question_longer_than_budget_is_truncated(counter):
+    turns = [("q" * 400, "a" * 40)]
+    kept, dropped = window_history(turns, counter, max_tokens=20)
+    assert kept == [("q" * 80, "")]
+    assert dropped == []
+    assert cost(kept, counter) <= 20
+
+
+def test_zero_budget_keeps_nothing(counter):
+    turns = [("q", "a")]
+    assert window_history(turns, counter, max_tokens=0) == ([], turns)
+
+
+def test_session_history_leads_with_summary():
+    session = ChatSession()
+    session.turns = [("q", "a")]
+    assert session.history() == [("q", "a")]
+    session.summary = "earlier"
+    assert session.history() == [(SUMMARY_TURN, "earlier"), ("q", "a")]
+
+
+def test_session_store_evicts_and_deletes():
+    store = SessionStore(max_sessions=2, ttl=None)
+    first, second, third = store.create(), store.create(), store.create()
+    assert store.get(first.session_id) is None
+    assert store.get(third.session_id) is third
+    assert store.delete(second.session_id)
+    assert not store.delete(second.session_id)
+
+
+def test_sqlite_sessions_are_shared_between_stores(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    first, second = SQLiteSessionStore(path), SQLiteSessionStore(path)
+
+    session = first.create()
+    session.turns.append(("q", "a"))
+    first.save(session, "turns")
+
+    loaded = second.get(session.session_id)
+    assert loaded.turns == [("q", "a")] and loaded.summary == ""
+    loaded.summary = "earlier"
+    second.save(loaded, "summary")
+
+    # Saving the turns leaves a summary written elsewhere in place
+    session.turns.append(("q2", "a2"))
+    first.save(session, "turns")
+    reloaded = first.get(session.session_id)
+    assert reloaded.history() == [(SUMMARY_TURN, "earlier"), ("q", "a"), ("q2", "a2")]
+
+    assert second.delete(session.session_id)
+    assert first.get(session.session_id) is None
+    assert not first.delete(session.session_id)
+
+
+def test_sqlite_session_store_evicts_and_expires(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite"), max_sessions=2, ttl=None)
+    first, second = store.create(), store.create()
+    store.get(first.session_id)
+    third = store.create()
+    assert store.get(second.session_id) is None
+    assert store.get(first.session_id) is not None and store.get(third.session_id) is not None
+    assert len(store) == 2
+
+    store.ttl = -1
+    assert store.get(first.session_id) is None
+    assert len(store) == 0
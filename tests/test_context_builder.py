@@ -0,0 +1,66 @@
+import random
+
+from langchain_community.docstore.document import Document
+
+from components.context_builder import ContextBuilder, merge_overlapping
+from components.token_counter import TokenCounter
+
+
+# Random letters: no accidental overlaps between distant chunks, no whitespace to strip
+TEXT = "".join(random.Random(0).choices("abcdefghijklmnopqrstuvwxyz", k=3000))
+
+
+def make_builder(max_tokens=2048):
+    # No tokenizer name: counts are estimated at 4 characters per token
+    return ContextBuilder(TokenCounter(None), max_tokens=max_tokens)
+
+
+def chunk(start, end, source="a.pdf", **metadata):
+    return Document(page_content=TEXT[start:end], metadata={"source": source, "start_index": start, **metadata})
+
+
+def test_merge_overlapping_joins_on_the_shared_text():
+    assert merge_overlapping(TEXT[:300], TEXT[250:600]) == TEXT[:600]
+    assert merge_overlapping(TEXT[250:600], TEXT[:300]) == TEXT[:600]
+    assert merge_overlapping(TEXT[:600], TEXT[100:200]) == TEXT[:600]
+    assert merge_overlapping(TEXT[:300], TEXT[400:600]) is None
+
+
+def test_overlapping_and_touching_chunks_are_merged():
+    docs = [chunk(0, 300), chunk(250, 600), chunk(600, 900), chunk(1200, 1400)]
+    context, stats = make_builder().build(docs)
+
+    assert context == TEXT[:900] + "\n\n" + TEXT[1200:1400]
+    assert stats["chunks"] == 4
+    assert stats["passages"] == 2
+    assert stats["tokens_saved"] > 0
+
+
+def test_chunks_of_other_sources_are_not_merged():
+    docs = [chunk(0, 300), chunk(250, 600, source="b.pdf")]
+    _, stats = make_builder().build(docs)
+    assert stats["passages"] == 2
+
+
+def test_passages_are_ordered_by_metadata_scores():
+    docs = [chunk(0, 200, score=0.1), chunk(1000, 1200, score=0.9)]
+    context, _ = make_builder().build(docs)
+    assert context.startswith(TEXT[1000:1200])
+
+    # Rank order when scores are missing
+    context, _ = make_builder().build([chunk(0, 200), chunk(1000, 1200, score=0.9)])
+    assert context.startswith(TEXT[:200])
+
+
+def test_context_is_trimmed_to_the_token_budget():
+    docs = [chunk(0, 200), chunk(1000, 1200), chunk(2000, 2200)]
+    # 50 tokens per passage and 1 per separator: two passages fit
+    context, stats = make_builder(max_tokens=110).build(docs)
+    assert context == TEXT[:200] + "\n\n" + TEXT[1000:1200]
+    assert stats["passages"] == 2
+
+
+def test_best_passage_is_truncated_rather_than_dropped():
+    context, stats = make_builder(max_tokens=10).build([chunk(0, 200), chunk(1000, 1200)])
+    assert context == TEXT[:40]
+    assert stats["passages"] == 1
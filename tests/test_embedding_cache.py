@@ -0,0 +1,35 @@
+import os
+
+from components.embedding_cache import CachedEmbeddings
+
+
+def make_cache(embeddings, path):
+    return CachedEmbeddings(embeddings, "hash", str(path), save_delay=60.0)
+
+
+def test_cache_file_is_loaded_on_first_embed_documents(embeddings, tmp_path):
+    path = tmp_path / "embedding_cache.npz"
+    writer = make_cache(embeddings, path)
+    writer.embed_documents(["alpha beta", "gamma delta"])
+    writer.flush()
+
+    reader = make_cache(embeddings, path)
+    reader.embed_query("alpha")
+    assert not reader._loaded and len(reader._entries) == 0
+
+    assert reader.embed_documents(["alpha beta"]) == writer.embed_documents(["alpha beta"])
+    assert reader._loaded
+    assert (reader.hits, reader.misses) == (1, 0)
+    reader._writer.cancel()
+
+
+def test_save_leaves_no_temporary_files(embeddings, tmp_path):
+    path = tmp_path / "embedding_cache.npz"
+    first, second = make_cache(embeddings, path), make_cache(embeddings, path)
+    first.embed_documents(["alpha"])
+    second.embed_documents(["beta"])
+    for cache in (first, second):
+        cache._writer.cancel()
+        cache.save()
+
+    assert os.listdir(tmp_path) == ["embedding_cache.npz"]
@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("langchain_huggingface")
+torch = pytest.importorskip("torch")
+
+from components.embedding_model import embedding_agreement_report
+
+
+class ThreadRecorder:
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.threads = set()
+
+    def embed_documents(self, texts):
+        self.threads.add(torch.get_num_threads())
+        return self.embeddings.embed_documents(texts)
+
+
+def test_identical_models_agree_and_run_at_the_pinned_thread_count(embeddings):
+    texts = [f"text number {i} about topic {i % 3}" for i in range(20)]
+    reference, candidate = ThreadRecorder(embeddings), ThreadRecorder(embeddings)
+    report = embedding_agreement_report(reference, candidate, texts, k=3, num_threads=2)
+
+    assert report["mean_cosine"] == pytest.approx(1.0)
+    assert report["neighbour_overlap"] == pytest.approx(1.0)
+    assert reference.threads == candidate.threads == {2}
@@ -0,0 +1,87 @@
+import threading
+
+import faiss
+from langchain_community.docstore.document import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from components.bm25_index import IncrementalBM25Index
+from components.hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+from components.rw_lock import ReadWriteLock
+
+
+TEXTS = [
+    "the quick brown fox",
+    "a lazy dog sleeps",
+    "foxes hunt at night",
+    "dogs and cats",
+]
+
+
+def make_retriever(embeddings, lock):
+    store = FAISS(
+        embedding_function=embeddings,
+        index=faiss.IndexFlatL2(embeddings.dim),
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+    )
+    ids = [f"doc-{i}" for i in range(len(TEXTS))]
+    store.add_texts(TEXTS, ids=ids)
+    bm25 = IncrementalBM25Index()
+    bm25.add_documents([Document(page_content=text) for text in TEXTS], ids)
+    return HybridRetriever(vector_store=store, bm25_index=bm25, index_lock=lock, k=2, dense_pool=4, lexical_pool=4)
+
+
+def test_reciprocal_rank_fusion_prefers_agreement():
+    fused = reciprocal_rank_fusion([["a", "b"], ["b", "c"]], [0.5, 0.5])
+    assert [doc_id for doc_id, _ in fused] == ["b", "a", "c"]
+
+
+def test_hybrid_search_finds_lexical_and_dense_matches(embeddings):
+    retriever = make_retriever(embeddings, ReadWriteLock())
+    docs = retriever.invoke("quick fox")
+    assert docs[0].page_content == "the quick brown fox"
+    assert retriever.retrieve_batch(["lazy dog", "quick fox"])[1][0].id == "doc-0"
+
+
+def test_dense_search_is_safe_while_vectors_are_added(embeddings):
+    lock = ReadWriteLock()
+    retriever = make_retriever(embeddings, lock)
+    store = retriever.vector_store
+    stop = threading.Event()
+    errors = []
+
+    def search():
+        while not stop.is_set():
+            try:
+                for hits in retriever.dense_search_batch(["fox", "dog night"]):
+                    assert all(doc_id.startswith(("doc-", "new-")) for doc_id, _ in hits)
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=search) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    try:
+        for round_ in range(100):
+            texts = [f"fox dog {round_} {i}" for i in range(3)]
+            vectors = embeddings.embed_documents(texts)
+            with lock.write():
+                store.add_embeddings(zip(texts, vectors), ids=[f"new-{round_}-{i}" for i in range(3)])
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+
+    assert not errors, errors
+    assert store.index.ntotal == len(TEXTS) + 300
+
+
+def test_documents_carry_their_fused_score(embeddings):
+    retriever = make_retriever(embeddings, ReadWriteLock())
+    hits = retriever.search("quick fox")
+    docs = retriever.materialize(hits)
+    assert [doc.metadata["score"] for doc in docs] == [score for _, score in hits]
+    # The docstore's own documents are not modified
+    assert "score" not in retriever.vector_store.docstore.search("doc-0").metadata
@@ -0,0 +1,118 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from components.index_snapshots import IndexSnapshots, SnapshotConflictError, WriterLock, segment_identity
+
+
+def publish(snapshots, base, files):
+    staging_path = snapshots.stage(base)
+    for name, text in files.items():
+        with open(os.path.join(staging_path, name), "w", encoding="utf-8") as f:
+            f.write(text)
+    return snapshots.publish(staging_path, base)
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_publish_advances_current(tmp_path):
+    snapshots = IndexSnapshots(str(tmp_path))
+    assert snapshots.current() is None
+
+    first = publish(snapshots, None, {"index.faiss": "1"})
+    second = publish(snapshots, first, {"row_ids.npy": "2"})
+
+    assert (first, second) == (1, 2)
+    assert snapshots.current() == 2
+    assert (tmp_path / "CURRENT").read_text().strip() == "2"
+    # Files the second generation did not rewrite are shared with the first
+    assert os.path.samefile(
+        os.path.join(snapshots.path(1), "index.faiss"), os.path.join(snapshots.path(2), "index.faiss")
+    )
+
+
+def test_mutable_files_are_copied_and_do_not_change_identity(tmp_path):
+    snapshots = IndexSnapshots(str(tmp_path))
+    first = publish(snapshots, None, {"index.faiss": "1", "delta.jsonl": "a\n"})
+    staging_path = snapshots.stage(first)
+    with open(os.path.join(staging_path, "delta.jsonl"), "a", encoding="utf-8") as f:
+        f.write("b\n")
+    second = snapshots.publish(staging_path, first)
+
+    assert (tmp_path / "gen-000001" / "delta.jsonl").read_text() == "a\n"
+    assert segment_identity(snapshots.path(first)) == segment_identity(snapshots.path(second))
+
+
+def test_publish_rejects_an_outdated_base(tmp_path):
+    snapshots = IndexSnapshots(str(tmp_path))
+    first = publish(snapshots, None, {"index.faiss": "1"})
+    staging_path = snapshots.stage(first)
+    publish(snapshots, first, {"index.faiss": "2"})
+
+    with pytest.raises(SnapshotConflictError):
+        snapshots.publish(staging_path, first)
+    assert not os.path.exists(staging_path)
+    assert snapshots.current() == 2
+
+
+@pytest.mark.skipif(os.name == "nt", reason="uses fcntl")
+def test_publish_waits_for_a_publisher_in_another_process(tmp_path):
+    snapshots = IndexSnapshots(str(tmp_path))
+    first = publish(snapshots, None, {"index.faiss": "1"})
+    holder = subprocess.Popen(
+        [
+            sys.executable, "-c",
+            "import fcntl, sys, time\n"
+            "f = open(sys.argv[1], 'a+')\n"
+            "fcntl.flock(f.fileno(), fcntl.LOCK_EX)\n"
+            "print('locked', flush=True)\n"
+            "time.sleep(0.3)\n",
+            str(tmp_path / ".publish.lock"),
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    assert holder.stdout.readline().strip() == "locked"
+
+    start = time.monotonic()
+    publish(snapshots, first, {"index.faiss": "2"})
+    assert time.monotonic() - start > 0.1
+    holder.wait()
+
+
+def test_old_generations_are_pruned(tmp_path):
+    snapshots = IndexSnapshots(str(tmp_path), keep=2)
+    generation = None
+    for i in range(4):
+        generation = publish(snapshots, generation, {"index.faiss": str(i)})
+    assert snapshots.generations() == [3, 4]
+
+
+def test_sweep_removes_entries_of_dead_processes_only(tmp_path):
+    snapshots = IndexSnapshots(str(tmp_path))
+    pid = dead_pid()
+    (tmp_path / f".staging-{pid}-abc").mkdir()
+    (tmp_path / f".working-{pid}-abc.sqlite").write_text("")
+    (tmp_path / f".working-{pid}-abc.sqlite-journal").write_text("")
+    own = snapshots.private_path("working", ".sqlite")
+    open(own, "w").close()
+
+    assert snapshots.sweep() == 3
+    assert os.listdir(tmp_path) == [os.path.basename(own)]
+
+
+def test_writer_lock_is_exclusive(tmp_path):
+    first = WriterLock(str(tmp_path / "writer.lock"))
+    second = WriterLock(str(tmp_path / "writer.lock"))
+    assert first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
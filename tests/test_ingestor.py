@@ -0,0 +1,77 @@
+import json
+import os
+
+import pytest
+
+from config import Config
+from components.vector_store_io import OVERLAY_FILE, open_docstore
+from providers.ingestor import Ingestor
+
+
+@pytest.fixture
+def test_config(tmp_path):
+    class TestConfig(Config):
+        DATA_DIRECTORY = str(tmp_path / "data")
+        INDEX_ROOT = str(tmp_path / "index")
+        VECTOR_DB_PATH = str(tmp_path / "faiss_index")
+        BM25_INDEX_PATH = str(tmp_path / "bm25_index")
+        INGEST_MANIFEST_PATH = str(tmp_path / "ingest_manifest.json")
+        INGESTION_LOADER_WORKERS = 1
+
+    (tmp_path / "data").mkdir()
+    return TestConfig
+
+
+def manifest_paths(config):
+    with open(config.INGEST_MANIFEST_PATH, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {os.path.basename(path) for path in data["files"]}
+
+
+def test_files_that_fail_to_load_are_retried(test_config, embeddings, tmp_path):
+    data = tmp_path / "data"
+    (data / "good.txt").write_text("alpha beta gamma", encoding="utf-8")
+    (data / "bad.txt").write_bytes(b"\xff\xfe not utf-8 \xff")
+
+    Ingestor(test_config, embeddings).run()
+    assert manifest_paths(test_config) == {"good.txt"}
+
+    (data / "bad.txt").write_text("delta epsilon", encoding="utf-8")
+    Ingestor(test_config, embeddings).run()
+    assert manifest_paths(test_config) == {"good.txt", "bad.txt"}
+
+
+def test_modified_file_that_fails_to_load_is_retried(test_config, embeddings, tmp_path):
+    path = tmp_path / "data" / "doc.txt"
+    path.write_text("alpha beta gamma", encoding="utf-8")
+    Ingestor(test_config, embeddings).run()
+
+    path.write_bytes(b"\xff\xfe not utf-8 \xff and longer")
+    Ingestor(test_config, embeddings).run()
+    assert manifest_paths(test_config) == set()
+
+    path.write_text("delta epsilon", encoding="utf-8")
+    store = Ingestor(test_config, embeddings).run()
+    assert manifest_paths(test_config) == {"doc.txt"}
+    assert [doc.page_content for doc in store.similarity_search("delta epsilon", k=1)] == ["delta epsilon"]
+
+
+def test_full_rebuild_fallback_drops_the_staged_overlay(test_config, embeddings, tmp_path):
+    test_config.FAISS_INDEX_TYPE = "hnsw"
+    data = tmp_path / "data"
+    (data / "a.txt").write_text("alpha beta", encoding="utf-8")
+    Ingestor(test_config, embeddings).run()
+    # An incremental run without removals publishes a docstore overlay
+    (data / "b.txt").write_text("gamma delta", encoding="utf-8")
+    Ingestor(test_config, embeddings).run()
+
+    # HNSW cannot remove the chunks of the modified file
+    (data / "a.txt").write_text("epsilon zeta", encoding="utf-8")
+    ingestor = Ingestor(test_config, embeddings)
+    ingestor.run()
+
+    snapshots = ingestor.get_snapshots()
+    vector_path = snapshots.vector_path(snapshots.path(snapshots.current()))
+    assert not os.path.exists(os.path.join(vector_path, OVERLAY_FILE))
+    docstore = open_docstore(vector_path, read_only=True)
+    assert sorted(doc.page_content for _, doc in docstore.iter_documents()) == ["epsilon zeta", "gamma delta"]
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import time
+from typing import List
+
+from langchain_community.docstore.document import Document
+from langchain_core.retrievers import BaseRetriever
+
+from components.reranker import CrossEncoderReranker
+
+
+class StaticRetriever(BaseRetriever):
+    docs: List[Document]
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return list(self.docs)
+
+
+class LengthModel:
+    """Scores longer chunks higher; optionally slow."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def predict(self, pairs, batch_size=None, show_progress_bar=False):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return [len(text) for _, text in pairs]
+
+
+DOCS = [Document(page_content=text) for text in ("b", "ccc", "a", "dd")]
+
+
+def make(model, **kwargs):
+    return CrossEncoderReranker(retriever=StaticRetriever(docs=DOCS), model=model, top_n=2, **kwargs)
+
+
+def test_reranks_and_keeps_top_n():
+    reranker = make(LengthModel())
+    assert [doc.page_content for doc in reranker.invoke("q")] == ["ccc", "dd"]
+    assert [[doc.page_content for doc in docs] for docs in reranker.retrieve_batch(["q", "r"])] == [["ccc", "dd"]] * 2
+
+
+def test_async_timeout_falls_back_to_first_stage_order():
+    reranker = make(LengthModel(delay=0.2), max_latency=0.05)
+    docs = asyncio.run(reranker.ainvoke("q"))
+    assert [doc.page_content for doc in docs] == ["b", "ccc"]
+
+
+def test_pass_starting_after_its_deadline_is_skipped():
+    model = LengthModel()
+    reranker = make(model, max_latency=0.05)
+    assert reranker._rerank_until("q", DOCS, deadline=time.monotonic() - 1) is None
+    assert model.calls == 0
+    assert reranker._rerank_until("q", DOCS, deadline=time.monotonic() + 1) is not None
+    assert model.calls == 1
+
+
+def test_reranked_documents_carry_the_cross_encoder_score():
+    docs = make(LengthModel()).invoke("q")
+    assert [doc.metadata["score"] for doc in docs] == [3.0, 2.0]
+    assert all("score" not in doc.metadata for doc in DOCS)
@@ -0,0 +1,85 @@
+import asyncio
+from typing import List
+
+from langchain_community.docstore.document import Document
+from langchain_core.retrievers import BaseRetriever
+
+from components.lru_cache import LRUCache
+from components.retrieval_cache import CachedRetriever, documents_size
+
+
+class CountingRetriever(BaseRetriever):
+    calls: List[str] = []
+    on_call: object = None
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        self.calls.append(query)
+        if self.on_call is not None:
+            self.on_call()
+        return [Document(page_content=f"result for {query}")]
+
+    def retrieve_batch(self, queries):
+        return [self._get_relevant_documents(query, run_manager=None) for query in queries]
+
+
+class Generation:
+    def __init__(self, value=1):
+        self.value = value
+
+    def __call__(self):
+        return self.value
+
+
+def make(generation, **kwargs):
+    inner = CountingRetriever(calls=[], **kwargs)
+    cache = LRUCache(max_entries=100, max_bytes=1 << 20, sizeof=documents_size)
+    return CachedRetriever(retriever=inner, cache=cache, generation=generation), inner
+
+
+def test_repeated_queries_are_served_from_cache():
+    retriever, inner = make(Generation())
+    retriever.invoke("Hello  World")
+    retriever.invoke("hello world")
+    asyncio.run(retriever.ainvoke("HELLO world"))
+    assert inner.calls == ["Hello  World"]
+
+
+def test_new_generation_misses():
+    generation = Generation()
+    retriever, inner = make(generation)
+    retriever.invoke("q")
+    generation.value = 2
+    retriever.invoke("q")
+    assert len(inner.calls) == 2
+
+
+def test_result_is_not_stored_if_generation_moved_during_retrieval():
+    generation = Generation()
+    retriever, inner = make(generation)
+
+    def ingest():
+        generation.value += 1
+
+    inner.on_call = ingest
+    retriever.invoke("q")
+    inner.on_call = None
+    retriever.invoke("q")
+    assert len(inner.calls) == 2
+    assert len(retriever.cache) == 1
+
+
+def test_replaced_retriever_bypasses_cache():
+    retriever, inner = make(lambda: None)
+    retriever.invoke("q")
+    retriever.invoke("q")
+    assert retriever.retrieve_batch(["q", "q"])[0][0].page_content == "result for q"
+    assert inner.calls == ["q", "q", "q"]
+    assert len(retriever.cache) == 0
+
+
+def test_retrieve_batch_uses_cache_and_dedupes():
+    retriever, inner = make(Generation())
+    retriever.invoke("a")
+    results = retriever.retrieve_batch(["a", "b", "B "])
+    assert [docs[0].page_content for docs in results] == ["result for a", "result for b", "result for b"]
+    assert inner.calls == ["a", "b"]
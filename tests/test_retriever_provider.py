@@ -0,0 +1,180 @@
+import os
+
+import faiss
+import pytest
+from langchain_community.docstore.document import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from config import Config
+from components.bm25_index import IncrementalBM25Index
+from components.index_snapshots import IndexSnapshots
+from components.sqlite_docstore import SQLiteDocstore
+from components.vector_store_io import (
+    DOCSTORE_FILE,
+    OVERLAY_FILE,
+    detach_docstore,
+    fetch_documents,
+    load_vector_store,
+    open_docstore,
+    save_vector_store,
+)
+from providers.retriever_provider import RetrieverProvider
+
+
+TEXTS = ["alpha beta", "gamma delta", "epsilon zeta"]
+
+
+@pytest.fixture
+def test_config(tmp_path, embeddings):
+    class TestConfig(Config):
+        INDEX_ROOT = str(tmp_path / "index")
+        VECTOR_DB_PATH = str(tmp_path / "faiss_index")
+        BM25_INDEX_PATH = str(tmp_path / "bm25_index")
+        PERSIST_DEBOUNCE_SECONDS = 60.0
+        PERSIST_MAX_DELAY_SECONDS = 60.0
+        QUERY_EMBEDDING_CACHE_ENABLED = False
+
+    store = FAISS(
+        embedding_function=embeddings,
+        index=faiss.IndexFlatL2(embeddings.dim),
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+    )
+    store.add_texts(TEXTS, ids=["a", "b", "c"])
+    snapshots = IndexSnapshots(TestConfig.INDEX_ROOT)
+    staging_path = snapshots.stage()
+    save_vector_store(store, snapshots.vector_path(staging_path))
+    snapshots.publish(staging_path, None)
+    return TestConfig
+
+
+@pytest.fixture
+def provider(test_config, embeddings):
+    provider = RetrieverProvider(test_config, embeddings)
+    provider.get_bm25_index(provider.get_vector_store())
+    yield provider
+    provider._writer.cancel()
+
+
+def test_uploads_are_published_as_a_new_generation(provider):
+    generation = provider.snapshot_generation
+    ids = provider.add_chunks([Document(page_content="eta theta")])
+    provider.flush()
+
+    assert not provider._writer.dirty
+    assert provider._pending_bm25 == []
+    assert provider.snapshots.current() == generation + 1
+
+    reloaded = RetrieverProvider(provider.config, provider.embeddings)
+    assert ids[0] in reloaded.get_bm25_index(reloaded.get_vector_store())
+    assert reloaded.get_vector_store().docstore.search(ids[0]).page_content == "eta theta"
+
+
+def test_failed_publish_keeps_uploads_pending(provider, monkeypatch):
+    generation = provider.snapshot_generation
+    ids = provider.add_chunks([Document(page_content="eta theta")])
+
+    publish = provider.snapshots.publish
+    monkeypatch.setattr(provider.snapshots, "publish", lambda *args: (_ for _ in ()).throw(OSError("disk full")))
+    provider.flush()
+
+    assert provider._writer.dirty
+    assert isinstance(provider._writer.last_error, OSError)
+    assert provider._pending_bm25 == ids
+    assert provider.snapshots.current() == generation
+
+    monkeypatch.setattr(provider.snapshots, "publish", publish)
+    provider.flush()
+
+    assert not provider._writer.dirty
+    assert provider._writer.last_error is None
+    assert provider._pending_bm25 == []
+    reloaded = RetrieverProvider(provider.config, provider.embeddings)
+    assert ids[0] in reloaded.get_bm25_index(reloaded.get_vector_store())
+
+
+def test_saves_link_the_base_docstore_and_copy_the_overlay(provider):
+    first = provider.snapshot_generation
+    provider.add_chunks([Document(page_content="eta theta")])
+    working_path = provider._working_docstore_path
+    provider.flush()
+    provider.add_chunks([Document(page_content="iota kappa")])
+    provider.flush()
+
+    paths = [
+        provider.snapshots.vector_path(provider.snapshots.path(generation))
+        for generation in (first, provider.snapshot_generation)
+    ]
+    assert os.path.samefile(os.path.join(paths[0], DOCSTORE_FILE), os.path.join(paths[1], DOCSTORE_FILE))
+    assert len(SQLiteDocstore(os.path.join(paths[0], DOCSTORE_FILE), read_only=True)) == 3
+    assert len(open_docstore(paths[1], read_only=True)) == 5
+
+    # Searches read the published generation; the working overlay is gone
+    assert provider._working_docstore_path is None and not os.path.exists(working_path)
+    assert provider.get_vector_store().docstore.base_path == os.path.join(paths[1], DOCSTORE_FILE)
+
+
+def test_large_overlays_are_folded_into_a_new_base(provider):
+    provider.config.DOCSTORE_OVERLAY_MAX_CHUNKS = 1
+    provider.add_chunks([Document(page_content="eta theta"), Document(page_content="iota kappa")])
+    provider.flush()
+
+    path = provider.snapshots.vector_path(provider._snapshot_path())
+    assert not os.path.exists(os.path.join(path, OVERLAY_FILE))
+    assert len(open_docstore(path, read_only=True)) == 5
+
+
+def test_refresh_reuses_the_bm25_base_but_reloads_faiss(provider, capsys):
+    reader = RetrieverProvider(provider.config, provider.embeddings)
+    index = reader.get_vector_store().index
+    reader.get_bm25_index(reader.get_vector_store())
+
+    ids = provider.add_chunks([Document(page_content="eta theta")])
+    provider.flush()
+    capsys.readouterr()
+
+    assert reader.refresh()
+    assert "reused: BM25 base segment)" in capsys.readouterr().out
+    assert reader.get_vector_store().index is not index
+    assert ids[0] in reader.get_bm25_index(reader.get_vector_store())
+    assert reader.get_vector_store().docstore.search(ids[0]).page_content == "eta theta"
+
+
+def test_uploads_are_rebased_onto_a_generation_published_meanwhile(provider, embeddings):
+    retriever = provider.get_retriever()
+    ids = provider.add_chunks([Document(page_content="eta theta")])
+
+    # Another process publishes on top of the same generation
+    other = IndexSnapshots(provider.config.INDEX_ROOT)
+    staging_path = other.stage(other.current())
+    vector_path = other.vector_path(staging_path)
+    store = load_vector_store(vector_path, embeddings, provider.config, read_only=False)
+    detach_docstore(store, vector_path)
+    store.add_texts(["iota kappa"], ids=["d"])
+    save_vector_store(store, vector_path)
+    bm25 = IncrementalBM25Index.load(other.bm25_path(staging_path))
+    bm25.add_documents([Document(page_content="iota kappa")], ["d"])
+    bm25.append_delta(other.bm25_path(staging_path), ["d"])
+    theirs = other.publish(staging_path, other.current())
+
+    provider.flush()
+
+    assert not provider._writer.dirty
+    assert provider.snapshot_generation == theirs + 1
+    reloaded = RetrieverProvider(provider.config, provider.embeddings)
+    vector_store = reloaded.get_vector_store()
+    assert {doc.id for doc in fetch_documents(vector_store, [ids[0], "d"])} == {ids[0], "d"}
+    assert ids[0] in reloaded.get_bm25_index(vector_store) and "d" in reloaded.get_bm25_index(vector_store)
+
+    # Retrievers built before the rebase search the rebased indexes
+    assert "iota kappa" in [doc.page_content for doc in retriever.invoke("iota kappa")]
+
+
+def test_cache_stats_report_enabled_caches_only(provider):
+    stats = provider.cache_stats()
+
+    # The test config disables the query embedding cache
+    assert stats["query_embeddings"] is None
+    assert stats["retrieval"] == provider.retrieval_cache.stats()
+    assert stats["retrieval"]["hits"] == 0
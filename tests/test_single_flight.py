@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from components.single_flight import SingleFlight
+
+
+def test_concurrent_runs_share_one_call():
+    async def scenario():
+        flights = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flights.run("key", work) for _ in range(5)))
+        return results, calls, flights
+
+    results, calls, flights = asyncio.run(scenario())
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert (flights.started, flights.coalesced, flights.in_flight) == (1, 4, 0)
+
+
+def test_finished_work_is_not_reused():
+    async def scenario():
+        flights = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            return len(calls)
+
+        return [await flights.run("key", work) for _ in range(2)]
+
+    assert asyncio.run(scenario()) == [1, 2]
+
+
+def test_errors_reach_every_caller():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        return await asyncio.gather(*(flights.run("key", work) for _ in range(2)), return_exceptions=True)
+
+    assert [type(result) for result in asyncio.run(scenario())] == [ValueError, ValueError]
+
+
+def test_cancelled_caller_does_not_cancel_the_work():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.02)
+            return "result"
+
+        leaving = asyncio.create_task(flights.run("key", work))
+        staying = asyncio.create_task(flights.run("key", work))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        return await staying
+
+    assert asyncio.run(scenario()) == "result"
+
+
+async def count_up(produced, n=3):
+    for i in range(n):
+        produced.append(i)
+        yield i
+        await asyncio.sleep(0.01)
+
+
+def test_late_stream_subscriber_replays_earlier_events():
+    async def scenario():
+        flights = SingleFlight()
+        produced = []
+
+        async def collect(delay):
+            await asyncio.sleep(delay)
+            return [event async for event in flights.stream("key", lambda: count_up(produced))]
+
+        results = await asyncio.gather(collect(0), collect(0.015))
+        return results, produced
+
+    results, produced = asyncio.run(scenario())
+    assert results == [[0, 1, 2], [0, 1, 2]]
+    assert produced == [0, 1, 2]
+
+
+def test_stream_without_subscribers_is_cancelled():
+    async def scenario():
+        flights = SingleFlight()
+        produced = []
+        stream = flights.stream("key", lambda: count_up(produced, n=100))
+        assert await stream.__anext__() == 0
+        await stream.aclose()
+        await asyncio.sleep(0.03)
+        return produced, flights
+
+    produced, flights = asyncio.run(scenario())
+    assert len(produced) < 100
+    assert flights.in_flight == 0
+
+
+def test_stream_errors_reach_subscribers():
+    async def failing():
+        yield 1
+        raise ValueError("boom")
+
+    async def scenario():
+        flights = SingleFlight()
+        events = []
+        with pytest.raises(ValueError):
+            async for event in flights.stream("key", failing):
+                events.append(event)
+        return events
+
+    assert asyncio.run(scenario()) == [1]
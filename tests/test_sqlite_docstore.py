@@ -0,0 +1,64 @@
+import pytest
+from langchain_community.docstore.document import Document
+
+from components.sqlite_docstore import SQLiteDocstore
+
+
+def make_base(path):
+    docstore = SQLiteDocstore(str(path))
+    docstore.add({doc_id: Document(page_content=f"text {doc_id}", metadata={"n": i}) for i, doc_id in enumerate("abc")})
+    return docstore
+
+
+def test_overlay_reads_through_to_its_base(tmp_path):
+    base = make_base(tmp_path / "base.sqlite")
+    overlay = base.branch(str(tmp_path / "overlay.sqlite"))
+
+    overlay.add({"d": Document(page_content="text d")})
+    overlay.delete(["b"])
+
+    assert [doc_id for doc_id, _ in overlay.iter_documents(batch_size=2)] == ["a", "c", "d"]
+    assert [doc and doc.id for doc in overlay.mget(["d", "b", "a"])] == ["d", None, "a"]
+    assert overlay.search("a").metadata == {"n": 0}
+    assert len(overlay) == 3
+    assert overlay.overlay_size == 2
+
+    # The base file is never written
+    assert len(base) == 3 and base.search("d") == "ID d not found."
+
+
+def test_overlay_rejects_ids_of_its_base(tmp_path):
+    overlay = make_base(tmp_path / "base.sqlite").branch(str(tmp_path / "overlay.sqlite"))
+    with pytest.raises(ValueError):
+        overlay.add({"a": Document(page_content="again")})
+
+    # A removed base chunk can be added back
+    overlay.delete(["a"])
+    overlay.add({"a": Document(page_content="again")})
+    assert overlay.search("a").page_content == "again"
+    assert len(overlay) == 3
+
+
+def test_branch_of_an_overlay_copies_only_the_overlay(tmp_path):
+    overlay = make_base(tmp_path / "base.sqlite").branch(str(tmp_path / "overlay.sqlite"))
+    overlay.add({"d": Document(page_content="text d")})
+
+    branched = overlay.branch(str(tmp_path / "branched.sqlite"))
+    branched.add({"e": Document(page_content="text e")})
+
+    assert branched.base_path == overlay.base_path
+    assert [doc_id for doc_id, _ in branched.iter_documents()] == ["a", "b", "c", "d", "e"]
+    assert overlay.search("e") == "ID e not found."
+
+    read_only = SQLiteDocstore(branched.path, read_only=True, base_path=branched.base_path)
+    assert read_only.search("e").page_content == "text e"
+
+
+def test_flatten_applies_the_overlay(tmp_path):
+    overlay = make_base(tmp_path / "base.sqlite").branch(str(tmp_path / "overlay.sqlite"))
+    overlay.add({"d": Document(page_content="text d")})
+    overlay.delete(["a"])
+
+    flat = overlay.flatten_to(str(tmp_path / "flat.sqlite"))
+    assert flat.base_path is None
+    assert [doc_id for doc_id, _ in flat.iter_documents()] == ["b", "c", "d"]
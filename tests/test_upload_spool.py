@@ -0,0 +1,104 @@
+import asyncio
+import os
+
+import pytest
+
+from config import Config
+from providers.ingestion_queue import IngestionQueue
+from providers.upload_spool import UploadSpool
+
+
+@pytest.fixture
+def spool(tmp_path):
+    class TestConfig(Config):
+        UPLOAD_SPOOL_DIRECTORY = str(tmp_path / "spool")
+        UPLOAD_SPOOL_POLL_SECONDS = 0.01
+        INGEST_QUEUE_WINDOW_SECONDS = 0.0
+        INGEST_QUEUE_MAX_PENDING = 3
+
+    return UploadSpool(TestConfig)
+
+
+def text_exists(spool, job):
+    return os.path.exists(os.path.join(spool.directory, f"{job.job_id}.txt"))
+
+
+def test_claim_returns_pending_uploads_oldest_first(spool):
+    first = spool.submit("one", "a.txt")
+    second = spool.submit("two", "b.txt")
+    os.utime(os.path.join(spool.directory, f"{first.job_id}.txt"), (1, 1))
+
+    claimed = spool.claim(set(), 10)
+    assert [(job.job_id, text) for job, text in claimed] == [(first.job_id, "one"), (second.job_id, "two")]
+    assert [job.job_id for job, _ in spool.claim({first.job_id}, 10)] == [second.job_id]
+    assert spool.get_job(second.job_id).filename == "b.txt"
+
+
+def test_submit_rejects_beyond_max_pending(spool):
+    for i in range(3):
+        spool.submit(str(i), f"{i}.txt")
+    with pytest.raises(asyncio.QueueFull):
+        spool.submit("3", "3.txt")
+
+
+def test_ingested_text_is_kept_until_released(spool):
+    done, failed = spool.submit("one", "a.txt"), spool.submit("two", "b.txt")
+    for job, status in ((done, "done"), (failed, "failed")):
+        job.status, job.finished_at = status, 1.0
+        spool.update(job)
+
+    assert text_exists(spool, done) and not text_exists(spool, failed)
+    spool.release([done.job_id])
+    assert not text_exists(spool, done)
+    assert spool.get_job(done.job_id).status == "done"
+
+
+class FakeRAGSystem:
+    """Ingests into nothing; publishes only when flushed."""
+
+    def __init__(self):
+        self.index_generation = 0
+        self.published_generation = 0
+
+    async def add_documents_from_texts(self, items):
+        self.index_generation += 1
+        return [1 for _ in items]
+
+    def flush_index(self):
+        self.published_generation = self.index_generation
+
+
+def test_queue_releases_spooled_text_after_publish(spool):
+    async def scenario():
+        rag_system = FakeRAGSystem()
+        queue = IngestionQueue(spool.config, rag_system, spool=spool)
+        job = spool.submit("one", "a.txt")
+        queue.start()
+        while spool.get_job(job.job_id).status != "done":
+            await asyncio.sleep(0.01)
+
+        # Ingested but not published: kept, and not claimed again
+        await asyncio.sleep(0.05)
+        assert text_exists(spool, job)
+        assert rag_system.index_generation == 1
+
+        rag_system.flush_index()
+        while text_exists(spool, job):
+            await asyncio.sleep(0.01)
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+
+def test_stopping_the_queue_publishes_and_releases(spool):
+    async def scenario():
+        queue = IngestionQueue(spool.config, FakeRAGSystem(), spool=spool)
+        job = spool.submit("one", "a.txt")
+        queue.start()
+        while spool.get_job(job.job_id).status != "done":
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        return job
+
+    job = asyncio.run(scenario())
+    assert not text_exists(spool, job)
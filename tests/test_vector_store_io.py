@@ -0,0 +1,74 @@
+import os
+
+import faiss
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from config import Config
+from components.sqlite_docstore import SQLiteDocstore
+from components.vector_store_io import (
+    DOCSTORE_FILE,
+    OVERLAY_FILE,
+    RowIdMap,
+    detach_docstore,
+    fetch_documents,
+    is_read_only,
+    load_vector_store,
+    save_vector_store,
+)
+
+
+TEXTS = ["alpha beta", "gamma delta", "epsilon zeta"]
+
+
+@pytest.fixture
+def saved_store(tmp_path, embeddings):
+    store = FAISS(
+        embedding_function=embeddings,
+        index=faiss.IndexFlatL2(embeddings.dim),
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+    )
+    store.add_texts(TEXTS, ids=["a", "b", "c"])
+    path = str(tmp_path / "faiss_index")
+    save_vector_store(store, path)
+    return path
+
+
+def test_memory_load_is_writable(saved_store, embeddings):
+    store = load_vector_store(saved_store, embeddings, Config, read_only=False)
+    assert not is_read_only(store)
+    assert isinstance(store.docstore, SQLiteDocstore)
+    store.add_texts(["eta theta"], ids=["d"])
+    assert [doc.page_content for doc in fetch_documents(store, ["d", "a"])] == ["eta theta", "alpha beta"]
+
+
+def test_mmap_load_is_read_only_and_searchable(saved_store, embeddings):
+    store = load_vector_store(saved_store, embeddings, Config, read_only=True)
+    assert is_read_only(store)
+    assert isinstance(store.index_to_docstore_id, RowIdMap)
+    assert [store.index_to_docstore_id[row] for row in range(3)] == ["a", "b", "c"]
+
+    docs = store.similarity_search("gamma delta", k=1)
+    assert docs[0].page_content == "gamma delta"
+    with pytest.raises(Exception):
+        store.docstore.add({"x": docs[0]})
+
+
+def test_detached_store_leaves_the_linked_base_untouched(saved_store, tmp_path, embeddings):
+    staged = tmp_path / "staged"
+    staged.mkdir()
+    for name in os.listdir(saved_store):
+        os.link(os.path.join(saved_store, name), staged / name)
+
+    store = load_vector_store(str(staged), embeddings, Config, read_only=False)
+    detach_docstore(store, str(staged))
+    store.delete(["a"])
+    store.add_texts(["eta theta"], ids=["d"])
+    save_vector_store(store, str(staged))
+
+    assert os.path.exists(staged / OVERLAY_FILE)
+    assert len(SQLiteDocstore(os.path.join(saved_store, DOCSTORE_FILE), read_only=True)) == 3
+    reloaded = load_vector_store(str(staged), embeddings, Config, read_only=True)
+    assert [doc.id for doc in fetch_documents(reloaded, ["a", "b", "d"])] == ["b", "d"]